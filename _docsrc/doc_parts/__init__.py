@@ -65,7 +65,7 @@ def split_examples():
     parsed = []
     for pid in EXAMPLE_PIDS:
         ppid = rslv.lib_rslv.split_identifier_string(pid)
-        parsed.append(ppid)
+        parsed.append(ppid.as_dict())
     for p in parsed:
         for k,v in p.items():
             if v is None:
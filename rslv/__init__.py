@@ -1,3 +1,9 @@
-from importlib.metadata import version
+def __getattr__(name):
+    # The package version is looked up on first use since importlib.metadata
+    # adds noticeably to the import time of the CLI.
+    if name == "__version__":
+        from importlib.metadata import version
 
-__version__ = version("rslv")
+        globals()["__version__"] = version("rslv")
+        return globals()["__version__"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,15 +2,15 @@
 Script for basic management of the pid configuration sqlite instance.
 """
 
+import contextlib
 import json
 import logging
 import logging.config
 import sys
 import click
-import sqlalchemy
 
-import rslv.lib_rslv.piddefine
-import rslv.config
+# Note: rslv.config, sqlalchemy, and the ORM model are imported within
+# the commands that use them to keep CLI start up fast.
 
 logging_config = {
     "version": 1,
@@ -55,6 +55,17 @@ def get_logger():
     return logging.getLogger("rslv")
 
 
+def get_engine(ctx):
+    """Return the engine for the configured database, created on first use."""
+    if ctx.obj.get("engine") is None:
+        import sqlalchemy
+
+        ctx.obj["engine"] = sqlalchemy.create_engine(
+            ctx.obj["settings"].db_connection_string, pool_pre_ping=True
+        )
+    return ctx.obj["engine"]
+
+
 @click.group()
 @click.pass_context
 @click.option("-V", "--verbosity", default="ERROR", help="Logging level")
@@ -62,11 +73,15 @@ def main(ctx, verbosity):
     verbosity = verbosity.upper()
     logging_config["loggers"][""]["level"] = verbosity
     logging.config.dictConfig(logging_config)
-    settings = rslv.config.load_settings()
+    import rslv.config
+
     ctx.ensure_object(dict)
-    ctx.obj["engine"] = sqlalchemy.create_engine(
-        settings.db_connection_string, pool_pre_ping=True
-    )
+    ctx.obj["settings"] = rslv.config.load_settings()
+    ctx.obj["engine"] = None
+    if ctx.obj["settings"].scheme_splitters:
+        import rslv.lib_rslv.splitters
+
+        rslv.lib_rslv.splitters.set_scheme_splitters(ctx.obj["settings"].scheme_splitters)
     return 0
 
 
@@ -78,14 +93,61 @@ def initialize_configuration(ctx, description):
 
     The provided description is included in the metadata for the database.
     """
-    rslv.lib_rslv.piddefine.create_database(ctx.obj["engine"], description)
+    import rslv.lib_rslv.piddefine
+
+    rslv.lib_rslv.piddefine.create_database(get_engine(ctx), description)
+
+
+@main.command("migrate")
+@click.pass_context
+@click.option("-n", "--dry-run", is_flag=True, help="List pending migrations without applying them")
+def migrate_database(ctx, dry_run):
+    """Upgrade an existing configuration database to the current schema."""
+    import rslv.lib_rslv.migrations
+
+    if dry_run:
+        names = rslv.lib_rslv.migrations.pending(get_engine(ctx))
+    else:
+        names = rslv.lib_rslv.migrations.migrate(get_engine(ctx))
+    print(json.dumps(names, indent=2))
+
+
+@main.command("rebuild")
+@click.pass_context
+@click.option("-s", "--source", default=None, help="Connection string of database to load from, default is the configured database")
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(["file", "table"]),
+    default=None,
+    help="Swap a rebuilt SQLite file or a rebuilt table. Default is file for SQLite files.",
+)
+def rebuild_database(ctx, source, method):
+    """Rebuild the definitions alongside the configured database and swap them in.
+
+    Lookups continue against the existing definitions until the rebuilt
+    copy replaces them. Send SIGHUP to `rslv serve` afterwards to reload
+    its index.
+    """
+    import sqlalchemy
+    import rslv.lib_rslv.migrations
+
+    source_engine = None
+    if source is not None:
+        source_engine = sqlalchemy.create_engine(source)
+    result = rslv.lib_rslv.migrations.rebuild(
+        get_engine(ctx), source_engine=source_engine, method=method
+    )
+    print(json.dumps(result, indent=2))
 
 
 @main.command("schemes")
 @click.pass_context
 def list_schemes(ctx):
     """List the schemes registered in the database."""
-    session = rslv.lib_rslv.piddefine.get_session(ctx.obj["engine"])
+    import rslv.lib_rslv.piddefine
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
     try:
         definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
         schemes = definitions.list_schemes()
@@ -100,7 +162,9 @@ def list_schemes(ctx):
 @click.argument("scheme")
 def list_prefixes(ctx, scheme):
     """List the prefixes for the specified scheme."""
-    session = rslv.lib_rslv.piddefine.get_session(ctx.obj["engine"])
+    import rslv.lib_rslv.piddefine
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
     try:
         definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
         prefixes = definitions.list_prefixes(scheme)
@@ -116,7 +180,9 @@ def list_prefixes(ctx, scheme):
 @click.argument("prefix")
 def list_value(ctx, scheme, prefix):
     """List the values of the specified scheme, prefix combination."""
-    session = rslv.lib_rslv.piddefine.get_session(ctx.obj["engine"])
+    import rslv.lib_rslv.piddefine
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
     try:
         definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
         prefixes = definitions.list_values(scheme, prefix)
@@ -126,6 +192,158 @@ def list_value(ctx, scheme, prefix):
         session.close()
 
 
+@main.command("dump")
+@click.pass_context
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Output file, default is stdout")
+def dump_definitions(ctx, output):
+    """Write all definitions as JSON lines in uniq order, for "rslv load"."""
+    import rslv.lib_rslv.piddefine
+
+    with rslv.lib_rslv.piddefine.get_catalog(get_engine(ctx)) as catalog:
+        for entry in catalog.iter_definitions():
+            output.write(json.dumps(entry.as_dict(), ensure_ascii=False))
+            output.write("\n")
+
+
+@main.command("load")
+@click.pass_context
+@click.argument("source", type=click.File("r"))
+@click.option("-b", "--batch-size", type=int, default=1000, show_default=True, help="Definitions per transaction")
+def load_definitions(ctx, source, batch_size):
+    """Add or update the definitions of a dump written by "rslv dump".
+
+    Existing definitions with a newer revision property are not replaced.
+    Each batch is a transaction: lines that can not be read and batches
+    that fail are reported with their line numbers, the remaining batches
+    are loaded, and the exit status is 1 if a batch failed.
+    """
+    import sqlalchemy.exc
+
+    import rslv.lib_rslv.piddefine
+
+    result = {"added": 0, "updated": 0, "unchanged": 0, "errors": []}
+    failed_batches = 0
+
+    def tally(results):
+        for res in results:
+            if "error" in res:
+                result["errors"].append({"uniq": res["uniq"], "error": res["error"]})
+            elif res["n_changes"] < 0:
+                result["added"] += 1
+            elif res["n_changes"] > 0:
+                result["updated"] += 1
+            else:
+                result["unchanged"] += 1
+
+    with rslv.lib_rslv.piddefine.get_catalog(get_engine(ctx)) as catalog:
+
+        def flush(batch, lines):
+            nonlocal failed_batches
+            if len(batch) == 0:
+                return
+            try:
+                tally(catalog.upsert_many(batch))
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                failed_batches += 1
+                result["errors"].append({
+                    "lines": [lines[0], lines[-1]],
+                    "uniq": [batch[0].uniq, batch[-1].uniq],
+                    "error": str(e).splitlines()[0],
+                })
+
+        batch = []
+        lines = []
+        for lineno, line in enumerate(source, start=1):
+            if line.strip() == "":
+                continue
+            data = None
+            try:
+                data = json.loads(line)
+                batch.append(rslv.lib_rslv.piddefine.PidDefinition.from_dict(data))
+            except (ValueError, TypeError, AttributeError) as e:
+                uniq = data.get("uniq") if isinstance(data, dict) else None
+                result["errors"].append({"line": lineno, "uniq": uniq, "error": str(e)})
+                continue
+            lines.append(lineno)
+            if len(batch) >= batch_size:
+                flush(batch, lines)
+                batch = []
+                lines = []
+        flush(batch, lines)
+    print(json.dumps(result, indent=2))
+    if failed_batches > 0:
+        ctx.exit(1)
+
+
+@contextlib.contextmanager
+def read_definitions(source: str):
+    """Definition records in uniq order from a database connection string or a dump file."""
+    import rslv.lib_rslv.catalogsync
+    import rslv.lib_rslv.piddefine
+
+    if "://" in source:
+        import sqlalchemy
+
+        engine = sqlalchemy.create_engine(source)
+        try:
+            with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+                yield rslv.lib_rslv.catalogsync.read_catalog(catalog)
+        finally:
+            engine.dispose()
+    else:
+        with open(source, "r") as f:
+            yield rslv.lib_rslv.catalogsync.read_dump(f)
+
+
+@main.command("diff")
+@click.pass_context
+@click.argument("source")
+def diff_definitions(ctx, source):
+    """List the changes that would make the configured database the same as SOURCE.
+
+    SOURCE is a database connection string or a dump written by "rslv dump".
+    Changes are written as JSON lines and the counts by kind to stderr.
+    """
+    import collections
+    import rslv.lib_rslv.catalogsync
+    import rslv.lib_rslv.piddefine
+
+    counts = collections.Counter()
+    with read_definitions(source) as records:
+        with rslv.lib_rslv.piddefine.get_catalog(get_engine(ctx)) as catalog:
+            target = rslv.lib_rslv.catalogsync.read_catalog(catalog)
+            for change in rslv.lib_rslv.catalogsync.diff(records, target):
+                counts[change.kind] += 1
+                print(json.dumps(change.as_dict()))
+    print(json.dumps(counts), file=sys.stderr)
+
+
+@main.command("sync")
+@click.pass_context
+@click.argument("source")
+@click.option("-b", "--batch-size", type=int, default=500, show_default=True, help="Changes per transaction")
+@click.option("-k", "--keep", is_flag=True, help="Keep definitions that are not in SOURCE")
+def sync_definitions(ctx, source, batch_size, keep):
+    """Apply the changes that make the configured database the same as SOURCE.
+
+    SOURCE is a database connection string or a dump written by "rslv dump".
+    Definitions with a newer revision property in the database are kept.
+    """
+    import rslv.lib_rslv.catalogsync
+    import rslv.lib_rslv.piddefine
+
+    engine = get_engine(ctx)
+    with read_definitions(source) as records:
+        with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+            target = rslv.lib_rslv.catalogsync.read_catalog(catalog)
+            changes = list(rslv.lib_rslv.catalogsync.diff(records, target))
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        counts = rslv.lib_rslv.catalogsync.sync(
+            catalog, changes, batch_size=batch_size, delete=not keep
+        )
+    print(json.dumps(counts, indent=2))
+
+
 @main.command("add")
 @click.pass_context
 @click.option("-s", "--scheme", help="Scheme value for entry")
@@ -151,13 +369,34 @@ def list_value(ctx, scheme, prefix):
 @click.option(
     "-y", "--synonym", default=None, help="This entry is a synonym for this uniq value."
 )
-def add_entry(ctx, scheme, prefix, value, target, redirect, canonical, synonym):
+@click.option(
+    "-T",
+    "--targets",
+    default=None,
+    help='JSON of alternate targets by name, e.g. {"meta": {"target": "...", "media_types": ["text/turtle"]}}',
+)
+@click.option(
+    "-S",
+    "--splitter",
+    default=None,
+    help="Registered name or dotted class name of the splitter for matching identifiers.",
+)
+def add_entry(ctx, scheme, prefix, value, target, redirect, canonical, synonym, targets, splitter):
     """
     Add an entry to the configuration database.
     """
     if redirect < 301 or redirect > 308:
         raise ValueError("Invalid redirect, must be between 301 and 308")
-    session = rslv.lib_rslv.piddefine.get_session(ctx.obj["engine"])
+    import rslv.lib_rslv.piddefine
+    import rslv.lib_rslv.splitters
+
+    if splitter is not None:
+        try:
+            rslv.lib_rslv.splitters.get_splitter(splitter)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--splitter")
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
     try:
         definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
         entry = rslv.lib_rslv.piddefine.PidDefinition(
@@ -168,13 +407,199 @@ def add_entry(ctx, scheme, prefix, value, target, redirect, canonical, synonym):
             http_code=redirect,
             canonical=canonical,
             synonym_for=synonym,
+            targets=json.loads(targets) if targets is not None else None,
+            splitter=splitter,
         )
         result = definitions.add(entry)
-        definitions.refresh_metadata()
         print(result)
     finally:
         session.close()
 
 
+@main.command("delete")
+@click.pass_context
+@click.argument("uniq")
+def delete_entry(ctx, uniq):
+    """Delete the entry with the UNIQ key, e.g. ark:99999/fk4."""
+    import rslv.lib_rslv.piddefine
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
+    try:
+        definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+        if not definitions.delete(uniq):
+            print(f"No entry for {uniq}")
+            ctx.exit(1)
+    finally:
+        session.close()
+
+
+@main.command("refresh")
+@click.pass_context
+def refresh_metadata(ctx):
+    """Recompute the configuration metadata from all entries.
+
+    Metadata is maintained as entries are added, updated, and deleted, so
+    this is only needed after editing the database by other means.
+    """
+    import rslv.lib_rslv.piddefine
+
+    session = rslv.lib_rslv.piddefine.get_session(get_engine(ctx))
+    try:
+        definitions = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+        definitions.refresh_metadata()
+        print(json.dumps(definitions.get_metadata(), indent=2, default=str))
+    finally:
+        session.close()
+
+
+@main.command("serve")
+@click.pass_context
+@click.option("-w", "--workers", type=int, default=None, help="Number of worker processes")
+@click.option("-h", "--host", default=None, help="Address to listen on")
+@click.option("-p", "--port", type=int, default=None, help="Port to listen on")
+def serve(ctx, workers, host, port):
+    """Run the service with pre-forked workers sharing a preloaded catalog.
+
+    Send SIGHUP to the parent process to reload the catalog and gracefully
+    restart the workers.
+    """
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError as e:
+        print("Unable to serve as uvicorn is not available.")
+        print(e)
+        ctx.exit(1)
+    import rslv.server
+
+    rslv.server.serve(ctx.obj["settings"], workers=workers, host=host, port=port)
+
+
+@main.command("check")
+@click.pass_context
+@click.option("-j", "--jobs", type=int, default=None, help="Worker processes, default is CPU count")
+def check_definitions(ctx, jobs):
+    """Check target and canonical templates of all definitions offline.
+
+    Representative identifiers are generated for each definition and run
+    through the parser and template expansion. Problems are reported as
+    JSON lines and the exit status is 1 if any are found.
+    """
+    import dataclasses
+    import time
+    import rslv.lib_rslv.pidcheck
+    import rslv.lib_rslv.pidindex
+
+    L = get_logger()
+    t0 = time.monotonic()
+    index = rslv.lib_rslv.pidindex.load_index(get_engine(ctx))
+    L.info("Loaded %s definitions in %.2fs", len(index), time.monotonic() - t0)
+    problems = rslv.lib_rslv.pidcheck.check_index(index, jobs=jobs)
+    for problem in problems:
+        print(json.dumps(dataclasses.asdict(problem)))
+    L.info(
+        "Checked %s definitions in %.2fs, %s problems",
+        len(index),
+        time.monotonic() - t0,
+        len(problems),
+    )
+    ctx.exit(1 if len(problems) > 0 else 0)
+
+
+@main.command("export")
+@click.pass_context
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["nginx", "table"]),
+    default="nginx",
+    show_default=True,
+    help="An nginx map or a tab separated table of patterns and targets",
+)
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Output file, default is stdout")
+def export_rules(ctx, output_format, output):
+    """Export definitions as redirect rules for an edge proxy.
+
+    Only definitions resolved by prefix matching and template substitution
+    are exported, requests for others are left to the resolver. Definitions
+    that could not be exported are reported as JSON lines on stderr.
+    """
+    import dataclasses
+    import rslv.lib_rslv.export
+    import rslv.lib_rslv.pidindex
+
+    L = get_logger()
+    index = rslv.lib_rslv.pidindex.load_index(get_engine(ctx))
+    rules, skipped = rslv.lib_rslv.export.compile_rules(index.definitions())
+    if output_format == "nginx":
+        output.write(
+            rslv.lib_rslv.export.nginx_map(
+                rules, no_redirect_header=ctx.obj["settings"].request_no_redirect
+            )
+        )
+    else:
+        output.write(rslv.lib_rslv.export.table(rules))
+    for entry in skipped:
+        click.echo(json.dumps(dataclasses.asdict(entry)), err=True)
+    L.info("Exported %s of %s definitions", len(index) - len(skipped), len(index))
+
+
+@main.command("replay")
+@click.pass_context
+@click.argument("logfile", type=click.File("r"))
+@click.option("-u", "--url", default=None, help="Base URL of a running instance. If not set, replay in-process.")
+@click.option("-c", "--concurrency", default=10, show_default=True, help="Concurrent requests")
+@click.option(
+    "-t",
+    "--timing",
+    type=click.Choice(["fast", "original"]),
+    default="fast",
+    show_default=True,
+    help="Send as fast as possible or follow the original request timing",
+)
+@click.option("-s", "--speed", default=1.0, show_default=True, help="Speed up factor for original timing")
+@click.option("-n", "--limit", type=int, default=None, help="Maximum number of requests to replay")
+def replay_log(ctx, logfile, url, concurrency, timing, speed, limit):
+    """Replay an access log against the service and report throughput and latency.
+
+    LOGFILE is a JSON-lines access log as written by the service.
+    """
+    import asyncio
+    import rslv.replay
+
+    requests = rslv.replay.read_access_log(logfile, limit=limit)
+    app = None
+    if url is None:
+        import rslv.app
+
+        app = rslv.app.create_app(settings=ctx.obj["settings"])
+    report = asyncio.run(
+        rslv.replay.replay_log(
+            requests,
+            base_url=url,
+            app=app,
+            concurrency=concurrency,
+            timing=timing,
+            speed=speed,
+        )
+    )
+    print(json.dumps(report, indent=2))
+
+
+@main.command("hot")
+@click.argument("source", type=click.File("r"))
+@click.option("-n", "--limit", type=int, default=10000, show_default=True, help="Maximum number of identifiers")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Output file, default is stdout")
+def hot_identifiers(source, limit, output):
+    """Write the most requested identifiers, one per line, for RSLV_WARMUP_FILE.
+
+    SOURCE is a JSON-lines access log or a document retrieved from /.top.
+    """
+    import rslv.warmup
+
+    for pid in rslv.warmup.read_identifiers(source, limit=limit):
+        output.write(f"{pid}\n")
+
+
 if __name__ == "__main__":
     sys.exit(main())
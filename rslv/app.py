@@ -15,18 +15,29 @@ import typing
 import fastapi
 import fastapi.responses
 import fastapi.middleware.cors
-import fastapi.staticfiles
-import fastapi.templating
 import sqlalchemy
 import rslv
 import rslv.config
+import rslv.dbpool
+import rslv.health
+import rslv.lib_rslv
+import rslv.lib_rslv.heavyhitters
+import rslv.lib_rslv.lookupfilter
+import rslv.lib_rslv.lrucache
+import rslv.lib_rslv.negotiate
+import rslv.lib_rslv.pidindex
+import rslv.lib_rslv.splitters
 import rslv.log_middleware
+import rslv.metrics
+import rslv.ratelimit
 import rslv.routers.resolver
+import rslv.routers.service
+import rslv.warmup
 
 
 @functools.lru_cache(maxsize=None)
-def get_engine(dbcnstr: str) -> sqlalchemy.engine.base.Engine:
-    return sqlalchemy.create_engine(dbcnstr, pool_pre_ping=True)
+def get_engine(dbcnstr: str, **pool_options) -> sqlalchemy.engine.base.Engine:
+    return rslv.dbpool.create_engine(dbcnstr, **pool_options)
 
 
 @contextlib.contextmanager
@@ -41,18 +52,107 @@ def get_dbsession(dbengine) -> typing.Iterator[sqlalchemy.orm.Session]:
         dbsession.close()
 
 
+def start_warmup(app: fastapi.FastAPI):
+    """Resolve the identifiers of the warm-up file in a thread, readiness waits for it to finish."""
+    settings = app.state.settings
+    try:
+        identifiers = rslv.warmup.load_identifiers(settings.warmup_file, limit=settings.warmup_size)
+    except OSError as e:
+        rslv.warmup.get_logger().warning("Unable to read warm-up file: %s", e)
+        return
+    app.state.warmup = rslv.warmup.Warmup(identifiers)
+    app.state.warmup.start(
+        functools.partial(rslv.dbpool.read_engine, app.state),
+        index=app.state.catalog_index,
+        lookup_filter=app.state.lookup_filter,
+    )
+    app.state.metrics.register("warmup", app.state.warmup.stats)
+
+
 @contextlib.asynccontextmanager
 async def dbengine_lifespan(app: fastapi):
     dbcnstr = app.state.settings.db_connection_string
-    app.state.dbengine = get_engine(dbcnstr)
+    app.state.dbengine = get_engine(
+        dbcnstr, **rslv.dbpool.pool_options(app.state.settings)
+    )
+    app.state.metrics.register(
+        "db_pool", lambda: rslv.dbpool.pool_metrics(app.state.dbengine)
+    )
+    if app.state.settings.db_read_connection_strings:
+        app.state.read_engines = rslv.dbpool.ReadEngines(
+            app.state.dbengine,
+            [
+                get_engine(cnstr, **rslv.dbpool.pool_options(app.state.settings))
+                for cnstr in app.state.settings.db_read_connection_strings
+            ],
+            interval=app.state.settings.db_read_check_interval,
+            max_lag=app.state.settings.db_read_max_lag,
+        )
+        app.state.read_engines.start()
+        app.state.metrics.register("read_engines", app.state.read_engines.stats)
+    if app.state.settings.preload_catalog and app.state.catalog_index is None:
+        app.state.catalog_index = rslv.lib_rslv.pidindex.load_index(
+            rslv.dbpool.read_engine(app.state)
+        )
+    if app.state.settings.config_poll_interval > 0:
+        app.state.lookup_filter = rslv.lib_rslv.lookupfilter.LookupFilter(
+            negative_cache_size=app.state.settings.negative_cache_size
+        )
+        app.state.lookup_filter.start(
+            functools.partial(rslv.dbpool.read_engine, app.state),
+            app.state.settings.config_poll_interval,
+        )
+        app.state.metrics.register("lookup_filter", app.state.lookup_filter.stats)
+    if app.state.settings.warmup_file is not None:
+        start_warmup(app)
+    if app.state.settings.health_check_interval > 0:
+        app.state.health_checker = rslv.health.HealthChecker(
+            app.state, interval=app.state.settings.health_check_interval
+        )
+        app.state.health_checker.start()
+    if app.state.log_aggregator is not None:
+        app.state.log_aggregator.start()
+    if app.state.traffic_tracker is not None and app.state.settings.top_log_interval > 0:
+        app.state.traffic_tracker.start(
+            app.state.access_logger, app.state.settings.top_log_interval
+        )
     yield
+    if app.state.health_checker is not None:
+        app.state.health_checker.stop()
+        app.state.health_checker = None
+    if app.state.warmup is not None:
+        app.state.warmup.stop()
+    if app.state.traffic_tracker is not None:
+        app.state.traffic_tracker.stop()
+    if app.state.log_aggregator is not None:
+        app.state.log_aggregator.stop()
+    if app.state.lookup_filter is not None:
+        app.state.lookup_filter.stop()
+        app.state.lookup_filter = None
+    if app.state.read_engines is not None:
+        app.state.read_engines.stop()
+        for engine in app.state.read_engines.replicas:
+            engine.dispose()
+        app.state.read_engines = None
     if app.state.dbengine is not None:
         app.state.dbengine.dispose()
 
 
-def create_app() -> fastapi.FastAPI:
+def create_app(settings: typing.Optional[rslv.config.Settings] = None) -> fastapi.FastAPI:
+    """Create the application.
+
+    Use this factory with an ASGI server, e.g. "uvicorn --factory rslv.app:create_app".
+    Accessing rslv.app.app creates a module level instance on first use.
+    """
+    # Only needed for the application instance, so imported here to keep module import light
+    import fastapi.staticfiles
+    import fastapi.templating
+
+    if settings is None:
+        settings = rslv.config.load_settings()
 
-    settings = rslv.config.load_settings()
+    # Splitters are process wide, identifiers are matched as definitions were keyed
+    rslv.lib_rslv.splitters.set_scheme_splitters(settings.scheme_splitters)
 
     # Setup access logging
     L = rslv.log_middleware.get_logger("rslv", log_filename=settings.log_filename)
@@ -73,6 +173,42 @@ def create_app() -> fastapi.FastAPI:
     )
 
     app.state.settings = settings
+    app.state.access_logger = L
+    # Collectors reported at /.metrics, kept per app rather than per process
+    app.state.metrics = rslv.metrics.Collectors()
+    # Set when the definition catalog is preloaded, see rslv.server
+    app.state.catalog_index = None
+    # Set in the lifespan when unmatched identifiers are rejected early
+    app.state.lookup_filter = None
+    # Set in the lifespan when read replicas are configured, see rslv.dbpool.read_engine
+    app.state.read_engines = None
+    # Set in the lifespan when caches are warmed from settings.warmup_file
+    app.state.warmup = None
+    # Set in the lifespan, checks readiness in the background for /.ready
+    app.state.health_checker = None
+
+    # Cleaning and splitting of request identifiers is compiled once for the settings
+    app.state.identifier_cleaner = rslv.routers.resolver.IdentifierRequestCleaner(
+        settings.service_pattern, cache_size=settings.identifier_cache_size
+    )
+    app.state.metrics.register(
+        "identifier_cache", app.state.identifier_cleaner.cache_stats
+    )
+    app.state.metrics.register(
+        "split_cache",
+        lambda: rslv.metrics.lru_cache_stats(rslv.lib_rslv.split_identifier_string),
+    )
+    app.state.metrics.register(
+        "dispatch_cache", rslv.lib_rslv.negotiate.DISPATCH_CACHE.stats
+    )
+    app.state.info_cache = rslv.lib_rslv.lrucache.LruCache(maxsize=rslv.routers.resolver.INFO_CACHE_SIZE)
+    app.state.metrics.register("info_cache", app.state.info_cache.stats)
+
+    # Most resolved definitions and prefixes, see /.top
+    app.state.traffic_tracker = None
+    if settings.top_k_size > 0:
+        app.state.traffic_tracker = rslv.lib_rslv.heavyhitters.TrafficTracker(settings.top_k_size)
+        app.state.metrics.register("traffic", app.state.traffic_tracker.stats)
 
     # Enables CORS for UIs on different domains
     app.add_middleware(
@@ -90,14 +226,42 @@ def create_app() -> fastapi.FastAPI:
         ],
     )
 
+    # Requests rejected by the rate limiter are still logged
+    app.state.rate_limiter = None
+    if settings.rate_limit_enabled or settings.max_concurrent_requests > 0:
+        app.state.rate_limiter = rslv.ratelimit.RateLimiter(
+            limits=settings.rate_limits if settings.rate_limit_enabled else None,
+            max_concurrent=settings.max_concurrent_requests,
+            trusted_proxies=settings.rate_limit_trusted_proxies,
+            max_clients=settings.rate_limit_max_clients,
+        )
+        app.add_middleware(rslv.ratelimit.RateLimitMiddleware, limiter=app.state.rate_limiter)
+        app.state.metrics.register("rate_limit", app.state.rate_limiter.stats)
+
+    log_sampler = None
+    if settings.log_sample_rates:
+        log_sampler = rslv.log_middleware.LogSampler(settings.log_sample_rates)
+        app.state.metrics.register("log_sampler", log_sampler.stats)
+    # Started in the lifespan so each worker process emits its own rollups
+    app.state.log_aggregator = None
+    if settings.log_rollup_interval > 0:
+        app.state.log_aggregator = rslv.log_middleware.LogAggregator(
+            L, interval=settings.log_rollup_interval
+        )
     app.add_middleware(
         rslv.log_middleware.LogMiddleware,
         logger=L,
+        sampler=log_sampler,
+        aggregator=app.state.log_aggregator,
     )
 
     @app.middleware("http")
     async def add_db_session_middleware(request: fastapi.Request, call_next):
-        with get_dbsession(request.app.state.dbengine) as dbsession:
+        # Probes are frequent and do not use the database
+        if request.url.path in rslv.health.PROBE_PATHS:
+            return await call_next(request)
+        # Requests only read, from a replica when configured
+        with get_dbsession(rslv.dbpool.read_engine(request.app.state)) as dbsession:
             request.state.dbsession = dbsession
             response = await call_next(request)
             return response
@@ -119,18 +283,33 @@ def create_app() -> fastapi.FastAPI:
     async def get_favicon():
         raise fastapi.HTTPException(status_code=404, detail="Not found")
 
+    app.include_router(rslv.routers.service.router)
     app.include_router(rslv.routers.resolver.router)
     return app
 
 
-app = create_app()
+def __getattr__(name):
+    # The module level app instance is created on first access rather than
+    # on import, so importing this module does not load settings, templates,
+    # or attach log handlers.
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     try:
         import uvicorn
 
         settings = rslv.config.load_settings()
-        uvicorn.run("app:app", port=settings.port, host=settings.host, reload=True)
+        uvicorn.run(
+            "rslv.app:create_app",
+            factory=True,
+            port=settings.port,
+            host=settings.host,
+            reload=True,
+        )
     except ImportError as e:
         print("Unable to run as uvicorn is not available.")
         print(e)
@@ -35,19 +35,85 @@ class Settings(pydantic_settings.BaseSettings):
     protocol: str = "http"
     data_dir: str = os.path.join(BASE_FOLDER, "data")
     db_connection_string: str = f"sqlite:///{BASE_FOLDER}/data/pid_config.sqlite"
+    # Connection pool configuration per worker process. Request handlers run in
+    # a thread pool of 40, so pool_size + max_overflow below that may queue
+    # requests on connection checkout under burst load. See /.metrics db_pool.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds to wait for a connection before failing the request
+    db_pool_timeout: float = 30.0
+    # Seconds after which connections are replaced, -1 for never
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = True
+    # Connection strings of read replicas of db_connection_string. When set, requests
+    # read the catalog from the replicas in turn, and db_connection_string is only
+    # read when no replica is available. Management commands use db_connection_string.
+    db_read_connection_strings: typing.List[str] = []
+    # Seconds between checks of the read replicas
+    db_read_check_interval: float = 5.0
+    # Replicas with a catalog version more than this many changes behind the primary are not read
+    db_read_max_lag: int = 10
     static_dir: str = os.path.join(BASE_FOLDER, "static")
     template_dir: str = os.path.join(BASE_FOLDER, "templates")
     log_filename: typing.Optional[str] = None
+    # Fraction of responses written to the access log by status code or class,
+    # e.g. {"2xx": 0.1, "3xx": 0.01}. Responses without a rate are all logged.
+    log_sample_rates: typing.Dict[str, float] = {}
+    # Seconds between access log rollups of request counts and latency by
+    # scheme, prefix, and status, emitted per worker process. 0 disables rollups.
+    log_rollup_interval: float = 0
+    # Number of most resolved definitions and prefixes tracked per worker, see /.top.
+    # 0 disables tracking.
+    top_k_size: int = 1000
+    # Seconds between access log summaries of the most resolved definitions. 0 disables.
+    top_log_interval: float = 0
     # Pattern to match this service URL endpoint, and if requests
     # match then trim the service url from the PID
     # For not uncommon situations where pid = "https://n2t.net/ark:/12345/foo"
     service_pattern: typing.Optional[str] = None
+    # Number of worker processes started by "rslv serve"
+    workers: int = 1
+    # Load the definition catalog into an in-memory index at startup.
+    # "rslv serve" loads the index once in the parent process and shares it with workers.
+    preload_catalog: bool = False
+    # Maximum number of cleaned and split request identifiers memoized per worker.
+    identifier_cache_size: int = 4096
+    # Seconds between checks of the catalog version, after which requests for
+    # unknown schemes and unmatched (scheme, prefix) pairs are answered with 404
+    # without a database lookup. 0 disables the check and the rejection.
+    config_poll_interval: float = 5.0
+    # Maximum number of unmatched (scheme, prefix) pairs remembered per worker.
+    negative_cache_size: int = 65536
+    # File listing the most requested identifiers, resolved by each worker at startup
+    # to warm its caches. A /.top document, an access log, or one identifier per line.
+    warmup_file: typing.Optional[str] = None
+    # Maximum number of identifiers from warmup_file that are resolved
+    warmup_size: int = 10000
+    # Seconds between background checks of the database and catalog reported by /.ready.
+    # 0 disables the checks, then /.ready only waits for warm-up.
+    health_check_interval: float = 5.0
+    # Registered splitter names by scheme in addition to those for ark and doi, e.g.
+    # {"urn": "urn"} to match URNs as urn:<NID>:<NSS>. Definitions are keyed for matching
+    # by these splitters, so rebuild the catalog after changing them.
+    scheme_splitters: typing.Dict[str, str] = {}
     # If pid value matches the definition value, then assume introspection.
     # Note that this should be set False on services offering one-to-one matching of
     # definitions to PIDs. For N2T and arks.org this sould be true to match legacy behavior.
     auto_introspection: bool = True
     # Optional header that if set, service returns a 200 code instead of redirect.
     request_no_redirect: str = "x-no-redirect"
+    # Per client rate limits, applied per worker process. Requests per second and
+    # burst size by path prefix, the longest matching prefix applies. Excess
+    # requests are answered with 429.
+    rate_limit_enabled: bool = False
+    rate_limits: typing.Dict[str, typing.Tuple[float, float]] = {"/": (20.0, 40.0), "/.info": (5.0, 10.0)}
+    # Number of proxies in front of the service appending to X-Forwarded-For. Clients are
+    # identified by the address the outermost of them added, or by the connection address if 0.
+    rate_limit_trusted_proxies: int = 0
+    # Maximum number of clients tracked per path prefix
+    rate_limit_max_clients: int = 100000
+    # Maximum requests in progress per worker process, excess are answered with 503. 0 for no limit.
+    max_concurrent_requests: int = 0
 
 
 def load_settings():
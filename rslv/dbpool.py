@@ -0,0 +1,264 @@
+"""
+Database connection pool configuration and instrumentation.
+
+Request handlers are synchronous and run in the AnyIO worker thread pool,
+which allows 40 concurrent handlers by default. When pool_size +
+max_overflow is lower than that, concurrent requests queue waiting for a
+connection checkout. The InstrumentedQueuePool records how long checkouts
+wait and how often they time out so this is visible at /.metrics.
+
+ReadEngines routes the sessions of requests across read replicas of the
+catalog database, so that writes to the primary database do not slow
+down resolving. Components reading the catalog in the background take a
+callable returning the engine for each read, e.g. read_engine bound to
+the app state, so they follow the replicas as they fail and recover.
+"""
+
+import itertools
+import logging
+
+import threading
+import time
+import typing
+
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.pool
+
+import rslv.config
+import rslv.lib_rslv.piddefine
+import rslv.metrics
+
+
+def get_logger():
+    return logging.getLogger("rslv.dbpool")
+
+
+class PoolStats:
+    """Checkout statistics for a connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkout_wait = rslv.metrics.Histogram()
+        self.timeouts = 0
+        self.max_checked_out = 0
+
+    def record_checkout(self, wait: float, checked_out: int):
+        self.checkout_wait.observe(wait)
+        if checked_out > self.max_checked_out:
+            with self._lock:
+                self.max_checked_out = max(self.max_checked_out, checked_out)
+
+    def record_timeout(self, wait: float):
+        self.checkout_wait.observe(wait)
+        with self._lock:
+            self.timeouts += 1
+
+
+class InstrumentedQueuePool(sqlalchemy.pool.QueuePool):
+    """QueuePool that records checkout wait times and timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        self.stats = kwargs.pop("stats", None)
+        if self.stats is None:
+            self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.record_timeout(time.perf_counter() - t0)
+            raise
+        self.stats.record_checkout(time.perf_counter() - t0, self.checkedout())
+        return connection
+
+    def recreate(self):
+        # Keep the statistics when the pool is recreated, e.g. by engine.dispose()
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def is_memory_sqlite(dbcnstr: str) -> bool:
+    url = sqlalchemy.engine.make_url(dbcnstr)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def pool_options(settings: rslv.config.Settings) -> typing.Dict[str, typing.Any]:
+    """Engine keyword arguments for the connection pool configured in settings."""
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def create_engine(dbcnstr: str, **options) -> sqlalchemy.engine.Engine:
+    """Create an engine using the InstrumentedQueuePool.
+
+    In-memory SQLite databases use a single connection, so pool sizing
+    options are not applicable and are ignored for those.
+    """
+    if is_memory_sqlite(dbcnstr):
+        return sqlalchemy.create_engine(
+            dbcnstr, pool_pre_ping=options.get("pool_pre_ping", True)
+        )
+    return sqlalchemy.create_engine(dbcnstr, poolclass=InstrumentedQueuePool, **options)
+
+
+def pool_metrics(engine: sqlalchemy.engine.Engine) -> typing.Dict[str, typing.Any]:
+    """Summarize the pool state and checkout statistics for engine."""
+    pool = engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {"pool": pool.status()}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "saturation": checked_out / capacity if capacity > 0 else 0.0,
+        "max_checked_out": pool.stats.max_checked_out,
+        "timeouts": pool.stats.timeouts,
+        "checkout_wait": pool.stats.checkout_wait.summary(),
+    }
+
+
+def read_engine(state) -> sqlalchemy.engine.Engine:
+    """The engine for the next read of the app with state, a read replica if configured."""
+    read_engines = getattr(state, "read_engines", None)
+    if read_engines is not None:
+        return read_engines.engine()
+    return state.dbengine
+
+
+def all_engines(state) -> typing.List[sqlalchemy.engine.Engine]:
+    """The primary and read replica engines of the app with state."""
+    read_engines = getattr(state, "read_engines", None)
+    if read_engines is not None:
+        return [state.dbengine] + read_engines.replicas
+    return [state.dbengine]
+
+
+class ReadEngines:
+    """Round robin over the read replica engines that passed their last check.
+
+    Replicas are checked every interval seconds by reading the catalog
+    version. A replica fails the check if it can not be read, or if its
+    version is more than max_lag changes behind the primary, e.g. because
+    replication stopped. When no replica is healthy reads fall back to the
+    primary. Replicas are assumed healthy until first checked.
+    """
+
+    def __init__(
+        self,
+        primary: sqlalchemy.engine.Engine,
+        replicas: typing.Sequence[sqlalchemy.engine.Engine],
+        interval: float = 5.0,
+        max_lag: int = 10,
+    ):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.interval = interval
+        self.max_lag = max_lag
+        self._healthy = list(self.replicas)
+        self._next = itertools.count()
+        self._versions: typing.Dict[int, typing.Optional[int]] = {}
+        self.primary_version: typing.Optional[int] = None
+        self.fallbacks = 0
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def engine(self) -> sqlalchemy.engine.Engine:
+        """The engine for the next read."""
+        healthy = self._healthy
+        if len(healthy) == 0:
+            self.fallbacks += 1
+            return self.primary
+        return healthy[next(self._next) % len(healthy)]
+
+    @staticmethod
+    def catalog_version(engine: sqlalchemy.engine.Engine) -> typing.Optional[int]:
+        with engine.connect() as connection:
+            return connection.execute(
+                sqlalchemy.select(rslv.lib_rslv.piddefine.ConfigMeta.version)
+            ).scalar()
+
+    def check(self) -> int:
+        """Check each replica, returns the number that are healthy."""
+        try:
+            self.primary_version = self.catalog_version(self.primary)
+        except Exception as e:
+            # Replicas are still usable, only their lag is unknown
+            get_logger().warning("Unable to read the primary catalog version: %s", e)
+            self.primary_version = None
+        healthy = []
+        for i, engine in enumerate(self.replicas):
+            try:
+                version = self.catalog_version(engine)
+            except Exception as e:
+                self._versions[i] = None
+                if engine in self._healthy:
+                    get_logger().warning("Read replica %s is unavailable: %s", engine.url, e)
+                continue
+            self._versions[i] = version
+            lag = self.lag(i)
+            if lag is not None and lag > self.max_lag:
+                if engine in self._healthy:
+                    get_logger().warning(
+                        "Read replica %s is %s versions behind the primary", engine.url, lag
+                    )
+                continue
+            healthy.append(engine)
+        if len(healthy) == 0 and len(self._healthy) > 0:
+            get_logger().warning("No read replica is available, reading from the primary")
+        self._healthy = healthy
+        return len(healthy)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Check now, then every interval seconds in a thread."""
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rslv-readengines", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def lag(self, i: int) -> typing.Optional[int]:
+        """Versions replica i was behind the primary at the last check, None if unknown."""
+        version = self._versions.get(i)
+        if version is None or self.primary_version is None:
+            return None
+        return max(self.primary_version - version, 0)
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        healthy = self._healthy
+        return {
+            "replicas": [
+                {
+                    "url": engine.url.render_as_string(hide_password=True),
+                    "healthy": engine in healthy,
+                    "catalog_version": self._versions.get(i),
+                    "lag": self.lag(i),
+                    "pool": pool_metrics(engine),
+                }
+                for i, engine in enumerate(self.replicas)
+            ],
+            "primary_version": self.primary_version,
+            "healthy": len(healthy),
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,111 @@
+"""
+Readiness of a worker, checked in the background.
+
+Load balancers probe readiness frequently and across every worker, so
+/.ready must not query the database itself. A HealthChecker thread
+checks the worker every interval seconds and keeps the rendered result,
+which the endpoint returns as is.
+
+A worker is ready when:
+
+- the catalog version could be read, from a read replica if configured,
+  which needs a database connection from the pool within the pool timeout;
+- no connection checkouts timed out since the previous check;
+- the catalog index is loaded, if settings.preload_catalog;
+- warm-up has finished, if configured.
+
+A result older than three intervals, e.g. because the check is stuck
+waiting on the database, is reported as not ready.
+"""
+
+import json
+import logging
+import threading
+import time
+import typing
+
+import rslv.dbpool
+import rslv.lib_rslv.piddefine
+
+
+# Probe endpoints, exempt from rate limits, load shedding, and access logging
+# so a busy worker still answers them and they do not flood the log
+PROBE_PATHS = frozenset(("/.health", "/.ready"))
+
+WARMING_UP = b'{"ready": false, "failures": ["warmup: in progress"]}'
+
+
+def get_logger():
+    return logging.getLogger("rslv.health")
+
+
+class HealthChecker:
+    def __init__(self, state, interval: float = 5.0):
+        # The app.state of the worker
+        self.state = state
+        self.interval = interval
+        self.max_age = 3 * interval
+        # (time checked, ready, rendered result)
+        self._result: typing.Tuple[float, bool, bytes] = (0.0, False, b'{"ready": false}')
+        self._timeouts = 0
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def check(self) -> typing.Dict[str, typing.Any]:
+        """Check the worker and keep the result for result()."""
+        state = self.state
+        failures = []
+        result = {"ready": False, "checked": time.time()}
+        try:
+            with rslv.lib_rslv.piddefine.get_catalog(rslv.dbpool.read_engine(state)) as catalog:
+                result["catalog_version"] = catalog.get_version()
+        except Exception as e:
+            failures.append(f"database: {e}")
+        pools = [rslv.dbpool.pool_metrics(engine) for engine in rslv.dbpool.all_engines(state)]
+        result["pool_saturation"] = max((pool.get("saturation") or 0.0) for pool in pools)
+        timeouts = sum(pool.get("timeouts", 0) for pool in pools)
+        if timeouts > self._timeouts:
+            failures.append(f"pool: {timeouts - self._timeouts} checkout timeouts")
+        self._timeouts = timeouts
+        if state.settings.preload_catalog and state.catalog_index is None:
+            failures.append("catalog: index not loaded")
+        lookup_filter = getattr(state, "lookup_filter", None)
+        if lookup_filter is not None:
+            result["filter_version"] = lookup_filter.version
+        result["ready"] = len(failures) == 0
+        result["failures"] = failures
+        if failures and self._result[1]:
+            get_logger().warning("Worker not ready: %s", "; ".join(failures))
+        self._result = (time.monotonic(), result["ready"], json.dumps(result).encode("utf-8"))
+        return result
+
+    def result(self) -> typing.Tuple[bool, bytes]:
+        """Whether the worker is ready and the rendered result of the last check."""
+        t, ready, body = self._result
+        if ready and time.monotonic() - t > self.max_age:
+            return False, b'{"ready": false, "failures": ["check: result is stale"]}'
+        # Checked on each call so the end of warm-up is reported without waiting for a check
+        warmup = getattr(self.state, "warmup", None)
+        if warmup is not None and not warmup.ready:
+            return False, WARMING_UP
+        return ready, body
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                get_logger().warning("Health check failed: %s", e)
+
+    def start(self):
+        """Check now, then every interval seconds in a thread."""
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rslv-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,5 +1,8 @@
+import collections.abc
+import functools
 import importlib
 import re
+import string
 import typing
 import urllib.parse
 
@@ -11,15 +14,162 @@ RE_IDENTIFIER = re.compile(
 )
 
 
+@functools.lru_cache(maxsize=128)
 def load_parser(class_name):
+    """Return the object with the dotted class_name, imported once and cached."""
     pkg, cls = class_name.rsplit(".", 1)
     _module = importlib.import_module(pkg)
     return getattr(_module, cls)
 
 
-def split_identifier_string(pid_str: str) -> typing.Dict[str, typing.Any]:
+class ParsedIdentifier(collections.abc.Mapping):
+    """Immutable components of a split identifier string.
+
+    Instances behave as a read-only mapping with the same keys as the dict
+    previously returned by split_identifier_string (pid, scheme, content,
+    prefix, value, and suffix), so they can be used directly with
+    string.Template and str.format_map. URL encoded variants of the
+    components are available as *_enc keys or attributes and are only
+    computed when first requested.
+
+    Use _replace() to derive a modified copy and as_dict() to produce a
+    plain dict for a JSON response.
+    """
+
+    __slots__ = (
+        "pid",
+        "scheme",
+        "content",
+        "prefix",
+        "value",
+        "suffix",
+        "_encoded",
+    )
+
+    _fields = ("pid", "scheme", "content", "prefix", "value", "suffix")
+    _encoded_fields = ("pid_enc", "scheme_enc", "content_enc", "prefix_enc", "value_enc")
+
+    def __init__(
+        self,
+        pid: str = "",
+        scheme: str = "",
+        content: typing.Optional[str] = None,
+        prefix: typing.Optional[str] = None,
+        value: typing.Optional[str] = None,
+        suffix: typing.Optional[str] = None,
+    ):
+        _set = object.__setattr__
+        _set(self, "pid", pid)
+        _set(self, "scheme", scheme)
+        _set(self, "content", content)
+        _set(self, "prefix", prefix)
+        _set(self, "value", value)
+        _set(self, "suffix", suffix)
+        _set(self, "_encoded", None)
+
+    @classmethod
+    def from_mapping(cls, parts: typing.Mapping[str, typing.Any]) -> "ParsedIdentifier":
+        if isinstance(parts, cls):
+            return parts
+        return cls(**{k: parts[k] for k in cls._fields if k in parts})
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __getitem__(self, key: str) -> typing.Any:
+        if key in self._fields:
+            return getattr(self, key)
+        if key in self._encoded_fields:
+            return self._get_encoded(key)
+        raise KeyError(key)
+
+    def __getattr__(self, key: str) -> typing.Any:
+        # Only invoked for names not found in the slots, i.e. the *_enc fields.
+        if key in self._encoded_fields:
+            return self._get_encoded(key)
+        raise AttributeError(key)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields or key in self._encoded_fields
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ParsedIdentifier):
+            return self._astuple() == other._astuple()
+        return super().__eq__(other)
+
+    def __hash__(self) -> int:
+        return hash(self._astuple())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self._fields)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __reduce__(self):
+        return (self.__class__, self._astuple())
+
+    def _astuple(self) -> typing.Tuple:
+        return (self.pid, self.scheme, self.content, self.prefix, self.value, self.suffix)
+
+    def _get_encoded(self, key: str) -> str:
+        encoded = self._encoded
+        if encoded is None:
+            encoded = {}
+            object.__setattr__(self, "_encoded", encoded)
+        try:
+            return encoded[key]
+        except KeyError:
+            pass
+        encoded[key] = urllib.parse.quote(getattr(self, key[:-4]))
+        return encoded[key]
+
+    def _replace(self, **kwargs) -> "ParsedIdentifier":
+        """Return a new instance with the specified fields replaced."""
+        return self.__class__(
+            kwargs.get("pid", self.pid),
+            kwargs.get("scheme", self.scheme),
+            kwargs.get("content", self.content),
+            kwargs.get("prefix", self.prefix),
+            kwargs.get("value", self.value),
+            kwargs.get("suffix", self.suffix),
+        )
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return a plain dict of the components, e.g. for a JSON response.
+
+        suffix is only included after it has been computed by the catalog parser.
+        """
+        res = {
+            "pid": self.pid,
+            "scheme": self.scheme,
+            "content": self.content,
+            "prefix": self.prefix,
+            "value": self.value,
+        }
+        if self.suffix is not None:
+            res["suffix"] = self.suffix
+        return res
+
+
+# Bound on the number of memoized split_identifier_string results
+SPLIT_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def split_identifier_string(pid_str: str) -> ParsedIdentifier:
     """
     Split an identifier.
+
+    Results are immutable and so are memoized in a bounded LRU cache.
+
     ark:/12345/bar =>
         pid = ark:/12345/bar
         scheme = ark
@@ -28,15 +178,8 @@ def split_identifier_string(pid_str: str) -> typing.Dict[str, typing.Any]:
         value = bar
     """
     pid_str = pid_str.strip()
-    parsed = {
-        "pid": pid_str,
-        "scheme": "",
-        "content": None,
-        "prefix": None,
-        "value": None,
-    }
     _parts = pid_str.split(":", 1)
-    parsed["scheme"] = _parts[0].strip().lower()
+    scheme = _parts[0].strip().lower()
     # Special case for URNs
     #TODO: This change has unintended impacts on N2T behavior with urn tests
     #      Rolling back the change for later consideration.
@@ -48,34 +191,50 @@ def split_identifier_string(pid_str: str) -> typing.Dict[str, typing.Any]:
     #    except IndexError:
     #        pass
     #    parsed["scheme"] = _parts[0].strip().lower()
-    try:
-        parsed["content"] = _parts[1].lstrip(" /:")
-        parsed["content"] = parsed["content"].strip()  # type: ignore
-    except IndexError:
-        return parsed
-    _parts = parsed["content"].split("/", 1)  # type: ignore
-    parsed["prefix"] = _parts[0].strip()
-    try:
-        parsed["value"] = _parts[1].lstrip(" /")
-        parsed["value"] = parsed["value"].strip() # type: ignore
-    except IndexError:
-        pass
-    return parsed
-
-
-def unsplit_identifier_string(template_str: str, pid_parts: dict) -> str:
-    """Unsplit a dict of identifier components.
+    if len(_parts) < 2:
+        return ParsedIdentifier(pid_str, scheme)
+    content = _parts[1].lstrip(" /:").strip()
+    _parts = content.split("/", 1)
+    prefix = _parts[0].strip()
+    value = None
+    if len(_parts) > 1:
+        value = _parts[1].lstrip(" /").strip()
+    return ParsedIdentifier(pid_str, scheme, content, prefix, value)
+
+
+def unsplit_identifier_string(
+    template_str: str, pid_parts: typing.Mapping[str, typing.Any]
+) -> str:
+    """Unsplit identifier components.
 
     template_str is a python fstring compatible string that will be filled with
-    values from pid_parts. If as_url is set, then pid_parts are url encoded first.
+    values from pid_parts. The URL encoded variants of the parts are available
+    as the *_enc fields (e.g. {value_enc}).
     """
-    encoded_pid_parts = pid_parts.copy()
-    encoded_pid_parts["pid_enc"] = urllib.parse.quote(pid_parts["pid"])
-    encoded_pid_parts["scheme_enc"] = urllib.parse.quote(pid_parts["scheme"])
-    encoded_pid_parts["content_enc"] = urllib.parse.quote(pid_parts["content"])
-    encoded_pid_parts["prefix_enc"] = urllib.parse.quote(pid_parts["prefix"])
-    encoded_pid_parts["value_enc"] = urllib.parse.quote(pid_parts["value"])
-    return template_str.format(**encoded_pid_parts)
+    return template_str.format_map(ParsedIdentifier.from_mapping(pid_parts))
+
+
+class _TemplateValues:
+    """Mapping view over identifier parts that renders None as an empty string."""
+
+    __slots__ = ("_parts",)
+
+    def __init__(self, parts: typing.Mapping[str, typing.Any]):
+        self._parts = parts
+
+    def __getitem__(self, key: str) -> typing.Any:
+        v = self._parts[key]
+        if v is None:
+            return ""
+        return v
+
+
+def pid_format(parts: typing.Mapping[str, typing.Any], template: typing.Optional[str]) -> str:
+    """Given identifier parts and a template, return the filled template."""
+    # Quick hack to avoid "None" appearing in generated string.
+    if template is None:
+        template = "/.info/${pid}"
+    return string.Template(template).substitute(_TemplateValues(parts))
 
 
 def identifiers_in_text(text: str) -> typing.Generator[dict, None, int]:
@@ -91,6 +250,9 @@ def identifiers_in_text(text: str) -> typing.Generator[dict, None, int]:
     return count
 
 
+RE_SLASHES = re.compile("/+")
+
+
 def remove_hyphens(text: typing.Optional[str]) -> typing.Optional[str]:
     # removes hyphens, but not from query part...
     if text is None:
@@ -98,7 +260,7 @@ def remove_hyphens(text: typing.Optional[str]) -> typing.Optional[str]:
     ab = text.split("?", 1)
     a = ab[0].replace("-", "")
     # while here, clean up mutiple sequential slashes
-    a = re.sub("/+", "/", a)
+    a = RE_SLASHES.sub("/", a)
     if len(ab) < 2:
         return a
     return f"{a}?{ab[1]}"
@@ -0,0 +1,153 @@
+"""
+Differences between definition catalogs and applying them.
+
+Both sides are streams of definition dicts (PidDefinition.as_dict()) in
+uniq order, read from a catalog with iter_definitions or from a dump
+written by "rslv dump". They are compared with a merge join, so only one
+definition of each side is held at a time, and a definition is:
+
+- added if it is only in the source;
+- removed if it is only in the target;
+- changed if its fields differ;
+- older if it is changed but the source has a lower revision property
+  than the target. Older definitions are not applied, matching
+  PidDefinitionCatalog.update.
+
+sync() applies the added, changed, and removed definitions to the target
+catalog in batches, each in a single transaction, so the time taken
+beyond the comparison depends on the number of changes.
+"""
+
+import dataclasses
+import json
+import typing
+
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.splitters
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+OLDER = "older"
+
+Record = typing.Dict[str, typing.Any]
+
+
+@dataclasses.dataclass
+class Change:
+    kind: str
+    uniq: str
+    source: typing.Optional[Record] = None
+    target: typing.Optional[Record] = None
+    # Names of the fields that differ for changed and older definitions
+    fields: typing.List[str] = dataclasses.field(default_factory=list)
+
+    def as_dict(self) -> Record:
+        res = {"change": self.kind, "uniq": self.uniq}
+        if self.fields:
+            res["fields"] = self.fields
+        return res
+
+
+def normalize(record: typing.Mapping[str, typing.Any]) -> Record:
+    """The dump fields of a definition record, missing fields as None.
+
+    The prefix, value, and uniq are normalized as by PidDefinition.from_dict.
+    """
+    res = {name: record.get(name) for name in rslv.lib_rslv.piddefine.PidDefinition.DUMP_FIELDS}
+    res["prefix"], res["value"] = rslv.lib_rslv.splitters.definition_key(
+        res["scheme"], res["prefix"], res["value"]
+    )
+    res["uniq"] = rslv.lib_rslv.piddefine.calculate_definition_uniq(
+        res["scheme"], res["prefix"], res["value"]
+    )
+    return res
+
+
+def revision(record: Record) -> int:
+    return (record.get("properties") or {}).get("revision", 0)
+
+
+def read_dump(lines: typing.Iterable[str]) -> typing.Iterator[Record]:
+    """Definition records of a dump written by "rslv dump"."""
+    for line in lines:
+        if line.strip() != "":
+            yield json.loads(line)
+
+
+def read_catalog(
+    catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog, batch_size: int = 1000
+) -> typing.Iterator[Record]:
+    for entry in catalog.iter_definitions(batch_size=batch_size):
+        yield entry.as_dict()
+
+
+def _ordered(records: typing.Iterable[Record], side: str) -> typing.Iterator[Record]:
+    last = None
+    for record in records:
+        record = normalize(record)
+        if last is not None and record["uniq"] <= last:
+            raise ValueError(f"The {side} definitions are not in uniq order at {record['uniq']}")
+        last = record["uniq"]
+        yield record
+
+
+def diff(
+    source: typing.Iterable[Record], target: typing.Iterable[Record]
+) -> typing.Iterator[Change]:
+    """Changes that make target the same as source, in uniq order."""
+    source = _ordered(source, "source")
+    target = _ordered(target, "target")
+    s = next(source, None)
+    t = next(target, None)
+    while s is not None or t is not None:
+        if t is None or (s is not None and s["uniq"] < t["uniq"]):
+            yield Change(ADDED, s["uniq"], source=s)
+            s = next(source, None)
+        elif s is None or t["uniq"] < s["uniq"]:
+            yield Change(REMOVED, t["uniq"], target=t)
+            t = next(target, None)
+        else:
+            fields = [name for name in s if s[name] != t[name]]
+            if fields:
+                kind = OLDER if revision(s) < revision(t) else CHANGED
+                yield Change(kind, s["uniq"], source=s, target=t, fields=fields)
+            s = next(source, None)
+            t = next(target, None)
+
+
+def sync(
+    catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog,
+    changes: typing.Iterable[Change],
+    batch_size: int = 500,
+    delete: bool = True,
+) -> typing.Dict[str, int]:
+    """Apply changes to catalog in batches of batch_size, returning the counts by kind.
+
+    The changes must be complete before the first batch is written, e.g. a
+    list, since writing while the target is read is not possible with
+    every database. Removed definitions are kept if not delete.
+    """
+    counts = {ADDED: 0, CHANGED: 0, REMOVED: 0, OLDER: 0}
+    puts = []
+    deletes = []
+
+    def flush():
+        if puts or deletes:
+            catalog.apply_batch(puts, deletes)
+            puts.clear()
+            deletes.clear()
+
+    for change in changes:
+        counts[change.kind] += 1
+        if change.kind in (ADDED, CHANGED):
+            puts.append(change.source)
+        elif change.kind == REMOVED:
+            if not delete:
+                counts[REMOVED] -= 1
+                continue
+            deletes.append(change.uniq)
+        if len(puts) + len(deletes) >= batch_size:
+            flush()
+    flush()
+    return counts
@@ -0,0 +1,282 @@
+"""
+Compile the definition catalog into redirect rules for an edge proxy.
+
+Many definitions resolve by prefix matching and template substitution
+alone, so a proxy in front of the service can answer those requests
+without a round trip to the resolver. compile_rules() produces an ordered
+list of regular expressions over the request URI with a target template
+in which the placeholders are replaced by named captures. The first rule
+matching a request applies. A rule without a target passes the request to
+the resolver.
+
+Rules only match the plain form of an identifier, e.g. /ark:/12345/x1 or
+/ark:12345/x1, for GET and HEAD requests. Requests with a query string,
+percent encoded characters, or dot segments, and identifiers the resolver
+would answer with introspection (no value or a value equal to the
+definition value), are not matched and so are passed to the resolver.
+Each definition is followed by a rule passing the rest of the identifiers
+it matches to the resolver, so a broader rule never applies to an
+identifier the resolver would resolve with a more specific definition.
+
+Definitions are not exported, and identifiers matching them are passed to
+the resolver, when they:
+
+- are synonyms (synonym)
+- have alternate targets selected by content negotiation (alternate_targets)
+- use a splitter other than the ark, doi, or default splitters (splitter)
+- use URL encoded placeholders or a literal $ in the target (template)
+- have characters in the prefix or value that can not be matched in the
+  request URI (characters), or a value without a prefix (no_prefix)
+
+ARKs with hyphens or repeated slashes are passed to the resolver unless
+hyphen stripping is disabled for the definition, and DOI prefixes and
+values are matched without regard to case.
+
+Patterns use PCRE syntax that is also accepted by the python re module.
+"""
+
+import dataclasses
+import re
+import string
+import typing
+
+import rslv.lib_rslv
+import rslv.lib_rslv.splitters
+
+# Splitters with known matching behavior
+_DEFAULT = rslv.lib_rslv.splitters.Splitter
+_ARK = rslv.lib_rslv.splitters.ArkSplitter
+_DOI = rslv.lib_rslv.splitters.DoiSplitter
+
+# Template placeholders available as captures. scheme and prefix are
+# always those of the definition and so are filled in when compiling.
+CAPTURES = {
+    "pid": "rslv_pid",
+    "content": "rslv_content",
+    "value": "rslv_value",
+    "suffix": "rslv_suffix",
+}
+
+# Characters of a prefix or value that appear as-is in a request URI
+_SAFE_CHARACTERS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-._~!&'()*+,=:@/"
+)
+_REGEX_SPECIAL = frozenset(".()*+")
+# Character class of a value or suffix matched by a rule, with / and - added
+# as needed. Identifiers with other characters are passed to the resolver.
+_CHARS = "A-Za-z0-9._~!&'()*+,=:@"
+
+
+@dataclasses.dataclass
+class Rule:
+    uniq: str
+    # Regular expression matched against the request URI
+    pattern: str
+    http_code: typing.Optional[int] = None
+    # Target with ${rslv_*} captures, None to pass the request to the resolver
+    target: typing.Optional[str] = None
+
+
+@dataclasses.dataclass
+class Skipped:
+    uniq: str
+    reason: str
+    detail: str
+
+
+class NotExportable(Exception):
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+def _literal(text: str, fold: bool = False) -> str:
+    """Pattern matching text, without backslashes so it can be quoted in proxy configurations."""
+    res = []
+    for c in text:
+        if c not in _SAFE_CHARACTERS:
+            raise NotExportable("characters", f"Unable to match {c!r} in {text!r}")
+        res.append(f"[{c}]" if c in _REGEX_SPECIAL else c)
+    pattern = "".join(res)
+    if fold and pattern != "":
+        return f"(?i:{pattern})"
+    return pattern
+
+
+def _target(definition) -> str:
+    """The definition target with placeholders replaced by ${rslv_*} captures."""
+    template = definition.target
+    if template is None:
+        template = "/.info/${pid}"
+    literals = {"scheme": definition.scheme, "prefix": definition.prefix}
+    res = []
+    pos = 0
+    for m in string.Template.pattern.finditer(template):
+        res.append(template[pos:m.start()])
+        pos = m.end()
+        name = m.group("named") or m.group("braced")
+        if name in CAPTURES:
+            res.append(f"${{{CAPTURES[name]}}}")
+        elif name in literals:
+            res.append(literals[name])
+        else:
+            raise NotExportable("template", f"Unsupported placeholder {m.group(0)}")
+    res.append(template[pos:])
+    return "".join(res)
+
+
+def _fold_case(definition) -> bool:
+    """True if the prefix and value of definition are matched without regard to case."""
+    lookup = rslv.lib_rslv.splitters.scheme_splitter(definition.scheme)
+    if type(lookup) not in (_DEFAULT, _ARK, _DOI):
+        raise NotExportable("splitter", f"Scheme splitter {type(lookup).__name__}")
+    return type(lookup) is _DOI
+
+
+def _strip_hyphens(definition) -> bool:
+    """True if hyphens are removed from identifiers matching definition."""
+    try:
+        if definition.splitter:
+            # The resolver falls back to the scheme splitter, but the definition needs fixing
+            rslv.lib_rslv.splitters.get_splitter(definition.splitter)
+        finish = rslv.lib_rslv.splitters.definition_splitter(definition)
+    except ValueError as e:
+        raise NotExportable("splitter", str(e)) from e
+    if type(finish) not in (_DEFAULT, _ARK, _DOI):
+        raise NotExportable("splitter", f"Splitter {type(finish).__name__}")
+    return type(finish) is _ARK and (definition.properties or {}).get("strip_hyphens", True)
+
+
+def _passthrough(definition, fold: bool) -> Rule:
+    """Rule passing the plain form of identifiers matching definition to the resolver."""
+    scheme = _literal(definition.scheme)
+    if definition.prefix == "":
+        return Rule(definition.uniq, f"^/{scheme}:")
+    prefix = _literal(definition.prefix, fold)
+    if definition.value == "":
+        return Rule(definition.uniq, f"^/{scheme}:/?{prefix}(?:/|$)")
+    return Rule(definition.uniq, f"^/{scheme}:/?{prefix}/{_literal(definition.value, fold)}")
+
+
+def _redirect(definition, fold: bool) -> Rule:
+    """Rule redirecting the plain form of identifiers matching definition."""
+    if definition.synonym_for is not None:
+        raise NotExportable("synonym", f"Synonym for {definition.synonym_for}")
+    if definition.targets:
+        raise NotExportable("alternate_targets", ", ".join(definition.targets))
+    if definition.prefix == "" and definition.value != "":
+        raise NotExportable("no_prefix", f"Value {definition.value!r} without a prefix")
+    # Dot segments may be removed from the path by clients and proxies
+    guard = "(?!.*/[.][.]?(?:/|$))"
+    if _strip_hyphens(definition):
+        # Hyphens and repeated slashes are removed by the ark splitter
+        prefix_chars, chars, guard = f"[{_CHARS}]", f"[{_CHARS}/]", guard + "(?!.*//)"
+    else:
+        prefix_chars, chars = f"[{_CHARS}-]", f"[{_CHARS}/-]"
+    if definition.prefix == "":
+        # The resolver computes the suffix of a scheme match as the content
+        # after the first character.
+        content = (
+            f"(?=.(?P<rslv_suffix>{chars}*)$)"
+            f"(?!:){prefix_chars}+/(?!/)(?P<rslv_value>{chars}+)"
+        )
+    else:
+        content = (
+            f"{_literal(definition.prefix, fold)}/(?!/)"
+            f"(?P<rslv_value>{_literal(definition.value, fold)}(?P<rslv_suffix>{chars}+))"
+        )
+    pattern = f"^/{guard}(?P<rslv_pid>{_literal(definition.scheme)}:/?(?P<rslv_content>{content}))$"
+    return Rule(definition.uniq, pattern, http_code=definition.http_code, target=_target(definition))
+
+
+def rule_order(definition) -> typing.Tuple:
+    """Sort key placing rules for longer values before shorter ones and prefixes before schemes."""
+    return (
+        definition.scheme,
+        definition.prefix == "",
+        definition.prefix,
+        -len(definition.value),
+        definition.value,
+    )
+
+
+def compile_rules(
+    definitions: typing.Iterable,
+) -> typing.Tuple[typing.List[Rule], typing.List[Skipped]]:
+    """Ordered rules for definitions and the definitions that could not be exported."""
+    rules = []
+    skipped = []
+    for definition in sorted(definitions, key=rule_order):
+        try:
+            fold = _fold_case(definition)
+            passthrough = _passthrough(definition, fold)
+        except NotExportable as e:
+            # No rule matches identifiers of the definition, so they are
+            # all passed to the resolver.
+            skipped.append(Skipped(definition.uniq, e.reason, e.detail))
+            continue
+        try:
+            rules.append(_redirect(definition, fold))
+        except NotExportable as e:
+            skipped.append(Skipped(definition.uniq, e.reason, e.detail))
+        rules.append(passthrough)
+    return rules, skipped
+
+
+def apply_rules(rules: typing.Sequence[Rule], uri: str) -> typing.Optional[typing.Tuple[int, str]]:
+    """(http_code, target) of the first rule matching uri, None if passed to the resolver."""
+    for rule in rules:
+        m = re.search(rule.pattern, uri)
+        if m is not None:
+            if rule.target is None:
+                return None
+            return rule.http_code, string.Template(rule.target).substitute(m.groupdict())
+    return None
+
+
+def _nginx_quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def nginx_map(
+    rules: typing.Sequence[Rule],
+    variable: str = "rslv_redirect",
+    no_redirect_header: typing.Optional[str] = None,
+) -> str:
+    """An nginx map setting variable to "<http_code> <target>" for redirected requests.
+
+    Requests sending the no_redirect_header are not matched.
+    """
+    header = ""
+    if no_redirect_header is not None:
+        header = "$http_" + no_redirect_header.lower().replace("-", "_")
+    codes = sorted({rule.http_code for rule in rules if rule.http_code is not None})
+    lines = [
+        "# Generated by rslv export. Include in the http context and in the server add:",
+    ]
+    for code in codes:
+        lines.append(
+            f'#   if (${variable} ~ "^{code} (?<rslv_location>.*)") {{ return {code} $rslv_location; }}'
+        )
+    lines.append(f'map "$request_method:{header}:$request_uri" ${variable} {{')
+    lines.append('    default "";')
+    for rule in rules:
+        # The key is <method>:<no redirect header>:<request URI>
+        pattern = "~^(?:GET|HEAD)::" + rule.pattern[1:]
+        value = "" if rule.target is None else f"{rule.http_code} {rule.target}"
+        lines.append(f"    {_nginx_quote(pattern)} {_nginx_quote(value)};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def table(rules: typing.Sequence[Rule]) -> str:
+    """Tab separated uniq, pattern, http_code, and target of rules in order.
+
+    http_code and target are empty for rules passing requests to the resolver.
+    """
+    lines = []
+    for rule in rules:
+        code = "" if rule.http_code is None else str(rule.http_code)
+        lines.append("\t".join((rule.uniq, rule.pattern, code, rule.target or "")))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+"""
+Bounded tracking of the most requested definitions and prefixes.
+
+SpaceSaving implements the space-saving algorithm (Metwally et al. 2005)
+over a fixed number of counters. A key that is tracked has its counter
+incremented. An untracked key replaces a key with the minimum count and
+inherits that count, recorded as its possible overcount (error). Any key
+with a true count above total / capacity is guaranteed to be tracked, and
+a reported count never underestimates the true count.
+
+Keys are kept in buckets by count, so each update is a few dict
+operations regardless of the capacity.
+"""
+
+import logging
+import threading
+import typing
+
+
+class SpaceSaving:
+    """Approximate counts of the most frequent of a stream of keys."""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        # key -> [count, error, label]
+        self._entries: typing.Dict[typing.Hashable, list] = {}
+        # count -> keys with the count, oldest first
+        self._buckets: typing.Dict[int, typing.Dict[typing.Hashable, None]] = {}
+        self._min = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _move(self, key: typing.Hashable, entry: list, count: int):
+        bucket = self._buckets[entry[0]]
+        del bucket[key]
+        if len(bucket) == 0:
+            del self._buckets[entry[0]]
+            if self._min == entry[0]:
+                self._min = count
+        entry[0] = count
+        self._buckets.setdefault(count, {})[key] = None
+
+    def add(self, key: typing.Hashable, label: typing.Any = None):
+        """Count an occurrence of key. label is reported with the key while it is tracked."""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self.total += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._move(key, entry, entry[0] + 1)
+                return
+            if len(self._entries) < self.capacity:
+                self._entries[key] = [1, 0, label]
+                self._buckets.setdefault(1, {})[key] = None
+                self._min = 1
+                return
+            # Replace the oldest key with the minimum count, which inherits the count
+            bucket = self._buckets[self._min]
+            evicted = next(iter(bucket))
+            del bucket[evicted]
+            bucket[key] = None
+            entry = self._entries.pop(evicted)
+            entry[1] = entry[0]
+            entry[2] = label
+            self._entries[key] = entry
+            self._move(key, entry, entry[0] + 1)
+
+    def top(self, n: int = 10) -> typing.List[typing.Dict[str, typing.Any]]:
+        """The n keys with the highest counts, most frequent first."""
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: -item[1][0])[:n]
+        return [
+            {"key": key, "count": count, "error": error, "label": label}
+            for key, (count, error, label) in entries
+        ]
+
+
+class TrafficTracker:
+    """Most resolved definitions and (scheme, prefix) pairs of a worker."""
+
+    def __init__(self, capacity: int = 1000):
+        self.definitions = SpaceSaving(capacity)
+        self.prefixes = SpaceSaving(capacity)
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def add(self, uniq: str, scheme: str, prefix: str, value: str):
+        self.definitions.add(uniq, (scheme, prefix, value))
+        self.prefixes.add((scheme, prefix))
+
+    def top(self, n: int = 10) -> typing.Dict[str, typing.Any]:
+        definitions = []
+        for entry in self.definitions.top(n):
+            scheme, prefix, value = entry["label"]
+            definitions.append({
+                "uniq": entry["key"],
+                "scheme": scheme,
+                "prefix": prefix,
+                "value": value,
+                "count": entry["count"],
+                "error": entry["error"],
+            })
+        prefixes = []
+        for entry in self.prefixes.top(n):
+            scheme, prefix = entry["key"]
+            prefixes.append({
+                "scheme": scheme,
+                "prefix": prefix,
+                "count": entry["count"],
+                "error": entry["error"],
+            })
+        return {
+            "requests": self.definitions.total,
+            "definitions": definitions,
+            "prefixes": prefixes,
+        }
+
+    def _run(self, logger: logging.Logger, interval: float, n: int):
+        while not self._stop.wait(interval):
+            summary = self.top(n)
+            if summary["requests"] > 0:
+                logger.info(f"top {n} of {summary['requests']} resolved", extra={"top": summary})
+
+    def start(self, logger: logging.Logger, interval: float, n: int = 20):
+        """Start a thread logging the top n definitions and prefixes every interval seconds."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(logger, interval, n), name="rslv-heavyhitters", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "requests": self.definitions.total,
+            "definitions": len(self.definitions),
+            "prefixes": len(self.prefixes),
+        }
@@ -0,0 +1,139 @@
+"""
+Rejection of identifiers that can not match any definition.
+
+Requests for unknown schemes, such as scanner requests for /wp-login.php,
+would otherwise make three definition lookups before returning 404. A
+LookupFilter holds the set of schemes in the catalog and a bounded cache
+of (scheme, prefix) pairs known not to match, so these are rejected
+without touching the database.
+
+A (scheme, prefix) pair is only cached as unmatched when there are no
+definitions with the scheme and prefix and no scheme definition, since
+then no value of an identifier can match.
+
+Both are valid for a catalog version. A watcher thread polls the catalog
+version and reloads the schemes when it changes, which also invalidates
+the cached pairs. Until the filter is first loaded nothing is rejected.
+With read replicas each poll may read a different replica, and pairs are
+only cached as unmatched by a catalog at the version of the filter.
+"""
+
+import logging
+import threading
+import typing
+
+import sqlalchemy
+
+import rslv.lib_rslv
+import rslv.lib_rslv.lrucache
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.splitters
+
+
+def get_logger():
+    return logging.getLogger("rslv.lookupfilter")
+
+
+class LookupFilter:
+    def __init__(self, negative_cache_size: int = 65536):
+        # (version, schemes) replaced together when the catalog changes
+        self._known: typing.Tuple[typing.Optional[int], typing.FrozenSet[str]] = (None, frozenset())
+        self._unmatched = rslv.lib_rslv.lrucache.LruCache(maxsize=negative_cache_size)
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+        self.rejected_schemes = 0
+        self.rejected_prefixes = 0
+
+    @property
+    def version(self) -> typing.Optional[int]:
+        return self._known[0]
+
+    def load(self, catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog) -> bool:
+        """Load the schemes of catalog if its version changed, returns True if loaded."""
+        version = catalog.get_version()
+        if version == self._known[0]:
+            return False
+        schemes = frozenset(s[0] for s in catalog.list_schemes())
+        self._known = (version, schemes)
+        return True
+
+    def _lookup(self, parts: rslv.lib_rslv.ParsedIdentifier) -> typing.Tuple[str, typing.Optional[str]]:
+        lookup = rslv.lib_rslv.splitters.scheme_splitter(parts.scheme).prepare(parts)
+        return lookup.scheme, lookup.prefix
+
+    def rejects(self, parts: rslv.lib_rslv.ParsedIdentifier) -> bool:
+        """True if no definition matches parts."""
+        version, schemes = self._known
+        if version is None:
+            return False
+        if parts.scheme not in schemes:
+            self.rejected_schemes += 1
+            return True
+        if self._unmatched.maxsize > 0 and self._unmatched.get(self._lookup(parts), version):
+            self.rejected_prefixes += 1
+            return True
+        return False
+
+    def unmatched(
+        self,
+        catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog,
+        parts: rslv.lib_rslv.ParsedIdentifier,
+    ):
+        """Record that parts did not match a definition of catalog."""
+        version = self._known[0]
+        if version is None or self._unmatched.maxsize == 0:
+            return
+        scheme, prefix = self._lookup(parts)
+        if prefix is None or prefix == "":
+            return
+        if catalog.get_version() != version:
+            # A replica behind or ahead of the one the filter was loaded from
+            return
+        if catalog.has_definitions(scheme, "") or catalog.has_definitions(scheme, prefix):
+            return
+        self._unmatched.put((scheme, prefix), True, version)
+
+    def refresh(self, engine: sqlalchemy.engine.Engine) -> bool:
+        with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+            return self.load(catalog)
+
+    def _watch(self, engine: typing.Callable[[], sqlalchemy.engine.Engine], interval: float):
+        while not self._stop.wait(interval):
+            try:
+                if self.refresh(engine()):
+                    get_logger().info("Loaded schemes of catalog version %s", self.version)
+            except Exception as e:
+                # Keep the current schemes until the catalog can be read again
+                get_logger().warning("Unable to refresh lookup filter: %s", e)
+
+    def start(self, engine: rslv.lib_rslv.piddefine.EngineSource, interval: float):
+        """Load the filter and start a thread refreshing it every interval seconds.
+
+        engine is an engine, or a callable returning the engine for each refresh.
+        """
+        engine = rslv.lib_rslv.piddefine.engine_getter(engine)
+        try:
+            self.refresh(engine())
+        except Exception as e:
+            get_logger().warning("Unable to load lookup filter: %s", e)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, args=(engine, interval), name="rslv-lookupfilter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        version, schemes = self._known
+        return {
+            "version": version,
+            "schemes": len(schemes),
+            "rejected_schemes": self.rejected_schemes,
+            "rejected_prefixes": self.rejected_prefixes,
+            "unmatched_cache": self._unmatched.stats(),
+        }
@@ -0,0 +1,63 @@
+"""
+Bounded, thread safe least recently used cache.
+
+functools.lru_cache memoizes a function by its arguments. This is for
+values that are built elsewhere and checked against a validator before
+use, such as values derived from a definition record that may have been
+updated since the value was cached.
+"""
+
+import collections
+import threading
+import typing
+
+_MISSING = object()
+
+
+class LruCache:
+    """Mapping of key to (validator, value) bounded to maxsize entries."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "collections.OrderedDict[typing.Hashable, typing.Tuple[typing.Any, typing.Any]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: typing.Hashable, validator: typing.Any = None, default: typing.Any = None):
+        """Return the value cached for key if it was stored with an equal validator."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] == validator:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def put(self, key: typing.Hashable, value: typing.Any, validator: typing.Any = None):
+        with self._lock:
+            self._data[key] = (validator, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        """Cache statistics in the same form as rslv.metrics.lru_cache_stats."""
+        n_requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / n_requests if n_requests > 0 else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
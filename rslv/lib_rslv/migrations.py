@@ -0,0 +1,426 @@
+"""
+Schema versioning and online rebuilds of catalog databases.
+
+The schema version of a database is recorded in piddef_meta.schema_version.
+migrate() applies the migrations newer than that version in order, within a
+single transaction, and records the new version. Databases created before
+versioning are treated as version 0.
+
+rebuild() creates a fresh copy of the definitions alongside the live ones
+and swaps it in atomically, so the catalog can be re-indexed or reloaded
+without a period where lookups see an empty or partial table:
+
+- SQLite database files are rebuilt to a new file that replaces the
+  original with os.replace. Processes with open connections continue to
+  read the old file until they reconnect, e.g. `rslv serve` on SIGHUP.
+  This assumes the default rollback journal; do not use with WAL.
+- Other databases, and in-memory SQLite, are rebuilt to a new table in
+  the same database which is renamed over piddef in one transaction.
+"""
+
+import logging
+import os
+import typing
+
+import sqlalchemy
+
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.splitters
+
+REBUILD_SUFFIX = "_rebuild"
+REBUILD_FILE = "file"
+REBUILD_TABLE = "table"
+
+
+def get_logger():
+    return logging.getLogger("rslv.migrations")
+
+
+def _meta_table(*columns: str) -> sqlalchemy.sql.expression.TableClause:
+    # piddef_meta of any schema version, with only the named columns
+    return sqlalchemy.table(
+        rslv.lib_rslv.piddefine.ConfigMeta.__tablename__,
+        *[sqlalchemy.column(c) for c in ("key",) + columns],
+    )
+
+
+def get_schema_version(connection: sqlalchemy.engine.Connection) -> typing.Optional[int]:
+    """Schema version of the database, None if it has not been initialized."""
+    meta_table = rslv.lib_rslv.piddefine.ConfigMeta.__tablename__
+    inspector = sqlalchemy.inspect(connection)
+    if not inspector.has_table(meta_table):
+        return None
+    if "schema_version" not in [c["name"] for c in inspector.get_columns(meta_table)]:
+        return 0
+    meta = _meta_table("schema_version")
+    return connection.execute(
+        sqlalchemy.select(meta.c.schema_version).where(meta.c.key == 0)
+    ).scalar()
+
+
+def add_column(connection: sqlalchemy.engine.Connection, column: sqlalchemy.Column):
+    """Add column of a model table to the database table if it is missing."""
+    columns = [c["name"] for c in sqlalchemy.inspect(connection).get_columns(column.table.name)]
+    if column.name in columns:
+        return
+    ddl = sqlalchemy.schema.CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(sqlalchemy.text(f"ALTER TABLE {column.table.name} ADD COLUMN {ddl}"))
+
+
+def set_schema_version(connection: sqlalchemy.engine.Connection, version: int):
+    add_column(connection, rslv.lib_rslv.piddefine.ConfigMeta.__table__.c.schema_version)
+    meta = _meta_table("schema_version")
+    connection.execute(meta.update().where(meta.c.key == 0).values(schema_version=version))
+
+
+def select_for(source: sqlalchemy.Table, target: sqlalchemy.Table):
+    """Names of target columns and a select providing them from rows of source.
+
+    source may be an older piddef table, so columns it lacks are computed
+    or filled with the column default where possible.
+    """
+    names = []
+    columns = []
+    for column in target.columns:
+        if column.name in source.c:
+            expr = source.c[column.name]
+        elif column.name == "value_length":
+            expr = sqlalchemy.func.coalesce(sqlalchemy.func.char_length(source.c.value), 0)
+        elif column.default is not None and column.default.is_scalar:
+            expr = sqlalchemy.literal(column.default.arg)
+        else:
+            continue
+        names.append(column.name)
+        columns.append(expr.label(column.name))
+    return names, sqlalchemy.select(*columns)
+
+
+def copy_definitions(
+    source: sqlalchemy.engine.Connection,
+    target: sqlalchemy.engine.Connection,
+    target_table: sqlalchemy.Table,
+    batch_size: int = 1000,
+) -> int:
+    """Copy all definitions from the piddef table at source to target_table at target.
+
+    Older databases may hold definitions keyed otherwise than the current
+    schema, so prefix, value, and uniq are normalized as by migrations 4
+    and 5. Where two definitions normalize to the same uniq, the one
+    already stored with it is kept and the other dropped.
+    """
+    piddefine = rslv.lib_rslv.piddefine
+    source_table = sqlalchemy.Table(
+        piddefine.PidDefinition.__tablename__,
+        sqlalchemy.MetaData(),
+        autoload_with=source,
+    )
+    _, q = select_for(source_table, target_table)
+    n = 0
+    # uniq -> whether the copied definition was stored with another uniq
+    copied: typing.Dict[str, bool] = {}
+    result = source.execution_options(yield_per=batch_size).execute(q)
+    for rows in result.mappings().partitions():
+        batch = {}
+        for row in rows:
+            row = dict(row)
+            original = row["uniq"]
+            row["prefix"], row["value"] = rslv.lib_rslv.splitters.definition_key(
+                row["scheme"], row["prefix"], row["value"]
+            )
+            row["uniq"] = piddefine.calculate_definition_uniq(row["scheme"], row["prefix"], row["value"])
+            if "value_length" in row:
+                row["value_length"] = len(row["value"] or "")
+            renamed = row["uniq"] != original
+            if row["uniq"] in copied:
+                if renamed or not copied[row["uniq"]]:
+                    get_logger().warning("Dropping %s, a duplicate of %s", original, row["uniq"])
+                    continue
+                get_logger().warning("Dropping the duplicate of %s copied earlier", row["uniq"])
+                if row["uniq"] not in batch:
+                    target.execute(target_table.delete().where(target_table.c.uniq == row["uniq"]))
+                    n -= 1
+            batch[row["uniq"]] = row
+            copied[row["uniq"]] = renamed
+        if len(batch) > 0:
+            target.execute(target_table.insert(), list(batch.values()))
+            n += len(batch)
+    return n
+
+
+def uniq_primary_key(connection: sqlalchemy.engine.Connection):
+    """Rebuild piddef with uniq as the primary key and the lookup index.
+
+    Rows are copied to a new table with value_length populated, the old
+    table and its per-column indexes are dropped, and the new table is
+    renamed in its place. Nothing is done if uniq is already the primary key.
+    """
+    table = rslv.lib_rslv.piddefine.PidDefinition.__table__
+    inspector = sqlalchemy.inspect(connection)
+    if not inspector.has_table(table.name):
+        return
+    if inspector.get_pk_constraint(table.name)["constrained_columns"] == ["uniq"]:
+        return
+    old = sqlalchemy.Table(table.name, sqlalchemy.MetaData(), autoload_with=connection)
+    new = table.to_metadata(sqlalchemy.MetaData(), name=f"{table.name}_new")
+    # Indexes are created after the rename so they are named for the final table
+    new.indexes.clear()
+    new.create(connection)
+    names, q = select_for(old, new)
+    connection.execute(new.insert().from_select(names, q))
+    old.drop(connection)
+    connection.execute(sqlalchemy.text(f"ALTER TABLE {new.name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection)
+    get_logger().info("Rebuilt %s with uniq primary key", table.name)
+
+
+def prefix_stats(connection: sqlalchemy.engine.Connection):
+    """Add the definition version counter and the per prefix stats table."""
+    add_column(connection, rslv.lib_rslv.piddefine.ConfigMeta.__table__.c.version)
+    rslv.lib_rslv.piddefine.PidPrefixStats.__table__.create(connection, checkfirst=True)
+    rslv.lib_rslv.piddefine.recompute_metadata(connection)
+
+
+def definition_targets(connection: sqlalchemy.engine.Connection):
+    """Add the content negotiated targets column."""
+    add_column(connection, rslv.lib_rslv.piddefine.PidDefinition.__table__.c.targets)
+
+
+def unique_definitions(connection: sqlalchemy.engine.Connection):
+    """Normalize uniq of definitions without a value and make the lookup index unique.
+
+    Definitions without a value were stored with uniq "scheme:prefix/" or
+    "scheme:prefix" depending on how the value was given. Where both
+    exist, the one with the trailing "/" is deleted.
+    """
+    piddefine = rslv.lib_rslv.piddefine
+    table = piddefine.PidDefinition.__table__
+    rows = connection.execute(
+        sqlalchemy.select(table.c.uniq, table.c.scheme, table.c.prefix)
+        .where(table.c.value == "")
+        .order_by(table.c.uniq)
+    ).all()
+    uniqs = {row.uniq for row in rows}
+    for row in rows:
+        uniq = piddefine.calculate_definition_uniq(row.scheme, row.prefix, "")
+        if uniq == row.uniq:
+            continue
+        if uniq in uniqs:
+            get_logger().warning("Deleting %s, a duplicate of %s", row.uniq, uniq)
+            connection.execute(table.delete().where(table.c.uniq == row.uniq))
+        else:
+            connection.execute(table.update().where(table.c.uniq == row.uniq).values(uniq=uniq))
+            uniqs.add(uniq)
+    for index in table.indexes:
+        index.drop(connection, checkfirst=True)
+        index.create(connection)
+    piddefine.recompute_metadata(connection)
+
+
+def definition_keys(connection: sqlalchemy.engine.Connection):
+    """Store prefix and value as the scheme splitters match them, e.g. lower case DOIs.
+
+    Definitions stored otherwise were never matched. Where one differs only
+    in case from an existing definition, it is deleted.
+    """
+    piddefine = rslv.lib_rslv.piddefine
+    splitters = rslv.lib_rslv.splitters
+    table = piddefine.PidDefinition.__table__
+    rows = connection.execute(
+        sqlalchemy.select(table.c.uniq, table.c.scheme, table.c.prefix, table.c.value)
+        .where(table.c.scheme.in_(list(splitters.SCHEME_SPLITTERS)))
+        .order_by(table.c.uniq)
+    ).all()
+    uniqs = {row.uniq for row in rows}
+    for row in rows:
+        prefix, value = splitters.definition_key(row.scheme, row.prefix, row.value)
+        uniq = piddefine.calculate_definition_uniq(row.scheme, prefix, value)
+        if uniq == row.uniq:
+            continue
+        if uniq in uniqs:
+            get_logger().warning("Deleting %s, a duplicate of %s", row.uniq, uniq)
+            connection.execute(table.delete().where(table.c.uniq == row.uniq))
+            continue
+        connection.execute(
+            table.update()
+            .where(table.c.uniq == row.uniq)
+            .values(uniq=uniq, prefix=prefix, value=value, value_length=len(value))
+        )
+        uniqs.add(uniq)
+    piddefine.recompute_metadata(connection)
+
+
+# (version, name, upgrade) in version order. The last version must equal
+# rslv.lib_rslv.piddefine.SCHEMA_VERSION.
+MIGRATIONS: typing.List[
+    typing.Tuple[int, str, typing.Callable[[sqlalchemy.engine.Connection], None]]
+] = [
+    (1, "uniq_primary_key", uniq_primary_key),
+    (2, "prefix_stats", prefix_stats),
+    (3, "definition_targets", definition_targets),
+    (4, "unique_definitions", unique_definitions),
+    (5, "definition_keys", definition_keys),
+]
+
+
+def pending(engine: sqlalchemy.engine.Engine) -> typing.List[str]:
+    """Names of migrations not yet applied to the database at engine."""
+    with engine.connect() as connection:
+        current = get_schema_version(connection)
+    if current is None:
+        return []
+    return [name for version, name, _ in MIGRATIONS if version > current]
+
+
+def migrate(engine: sqlalchemy.engine.Engine) -> typing.List[str]:
+    """Apply pending migrations and return their names."""
+    applied = []
+    with engine.begin() as connection:
+        current = get_schema_version(connection)
+        if current is None:
+            raise ValueError("Database is not initialized, use rslv initialize")
+        for version, name, upgrade in MIGRATIONS:
+            if version <= current:
+                continue
+            get_logger().info("Applying migration %s %s", version, name)
+            upgrade(connection)
+            set_schema_version(connection, version)
+            applied.append(name)
+    return applied
+
+
+def sqlite_file(engine: sqlalchemy.engine.Engine) -> typing.Optional[str]:
+    """Path of the database file if engine is a file based SQLite database."""
+    if engine.dialect.name != "sqlite":
+        return None
+    database = engine.url.database
+    if database in (None, "", ":memory:") or database.startswith("file:"):
+        return None
+    return database
+
+
+def _source_description(source: sqlalchemy.engine.Connection) -> str:
+    meta = _meta_table("description")
+    if not sqlalchemy.inspect(source).has_table(meta.name):
+        return ""
+    return source.execute(
+        sqlalchemy.select(meta.c.description).where(meta.c.key == 0)
+    ).scalar() or ""
+
+
+def rebuild_file(
+    engine: sqlalchemy.engine.Engine,
+    source_engine: sqlalchemy.engine.Engine,
+    batch_size: int = 1000,
+) -> int:
+    """Rebuild the SQLite database file of engine from source_engine and swap it in."""
+    path = sqlite_file(engine)
+    rebuild_path = f"{path}{REBUILD_SUFFIX}"
+    if os.path.exists(rebuild_path):
+        os.remove(rebuild_path)
+    rebuild_engine = sqlalchemy.create_engine(f"sqlite:///{rebuild_path}")
+    try:
+        with source_engine.connect() as source:
+            description = _source_description(source)
+            rslv.lib_rslv.piddefine.create_database(rebuild_engine, description)
+            with rebuild_engine.begin() as target:
+                n = copy_definitions(
+                    source,
+                    target,
+                    rslv.lib_rslv.piddefine.PidDefinition.__table__,
+                    batch_size=batch_size,
+                )
+                rslv.lib_rslv.piddefine.recompute_metadata(target)
+    except BaseException:
+        rebuild_engine.dispose()
+        os.remove(rebuild_path)
+        raise
+    rebuild_engine.dispose()
+    # Connections held by this process would keep reading the replaced file
+    engine.dispose()
+    os.replace(rebuild_path, path)
+    return n
+
+
+def rebuild_table(
+    engine: sqlalchemy.engine.Engine,
+    source_engine: sqlalchemy.engine.Engine,
+    batch_size: int = 1000,
+) -> int:
+    """Rebuild piddef in a new table of the database at engine and rename it in place.
+
+    The schema of the database at engine must be current since only the
+    piddef table is replaced.
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+    if version != rslv.lib_rslv.piddefine.SCHEMA_VERSION:
+        raise ValueError(
+            f"Schema version is {version}, use rslv migrate before rebuilding"
+        )
+    table = rslv.lib_rslv.piddefine.PidDefinition.__table__
+    new = table.to_metadata(sqlalchemy.MetaData(), name=f"{table.name}{REBUILD_SUFFIX}")
+    # Index names are unique per database, so the new indexes get temporary names
+    new.indexes.clear()
+    for index in table.indexes:
+        sqlalchemy.Index(
+            f"{index.name}{REBUILD_SUFFIX}",
+            *[new.c[c.name] for c in index.columns],
+            unique=index.unique,
+        )
+    with engine.begin() as connection:
+        new.drop(connection, checkfirst=True)
+        new.create(connection)
+    if source_engine is engine:
+        with engine.begin() as connection:
+            source = sqlalchemy.Table(table.name, sqlalchemy.MetaData(), autoload_with=connection)
+            names, q = select_for(source, new)
+            connection.execute(new.insert().from_select(names, q))
+            n = connection.execute(
+                sqlalchemy.select(sqlalchemy.func.count()).select_from(new)
+            ).scalar()
+    else:
+        with source_engine.connect() as source, engine.begin() as target:
+            n = copy_definitions(source, target, new, batch_size=batch_size)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f"DROP TABLE {table.name}"))
+        connection.execute(sqlalchemy.text(f"ALTER TABLE {new.name} RENAME TO {table.name}"))
+        for index in table.indexes:
+            if engine.dialect.name == "postgresql":
+                connection.execute(
+                    sqlalchemy.text(
+                        f"ALTER INDEX {index.name}{REBUILD_SUFFIX} RENAME TO {index.name}"
+                    )
+                )
+            else:
+                connection.execute(sqlalchemy.text(f"DROP INDEX {index.name}{REBUILD_SUFFIX}"))
+                index.create(connection)
+        rslv.lib_rslv.piddefine.recompute_metadata(connection)
+    return n
+
+
+def rebuild(
+    engine: sqlalchemy.engine.Engine,
+    source_engine: typing.Optional[sqlalchemy.engine.Engine] = None,
+    method: typing.Optional[str] = None,
+    batch_size: int = 1000,
+) -> typing.Dict[str, typing.Any]:
+    """Rebuild the catalog at engine from source_engine, by default itself.
+
+    method is REBUILD_FILE or REBUILD_TABLE, by default REBUILD_FILE for
+    SQLite database files and REBUILD_TABLE otherwise.
+    """
+    if source_engine is None:
+        source_engine = engine
+    if method is None:
+        method = REBUILD_FILE if sqlite_file(engine) is not None else REBUILD_TABLE
+    if method == REBUILD_FILE:
+        if sqlite_file(engine) is None:
+            raise ValueError("File rebuild requires a SQLite database file")
+        n = rebuild_file(engine, source_engine, batch_size=batch_size)
+    elif method == REBUILD_TABLE:
+        n = rebuild_table(engine, source_engine, batch_size=batch_size)
+    else:
+        raise ValueError(f"Unknown rebuild method: {method}")
+    get_logger().info("Rebuilt catalog with %s definitions by %s swap", n, method)
+    return {"method": method, "definitions": n}
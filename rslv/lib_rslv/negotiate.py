@@ -0,0 +1,191 @@
+"""
+Selection of a definition target by content negotiation.
+
+A definition may provide alternate targets in PidDefinition.targets, a
+mapping of target name to an entry like:
+
+    {
+        "target": "https://example.org/${value}.ttl",
+        "media_types": ["text/turtle"],
+        "profiles": ["http://www.w3.org/ns/dcat#"],
+        "http_code": 303
+    }
+
+The definition target is the default, offered as text/html and */* unless
+another target claims text/html. The target is selected, in order of
+precedence, by the _profile and _mediatype query parameters (names or
+profile URIs are accepted for _profile), the Accept-Profile header, and the
+Accept header, following https://www.w3.org/TR/dx-prof-conneg/. The
+_profile and _mediatype parameters are removed from the identifier, other
+query parameters are passed through to the target as part of it.
+
+Dispatch tables are built once per definition and cached by uniq, so
+selection is a few dict lookups per request. Accept headers are parsed once
+per distinct header value.
+"""
+
+import dataclasses
+import functools
+import typing
+
+import rslv.lib_rslv
+import rslv.lib_rslv.lrucache
+
+DEFAULT_TARGET = "default"
+
+# How the target was selected
+BY_PROFILE_PARAM = "_profile"
+BY_MEDIATYPE_PARAM = "_mediatype"
+BY_ACCEPT_PROFILE = "accept-profile"
+BY_ACCEPT = "accept"
+BY_DEFAULT = "default"
+
+# Query parameters selecting the target, not part of the identifier
+QUERY_PARAMS = (BY_PROFILE_PARAM, BY_MEDIATYPE_PARAM)
+
+DISPATCH_CACHE_SIZE = 4096
+
+
+def strip_query_params(url: str) -> str:
+    """url without the QUERY_PARAMS, other query parameters are kept as they are."""
+    base, sep, query = url.partition("?")
+    if sep == "" or not any(name in query for name in QUERY_PARAMS):
+        return url
+    kept = [param for param in query.split("&") if param.split("=", 1)[0] not in QUERY_PARAMS]
+    if len(kept) == 0:
+        return base
+    return f"{base}?{'&'.join(kept)}"
+
+
+@dataclasses.dataclass(frozen=True)
+class Target:
+    name: str
+    template: typing.Optional[str]
+    http_code: int
+    media_types: typing.Tuple[str, ...] = ()
+    profiles: typing.Tuple[str, ...] = ()
+
+    def format(self, parts: typing.Mapping[str, typing.Any]) -> str:
+        return rslv.lib_rslv.pid_format(parts, self.template)
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "name": self.name,
+            "target": self.template,
+            "http_code": self.http_code,
+            "media_types": list(self.media_types),
+            "profiles": list(self.profiles),
+        }
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_accept(header: typing.Optional[str]) -> typing.Tuple[str, ...]:
+    """Media ranges or profiles of an Accept or Accept-Profile header, most preferred first.
+
+    Values with q=0 are dropped. Angle brackets around profile URIs are removed.
+    """
+    if header is None or header == "":
+        return ()
+    ranges = []
+    for i, item in enumerate(header.split(",")):
+        fields = item.split(";")
+        value = fields[0].strip().strip("<>").strip()
+        if value == "":
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            k, _, v = param.partition("=")
+            if k.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            # Sort by descending q, then by position in the header
+            ranges.append((-q, i, value))
+    ranges.sort()
+    return tuple(r[2] for r in ranges)
+
+
+class DispatchTable:
+    """Targets of a definition indexed by media type, profile, and name."""
+
+    __slots__ = ("default", "targets", "by_media_type", "by_profile", "by_name")
+
+    def __init__(self, definition):
+        self.default = Target(
+            name=DEFAULT_TARGET,
+            template=definition.target,
+            http_code=definition.http_code,
+            media_types=("text/html",),
+        )
+        self.targets = [self.default]
+        for name, entry in (definition.targets or {}).items():
+            self.targets.append(
+                Target(
+                    name=name,
+                    template=entry.get("target"),
+                    http_code=entry.get("http_code", definition.http_code),
+                    media_types=tuple(m.lower() for m in entry.get("media_types", ())),
+                    profiles=tuple(entry.get("profiles", ())),
+                )
+            )
+        self.by_media_type: typing.Dict[str, Target] = {"*/*": self.default}
+        self.by_profile: typing.Dict[str, Target] = {}
+        self.by_name: typing.Dict[str, Target] = {}
+        # Later targets take precedence over the default for a media type
+        for target in self.targets:
+            self.by_name[target.name] = target
+            for media_type in target.media_types:
+                if media_type not in self.by_media_type or target is not self.default:
+                    self.by_media_type[media_type] = target
+                    major = media_type.split("/", 1)[0]
+                    self.by_media_type.setdefault(f"{major}/*", target)
+            for profile in target.profiles:
+                self.by_profile[profile] = target
+
+    @property
+    def negotiated(self) -> bool:
+        """True if there are targets other than the default."""
+        return len(self.targets) > 1
+
+    def select(
+        self,
+        accept: typing.Optional[str] = None,
+        accept_profile: typing.Optional[str] = None,
+        mediatype_param: typing.Optional[str] = None,
+        profile_param: typing.Optional[str] = None,
+    ) -> typing.Tuple[Target, str]:
+        """Return the selected target and how it was selected."""
+        if not self.negotiated:
+            return self.default, BY_DEFAULT
+        if profile_param:
+            target = self.by_name.get(profile_param) or self.by_profile.get(profile_param)
+            if target is not None:
+                return target, BY_PROFILE_PARAM
+        if mediatype_param:
+            target = self.by_media_type.get(mediatype_param.lower())
+            if target is not None:
+                return target, BY_MEDIATYPE_PARAM
+        for profile in parse_accept(accept_profile):
+            target = self.by_profile.get(profile)
+            if target is not None:
+                return target, BY_ACCEPT_PROFILE
+        for media_type in parse_accept(accept):
+            target = self.by_media_type.get(media_type.lower())
+            if target is not None:
+                return target, BY_ACCEPT
+        return self.default, BY_DEFAULT
+
+
+DISPATCH_CACHE = rslv.lib_rslv.lrucache.LruCache(maxsize=DISPATCH_CACHE_SIZE)
+
+
+def dispatch_table(definition) -> DispatchTable:
+    """The cached dispatch table of definition, rebuilt if its targets changed."""
+    validator = (definition.target, definition.http_code, definition.targets)
+    table = DISPATCH_CACHE.get(definition.uniq, validator)
+    if table is None:
+        table = DispatchTable(definition)
+        DISPATCH_CACHE.put(definition.uniq, table, validator)
+    return table
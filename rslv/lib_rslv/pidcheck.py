@@ -0,0 +1,239 @@
+"""
+Offline validation of definition target and canonical templates.
+
+Every definition in the catalog is checked without sending any HTTP
+requests. For each definition representative identifiers are generated and
+run through PidDefinitionCatalog.parse and pid_format as the resolver
+would, and problems are reported:
+
+- bad_placeholder: a template references an unknown or malformed placeholder
+- bad_splitter: the splitter named by the definition can not be loaded
+- invalid_url: an expanded target is neither an absolute http(s) URL nor
+  a path on this service
+- unmatched: the identifier formed from the definition does not resolve to it
+- synonym_missing: synonym_for does not refer to an existing definition
+- synonym_loop: following synonym_for returns to a definition already visited
+
+Checks run against a PidDefinitionIndex so no database queries are made
+per identifier, and are spread over worker processes that share the index.
+"""
+
+import concurrent.futures
+import dataclasses
+import multiprocessing
+import os
+import re
+import string
+import typing
+import urllib.parse
+
+import rslv.lib_rslv
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
+import rslv.lib_rslv.splitters
+
+# Placeholders available to target and canonical templates
+TEMPLATE_FIELDS = frozenset(
+    rslv.lib_rslv.ParsedIdentifier._fields + rslv.lib_rslv.ParsedIdentifier._encoded_fields
+)
+
+# Appended to definition values to generate identifiers with a suffix
+SAMPLE_SUFFIX = "x1y2/z3"
+
+RE_WHITESPACE = re.compile(r"\s")
+
+# Maximum synonym chain length followed before reporting a loop
+MAX_SYNONYM_DEPTH = 16
+
+
+@dataclasses.dataclass
+class Problem:
+    uniq: str
+    problem: str
+    detail: str
+    sample: typing.Optional[str] = None
+
+
+def template_problems(template: typing.Optional[str]) -> typing.List[str]:
+    """Return descriptions of placeholder problems in a string.Template."""
+    if template is None:
+        return []
+    problems = []
+    for match in string.Template.pattern.finditer(template):
+        if match.group("invalid") is not None:
+            problems.append(f"Invalid placeholder at position {match.start('invalid')}")
+            continue
+        name = match.group("named") or match.group("braced")
+        if name is not None and name not in TEMPLATE_FIELDS:
+            problems.append(f"Unknown placeholder ${{{name}}}")
+    return problems
+
+
+def url_problem(url: str) -> typing.Optional[str]:
+    """Return a description of why url is not a valid redirect target, or None."""
+    if RE_WHITESPACE.search(url) is not None:
+        return "Contains whitespace"
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "" and parsed.netloc == "":
+        if url.startswith("/"):
+            return None
+        return "Not an absolute URL or service path"
+    if parsed.scheme not in ("http", "https"):
+        return f"Unsupported URL scheme {parsed.scheme}"
+    if parsed.netloc == "":
+        return "Missing host"
+    return None
+
+
+def sample_identifiers(definition: rslv.lib_rslv.piddefine.PidDefinition) -> typing.List[str]:
+    """Representative identifiers for a definition.
+
+    The first is the identifier exactly matching the definition.
+    """
+    scheme = definition.scheme
+    prefix = definition.prefix or ""
+    value = definition.value or ""
+    if prefix == "":
+        return [f"{scheme}:", f"{scheme}:{SAMPLE_SUFFIX}"]
+    if value == "":
+        return [f"{scheme}:{prefix}", f"{scheme}:{prefix}/{SAMPLE_SUFFIX}"]
+    return [f"{scheme}:{prefix}/{value}", f"{scheme}:{prefix}/{value}{SAMPLE_SUFFIX}"]
+
+
+def synonym_problem(
+    catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog,
+    definition: rslv.lib_rslv.piddefine.PidDefinition,
+) -> typing.Optional[Problem]:
+    visited = [definition.uniq]
+    current = definition
+    while current.synonym_for is not None:
+        parts = rslv.lib_rslv.split_identifier_string(current.synonym_for)
+        target = catalog.get(
+            parts.scheme,
+            prefix=parts.prefix if parts.prefix != "" else None,
+            value=parts.value,
+            resolve_synonym=False,
+        )
+        if target is None:
+            return Problem(
+                definition.uniq,
+                "synonym_missing",
+                f"No definition for synonym_for {current.synonym_for}",
+            )
+        if target.uniq in visited or len(visited) > MAX_SYNONYM_DEPTH:
+            return Problem(
+                definition.uniq, "synonym_loop", " -> ".join(visited + [target.uniq])
+            )
+        visited.append(target.uniq)
+        current = target
+    return None
+
+
+def definition_templates(
+    definition: rslv.lib_rslv.piddefine.PidDefinition,
+) -> typing.List[typing.Tuple[str, typing.Optional[str], bool]]:
+    """(label, template, is_url) of the templates of a definition, including alternate targets."""
+    templates = [("target", definition.target, True), ("canonical", definition.canonical, False)]
+    for name, entry in (definition.targets or {}).items():
+        templates.append((f"targets.{name}", entry.get("target"), True))
+    return templates
+
+
+def check_definition(
+    catalog: rslv.lib_rslv.piddefine.PidDefinitionCatalog,
+    definition: rslv.lib_rslv.piddefine.PidDefinition,
+) -> typing.List[Problem]:
+    problems = []
+    if definition.splitter is not None and definition.splitter != "":
+        try:
+            rslv.lib_rslv.splitters.get_splitter(definition.splitter)
+        except ValueError as e:
+            # Identifiers matching the definition are parsed with the scheme splitter instead
+            return [Problem(definition.uniq, "bad_splitter", str(e))]
+    for field, template, _ in definition_templates(definition):
+        for detail in template_problems(template):
+            problems.append(Problem(definition.uniq, "bad_placeholder", f"{field}: {detail}"))
+    synonym = synonym_problem(catalog, definition)
+    if synonym is not None:
+        # Resolving identifiers would not terminate or fail, so stop here.
+        problems.append(synonym)
+        return problems
+    if len(problems) > 0:
+        return problems
+    for i, sample in enumerate(sample_identifiers(definition)):
+        parts, matched = catalog.parse(sample, resolve_synonym=False)
+        if matched is None or matched.uniq != definition.uniq:
+            if i == 0:
+                problems.append(
+                    Problem(
+                        definition.uniq,
+                        "unmatched",
+                        f"Matched {None if matched is None else matched.uniq}",
+                        sample,
+                    )
+                )
+            continue
+        if definition.synonym_for is not None:
+            parts, matched = catalog.parse(sample)
+        for field, template, is_url in definition_templates(matched):
+            try:
+                expanded = rslv.lib_rslv.pid_format(parts, template)
+            except (KeyError, ValueError) as e:
+                problems.append(
+                    Problem(definition.uniq, "bad_placeholder", f"{field}: {e!r}", sample)
+                )
+                continue
+            if is_url:
+                detail = url_problem(expanded)
+                if detail is not None:
+                    problems.append(
+                        Problem(definition.uniq, "invalid_url", f"{detail}: {expanded}", sample)
+                    )
+    return problems
+
+
+def check_range(
+    index: rslv.lib_rslv.pidindex.PidDefinitionIndex, start: int, stop: int
+) -> typing.List[Problem]:
+    catalog = rslv.lib_rslv.piddefine.PidDefinitionCatalog(None, index=index)
+    problems = []
+    for definition in index.definitions(start, stop):
+        problems += check_definition(catalog, definition)
+    return problems
+
+
+# Set in the parent before forking so workers share the index copy-on-write
+_worker_index: typing.Optional[rslv.lib_rslv.pidindex.PidDefinitionIndex] = None
+
+
+def _check_range_worker(start: int, stop: int) -> typing.List[Problem]:
+    return check_range(_worker_index, start, stop)
+
+
+def check_index(
+    index: rslv.lib_rslv.pidindex.PidDefinitionIndex,
+    jobs: typing.Optional[int] = None,
+    chunk_size: int = 2000,
+) -> typing.List[Problem]:
+    """Check all definitions in index, in parallel when jobs > 1 and fork is available."""
+    global _worker_index
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    n = len(index)
+    if jobs <= 1 or n <= chunk_size or "fork" not in multiprocessing.get_all_start_methods():
+        return check_range(index, 0, n)
+    _worker_index = index
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = [
+                executor.submit(_check_range_worker, start, min(start + chunk_size, n))
+                for start in range(0, n, chunk_size)
+            ]
+            problems = []
+            for future in futures:
+                problems += future.result()
+            return problems
+    finally:
+        _worker_index = None
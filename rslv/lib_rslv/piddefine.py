@@ -2,18 +2,23 @@ import contextlib
 import datetime
 import typing
 import sqlalchemy as sqla
-import sqlalchemy.exc
 import sqlalchemy.orm as sqlorm
 import sqlalchemy.types
 import sqlalchemy.sql.expression
 
 import rslv.lib_rslv
+import rslv.lib_rslv.splitters
 
 
 def current_time():
     return datetime.datetime.now(tz=datetime.timezone.utc)
 
 
+# Version of the schema defined in this module. Existing databases are
+# upgraded to it by rslv.lib_rslv.migrations.
+SCHEMA_VERSION = 5
+
+
 class Base(sqlorm.DeclarativeBase):
     pass
 
@@ -21,11 +26,20 @@ class Base(sqlorm.DeclarativeBase):
 def calculate_definition_uniq(scheme, prefix, value):
     s = scheme if scheme is not None else ""
     p = prefix if prefix is not None else ""
-    if value is not None:
+    # A missing value is stored as "", so both give the same uniq
+    if value:
         return f"{s}:{p}/{value}"
     return f"{s}:{p}"
 
 
+def normalize_uniq(uniq: str) -> str:
+    """uniq of the stored definition it refers to, e.g. "ark:99999" for "ark:99999/"."""
+    scheme, _, rest = uniq.partition(":")
+    prefix, _, value = rest.partition("/")
+    prefix, value = rslv.lib_rslv.splitters.definition_key(scheme, prefix, value)
+    return calculate_definition_uniq(scheme, prefix, value)
+
+
 def default_definition_uniq(context):
     """Create a single string representation of scheme:prefix/value.
 
@@ -39,6 +53,12 @@ def default_definition_uniq(context):
     )
 
 
+def default_value_length(context):
+    """Length of the value portion, stored for ordering longest value matches."""
+    value = context.get_current_parameters()["value"]
+    return len(value) if value is not None else 0
+
+
 class PidDefinition(Base):
     """Defines a database record that contains configuration for a
     particular combination of scheme:prefix/value.
@@ -49,20 +69,23 @@ class PidDefinition(Base):
 
     __tablename__ = "piddef"
 
+    # uniq is derived from scheme, prefix, and value, so as the primary key
+    # it also enforces uniqueness of that combination.
     uniq: sqlorm.Mapped[str] = sqlorm.mapped_column(
+        primary_key=True,
         doc="Unique key for this record, constructed from scheme:prefix/value",
-        index=True,
         default=default_definition_uniq,
     )
-    scheme: sqlorm.Mapped[str] = sqlorm.mapped_column(
-        primary_key=True, doc="Lower case scheme name.", index=True
-    )
-    # Unique constraint is not enforced in sqlite if values are NULL, so set default to empty string
+    scheme: sqlorm.Mapped[str] = sqlorm.mapped_column(doc="Lower case scheme name.")
+    # Empty string rather than NULL so equality matches work for missing prefix or value
     prefix: sqlorm.Mapped[str] = sqlorm.mapped_column(
-        primary_key=True, default="", doc="PID prefix portion match.", index=True
+        default="", doc="PID prefix portion match."
     )
     value: sqlorm.Mapped[str] = sqlorm.mapped_column(
-        primary_key=True, default="", doc="PID value portion match.", index=True
+        default="", doc="PID value portion match."
+    )
+    value_length: sqlorm.Mapped[int] = sqlorm.mapped_column(
+        default=default_value_length, doc="Number of characters in value."
     )
     splitter: sqlorm.Mapped[typing.Optional[str]] = sqlorm.mapped_column(
         doc="Optional alternate splitter function to use."
@@ -70,12 +93,16 @@ class PidDefinition(Base):
     pid_model: sqlorm.Mapped[str] = sqlorm.mapped_column(
         default="", doc="Identifier class to use for pids matching this definition."
     )
-    # Note we can extend this to support alternate targets based on content negotiation
-    # (media-type, profile, etc) by making this a dict and matching request
-    # properties with the key, e.g. target = {"*":{"target":PATTERN, "http_code": 302}, ...}
     target: sqlorm.Mapped[str] = sqlorm.mapped_column(
         default=None, doc="Pattern for target string generation.", nullable=True
     )
+    # Alternate targets selected by content negotiation, see rslv.lib_rslv.negotiate
+    targets: sqlorm.Mapped[typing.Optional[dict[str, typing.Any]]] = sqlorm.mapped_column(
+        type_=sqlalchemy.types.JSON,
+        nullable=True,
+        default=None,
+        doc="Alternate targets by name, selected by media type or profile.",
+    )
     http_code: sqlorm.Mapped[int] = sqlorm.mapped_column(
         default=302, doc="HTTP status code for response."
     )
@@ -93,8 +120,14 @@ class PidDefinition(Base):
         doc="Indicates this entry is a synonym for the referenced entry.",
     )
 
-    # Only allow unique combinations of scheme, group, and value
-    __table_args__ = (sqla.UniqueConstraint("scheme", "prefix", "value"),)
+    # All definition lookups are equality on scheme and prefix with either
+    # equality or an IN list on value. value_length is included so candidate
+    # values can be ordered by length from the index alone. The index is
+    # unique since value_length follows from value, so it also allows only
+    # one definition for each scheme, prefix, and value.
+    __table_args__ = (
+        sqla.Index("ix_piddef_lookup", "scheme", "prefix", "value", "value_length", unique=True),
+    )
 
     @sqlalchemy.orm.validates("scheme")
     def validate_scheme(self, key, scheme):
@@ -114,6 +147,56 @@ class PidDefinition(Base):
             raise ValueError("'/' is not allowed in prefix.")
         return prefix
 
+    # Fields of a definition in dumps, value_length is derived from value
+    DUMP_FIELDS = (
+        "uniq",
+        "scheme",
+        "prefix",
+        "value",
+        "splitter",
+        "pid_model",
+        "target",
+        "targets",
+        "http_code",
+        "canonical",
+        "properties",
+        "synonym_for",
+    )
+    # Dump fields that may change, the others identify the definition
+    UPDATE_FIELDS = DUMP_FIELDS[4:]
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """All fields of the definition, e.g. for a line of a catalog dump."""
+        return {name: getattr(self, name) for name in self.DUMP_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: typing.Mapping[str, typing.Any]) -> "PidDefinition":
+        """Create a definition from the fields of as_dict().
+
+        The definition is normalized, so records written with an
+        unnormalized uniq identify the same definition.
+        """
+        unknown = set(data) - set(cls.DUMP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown definition fields: {', '.join(sorted(unknown))}")
+        # Missing and null fields take the column defaults
+        return cls(**{k: v for k, v in data.items() if v is not None and k != "uniq"}).normalize()
+
+    def normalize(self) -> "PidDefinition":
+        """Set prefix and value as the scheme splitter matches them, and uniq from them.
+
+        Without a scheme, e.g. an update by uniq, only uniq is normalized.
+        """
+        if self.scheme is None:
+            if self.uniq is not None:
+                self.uniq = normalize_uniq(self.uniq)
+            return self
+        self.prefix, self.value = rslv.lib_rslv.splitters.definition_key(
+            self.scheme, self.prefix, self.value
+        )
+        self.uniq = calculate_definition_uniq(self.scheme, self.prefix, self.value)
+        return self
+
     def update(self, entry: "PidDefinition") -> int:
         n_updates = 0
         # uniq, scheme, prefix, and value can not be updated.
@@ -121,11 +204,14 @@ class PidDefinition(Base):
             self.splitter = entry.splitter
             n_updates += 1
         if entry.pid_model is not None and entry.pid_model != self.pid_model:
-            self.pid_mode = entry.pid_model
+            self.pid_model = entry.pid_model
             n_updates += 1
         if entry.target is not None and entry.target != self.target:
             self.target = entry.target
             n_updates += 1
+        if entry.targets is not None and entry.targets != self.targets:
+            self.targets = entry.targets
+            n_updates += 1
         if entry.http_code is not None and entry.http_code != self.http_code:
             self.http_code = entry.http_code
             n_updates += 1
@@ -140,6 +226,20 @@ class PidDefinition(Base):
             n_updates += 1
         return n_updates
 
+    def replace(self, entry: "PidDefinition") -> int:
+        """Like update, but fields that are None in entry are reset to their default."""
+        n_updates = 0
+        for name in self.UPDATE_FIELDS:
+            value = getattr(entry, name)
+            if value is None:
+                default = self.__table__.c[name].default
+                if default is not None and default.is_scalar:
+                    value = default.arg
+            if value != getattr(self, name):
+                setattr(self, name, value)
+                n_updates += 1
+        return n_updates
+
 
 class ConfigMeta(Base):
     __tablename__ = "piddef_meta"
@@ -157,6 +257,78 @@ class ConfigMeta(Base):
     description: sqlorm.Mapped[str] = sqlorm.mapped_column(
         nullable=True, doc="Human readable description of this configuration."
     )
+    schema_version: sqlorm.Mapped[int] = sqlorm.mapped_column(
+        default=0, server_default="0", doc="Version of the database schema."
+    )
+    version: sqlorm.Mapped[int] = sqlorm.mapped_column(
+        default=0, server_default="0", doc="Incremented on every change to definitions."
+    )
+
+
+class PidPrefixStats(Base):
+    """Summary of the definitions sharing a scheme and prefix.
+
+    Maintained as definitions are added and deleted, and used to limit the
+    value lengths probed when matching identifiers under the prefix.
+    """
+
+    __tablename__ = "piddef_stats"
+
+    scheme: sqlorm.Mapped[str] = sqlorm.mapped_column(primary_key=True)
+    prefix: sqlorm.Mapped[str] = sqlorm.mapped_column(primary_key=True)
+    definitions: sqlorm.Mapped[int] = sqlorm.mapped_column(
+        doc="Number of definitions with this scheme and prefix."
+    )
+    values: sqlorm.Mapped[int] = sqlorm.mapped_column(
+        doc="Number of those definitions with a value."
+    )
+    min_value_length: sqlorm.Mapped[typing.Optional[int]] = sqlorm.mapped_column(
+        doc="Shortest value length, None if there are no values."
+    )
+    max_value_length: sqlorm.Mapped[typing.Optional[int]] = sqlorm.mapped_column(
+        doc="Longest value length, None if there are no values."
+    )
+
+
+def _prefix_stats_select():
+    return sqlalchemy.select(
+        PidDefinition.scheme,
+        PidDefinition.prefix,
+        sqlalchemy.func.count().label("definitions"),
+        sqlalchemy.func.count(
+            sqlalchemy.case((PidDefinition.value_length > 0, 1))
+        ).label("values"),
+        sqlalchemy.func.min(
+            sqlalchemy.case((PidDefinition.value_length > 0, PidDefinition.value_length))
+        ).label("min_value_length"),
+        sqlalchemy.func.max(
+            sqlalchemy.case((PidDefinition.value_length > 0, PidDefinition.value_length))
+        ).label("max_value_length"),
+    ).group_by(PidDefinition.scheme, PidDefinition.prefix)
+
+
+def recompute_metadata(connection: sqlalchemy.engine.Connection):
+    """Recompute the prefix statistics and metadata from all definitions.
+
+    This scans the whole definition table. Changes made through
+    PidDefinitionCatalog maintain the metadata incrementally.
+    """
+    stats = PidPrefixStats.__table__
+    meta = ConfigMeta.__table__
+    connection.execute(stats.delete())
+    q = _prefix_stats_select()
+    connection.execute(stats.insert().from_select([c.name for c in q.selected_columns], q))
+    connection.execute(
+        meta.update()
+        .where(meta.c.key == 0)
+        .values(
+            max_value_length=sqlalchemy.select(
+                sqlalchemy.func.coalesce(sqlalchemy.func.max(stats.c.max_value_length), 0)
+            ).scalar_subquery(),
+            version=meta.c.version + 1,
+            updated=current_time(),
+        )
+    )
 
 
 class PidDefinitionCatalog:
@@ -166,14 +338,20 @@ class PidDefinitionCatalog:
     the identifier configuration details.
     """
 
-    def __init__(self, session: sqlorm.Session):
+    # Maximum number of uniq values in one IN list when prefetching definitions
+    PREFETCH_SIZE = 500
+
+    def __init__(self, session: sqlorm.Session, index=None):
         """
         Initial the config repository instance.
 
         Args:
             session: Returned by engine.connect()
+            index: Optional rslv.lib_rslv.pidindex.PidDefinitionIndex used
+                for definition lookups instead of querying the database.
         """
         self._session = session
+        self._index = index
         # Cache this value as it is used often. -1 indicates it is unset.
         self._cached_max_len = -1
 
@@ -187,29 +365,97 @@ class PidDefinitionCatalog:
 
         Returns: ConfigMeta record.
         """
-        meta = ConfigMeta(key=0, max_value_length=0, description=description)
+        meta = ConfigMeta(
+            key=0,
+            max_value_length=0,
+            description=description,
+            schema_version=SCHEMA_VERSION,
+        )
         self._session.add(meta)
         self._session.commit()
         return meta
 
     def refresh_metadata(self):
         """
-        Update the value length count.
+        Recompute all metadata from the definition records.
 
-        Computes and stores the maximum value length. Call this method
-        after altering any definition records.
+        Metadata is maintained as definitions are added, updated, or
+        deleted through this class, so this is only needed after the
+        definition table is altered by other means.
         """
-        max_len_q = sqlalchemy.select(
-            sqlalchemy.sql.expression.func.max(
-                sqlalchemy.sql.expression.func.char_length(PidDefinition.value)
+        recompute_metadata(self._session.connection())
+        self._session.commit()
+        self._cached_max_len = -1
+
+    def _definitions_changed(self, scheme: str, prefix: str):
+        """Update the stats of scheme, prefix and the metadata after a change.
+
+        Only the definitions under scheme and prefix are read, using the
+        lookup index. Changes are committed by the caller.
+        """
+        self._prefixes_changed([(scheme, prefix)])
+
+    def _prefixes_changed(self, pairs: typing.Collection[typing.Tuple[str, str]]):
+        """Update the stats of each (scheme, prefix) of pairs and the metadata once."""
+        conditions = [
+            sqlalchemy.and_(PidDefinition.scheme == scheme, PidDefinition.prefix == prefix)
+            for scheme, prefix in pairs
+        ]
+        stat_conditions = [
+            sqlalchemy.and_(PidPrefixStats.scheme == scheme, PidPrefixStats.prefix == prefix)
+            for scheme, prefix in pairs
+        ]
+        rows = {
+            (row.scheme, row.prefix): row
+            for row in self._session.execute(
+                _prefix_stats_select().where(sqlalchemy.or_(*conditions))
             )
-        )
-        result = self._session.execute(max_len_q).fetchone()[0]
+        }
+        existing = {
+            (stats.scheme, stats.prefix): stats
+            for stats in self._session.scalars(
+                sqlalchemy.select(PidPrefixStats).where(sqlalchemy.or_(*stat_conditions))
+            )
+        }
         meta = self._session.get(ConfigMeta, 0)
-        meta.max_value_length = result
+        longest = meta.max_value_length
+        # The overall maximum is only recomputed when a prefix holding it got shorter
+        shrunk = False
+        for scheme, prefix in pairs:
+            row = rows.get((scheme, prefix))
+            stats = existing.get((scheme, prefix))
+            old_max = stats.max_value_length if stats is not None else None
+            new_max = row.max_value_length if row is not None else None
+            if old_max is not None and old_max >= meta.max_value_length and (new_max or 0) < old_max:
+                shrunk = True
+            longest = max(longest, new_max or 0)
+            if row is None:
+                if stats is not None:
+                    self._session.delete(stats)
+                continue
+            if stats is None:
+                stats = PidPrefixStats(scheme=scheme, prefix=prefix)
+                self._session.add(stats)
+            stats.definitions = row.definitions
+            stats.values = row.values
+            stats.min_value_length = row.min_value_length
+            stats.max_value_length = row.max_value_length
+        self._session.flush()
+        if shrunk:
+            longest = self._session.execute(
+                sqlalchemy.select(
+                    sqlalchemy.func.coalesce(sqlalchemy.func.max(PidPrefixStats.max_value_length), 0)
+                )
+            ).scalar()
+        meta.max_value_length = longest
+        self._bump_version(meta)
+
+    def _bump_version(self, meta: typing.Optional[ConfigMeta] = None):
+        if meta is None:
+            meta = self._session.get(ConfigMeta, 0)
+        meta.version = ConfigMeta.version + 1
         meta.updated = current_time()
-        self._cached_max_len = result
-        self._session.commit()
+        self._cached_max_len = -1
 
     def get_metadata(self) -> dict[str, typing.Any]:
         meta = self._session.get(ConfigMeta, 0)
@@ -220,23 +466,39 @@ class PidDefinitionCatalog:
             "description": meta.description,
             "created": meta.created.replace(tzinfo=datetime.timezone.utc),
             "updated": m_updated,
+            "version": meta.version,
         }
 
+    def get_version(self) -> int:
+        """Change counter of the definitions, incremented by each add, update, and delete."""
+        return self._session.get(ConfigMeta, 0).version
+
     def get_max_value_length(self) -> int:
+        if self._index is not None:
+            return self._index.max_value_length
         if self._cached_max_len > 0:
             return self._cached_max_len
         meta = self._session.get(ConfigMeta, 0)
         self._cached_max_len = meta.max_value_length
         return self._cached_max_len
 
+    def get_prefix_stats(self, scheme: str, prefix: str) -> typing.Optional[PidPrefixStats]:
+        """Stats of the definitions with scheme and prefix, None if there are none."""
+        return self._session.get(PidPrefixStats, (scheme, prefix))
+
+    def has_definitions(self, scheme: str, prefix: str) -> bool:
+        """True if there are definitions with scheme and prefix."""
+        if self._index is not None:
+            return self._index.has_prefix(scheme, prefix)
+        return self.get_prefix_stats(scheme, prefix) is not None
+
     def get_by_uniq(self, uniq: str) -> typing.Optional[PidDefinition]:
         """
         Returns the definition matching the uniq value.
 
-        Note that records with no prefix or value entry have
-        an empty string, so the in the case of a record with
-        scheme=foo, and not prefix or value set, the uniq
-        value will be "foo:/".
+        Records with no value have no "/value" part, so in the case
+        of a record with scheme=foo, and no prefix or value set, the
+        uniq value will be "foo:". A trailing "/" is ignored.
 
         Args:
             uniq: (str) The uniq value to match (scheme:prefix/value)
@@ -244,13 +506,7 @@ class PidDefinitionCatalog:
         Returns:
             PidDefinition if found, otherwise None
         """
-        q = sqlalchemy.select(PidDefinition).where(PidDefinition.uniq == uniq)
-        result = self._session.execute(q)
-        try:
-            return result.fetchone()[0]
-        except TypeError:
-            pass
-        return None
+        return self._session.get(PidDefinition, normalize_uniq(uniq))
 
     def _get(
         self,
@@ -258,6 +514,10 @@ class PidDefinitionCatalog:
         prefix: typing.Optional[str] = None,
         value: typing.Optional[str] = None,
     ) -> typing.Optional[PidDefinition]:
+        if self._index is not None:
+            if value is None or value == "":
+                return self._index.get_exact(scheme, prefix, None)
+            return self._index.get_longest(scheme, prefix, value)
         # scheme and prefix are exact matches
         if (value is None or value == "") and (prefix is None or prefix == ""):
             q = sqlalchemy.select(PidDefinition).where(
@@ -288,10 +548,16 @@ class PidDefinitionCatalog:
                 pass
             return None
 
-        in_length_max = min(len(value), self.get_max_value_length())
+        # Only probe the value lengths present under scheme and prefix
+        stats = self.get_prefix_stats(scheme, prefix if prefix is not None else "")
+        if stats is None or stats.values == 0:
+            return None
+        in_length_max = min(len(value), stats.max_value_length)
         in_values = []
-        for i in range(in_length_max, 0, -1):
+        for i in range(in_length_max, stats.min_value_length - 1, -1):
             in_values.append(value[:i])
+        if len(in_values) == 0:
+            return None
         q = (
             sqlalchemy.select(PidDefinition)
             .where(
@@ -301,9 +567,8 @@ class PidDefinitionCatalog:
                     PidDefinition.value.in_(in_values),
                 )
             )
-            .order_by(
-                sqlalchemy.sql.expression.func.char_length(PidDefinition.value).desc()
-            )
+            .order_by(PidDefinition.value_length.desc())
+            .limit(1)
         )
         result = self._session.execute(q)
         try:
@@ -352,19 +617,18 @@ class PidDefinitionCatalog:
         if entry.synonym_for is None or not resolve_synonym:
             return entry
         synonym_parts = rslv.lib_rslv.split_identifier_string(entry.synonym_for)
-        _scheme = (
-            synonym_parts["scheme"] if synonym_parts["scheme"] is not None else scheme
-        )
-        _prefix = synonym_parts["prefix"] if synonym_parts["prefix"] != "" else prefix
-        _value = synonym_parts["value"] if synonym_parts["value"] is not None else value
+        _scheme = synonym_parts.scheme if synonym_parts.scheme is not None else scheme
+        _prefix = synonym_parts.prefix if synonym_parts.prefix != "" else prefix
+        _value = synonym_parts.value if synonym_parts.value is not None else value
         return self.get(_scheme, prefix=_prefix, value=_value)
 
     def add(self, entry: PidDefinition) -> str:
         """
         Add an entry to the repository database.
 
-        The entry must be unique otherwise it will fail with a
-        UniqueConstraint exception.
+        The entry must be unique otherwise it will fail with an
+        IntegrityError on the uniq primary key or the lookup index.
+        The entry is normalized first, see PidDefinition.normalize.
 
         Args:
             entry: A populated PidDefinition for storing in the database.
@@ -373,91 +637,227 @@ class PidDefinitionCatalog:
             str: The computed unique value
 
         """
+        entry.normalize()
         self._session.add(entry)
+        self._session.flush()
+        self._definitions_changed(entry.scheme, entry.prefix)
         self._session.commit()
         return entry.uniq
 
     def update(self, entry: PidDefinition) -> int:
-        existing_entry = self.get_by_uniq(entry.uniq)
-        existing_revision = existing_entry.properties.get("revision", 0)
-        new_revision = entry.properties.get("revision", 0)
+        existing_entry = self.get_by_uniq(entry.uniq if entry.scheme is None else entry.normalize().uniq)
+        if existing_entry is None:
+            raise ValueError(f"No existing record for: {entry.uniq}")
+        existing_revision = (existing_entry.properties or {}).get("revision", 0)
+        new_revision = (entry.properties or {}).get("revision", 0)
         if new_revision < existing_revision:
             raise ValueError(
                 f"Attempting to update a newer revision. Existing={existing_revision}, new={new_revision}"
             )
-        if existing_entry is None:
-            raise ValueError(f"No existing record for: {entry.uniq}")
         n_changes = existing_entry.update(entry)
         if n_changes > 0:
+            # scheme, prefix, and value are not updated, so stats are unchanged
+            self._bump_version()
             self._session.commit()
         return n_changes
 
-    def add_or_update(self, entry: PidDefinition) -> typing.Dict:
-        res = {
-            "uniq": "",
-            "n_changes": -1,
-        }
+    def delete(self, uniq: str) -> bool:
+        """Delete the definition with uniq, returning False if there is none."""
+        entry = self.get_by_uniq(uniq)
+        if entry is None:
+            return False
+        scheme = entry.scheme
+        prefix = entry.prefix
+        self._session.delete(entry)
+        self._session.flush()
+        self._definitions_changed(scheme, prefix)
+        self._session.commit()
+        return True
+
+    def _prefetch(self, uniqs: typing.Iterable[str]) -> typing.Dict[str, PidDefinition]:
+        """The existing definitions with uniq in uniqs, PREFETCH_SIZE per query."""
+        uniqs = list(dict.fromkeys(uniqs))
+        existing = {}
+        for i in range(0, len(uniqs), self.PREFETCH_SIZE):
+            q = sqlalchemy.select(PidDefinition).where(
+                PidDefinition.uniq.in_(uniqs[i:i + self.PREFETCH_SIZE])
+            )
+            existing.update((entry.uniq, entry) for entry in self._session.scalars(q))
+        return existing
+
+    def _upsert(
+        self,
+        entries: typing.Sequence[PidDefinition],
+        existing: typing.Dict[str, PidDefinition],
+        replace: bool,
+        changed: typing.Set[typing.Tuple[str, str]],
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Add or update entries in the session, collecting the affected (scheme, prefix) in changed."""
+        results = []
+        for entry in entries:
+            current = existing.get(entry.uniq)
+            if current is None:
+                self._session.add(entry)
+                existing[entry.uniq] = entry
+                changed.add((entry.scheme, entry.prefix or ""))
+                results.append({"uniq": entry.uniq, "n_changes": -1})
+                continue
+            current_revision = (current.properties or {}).get("revision", 0)
+            new_revision = (entry.properties or {}).get("revision", 0)
+            if new_revision < current_revision:
+                results.append({
+                    "uniq": entry.uniq,
+                    "n_changes": 0,
+                    "error": f"Attempting to update a newer revision. Existing={current_revision}, new={new_revision}",
+                })
+                continue
+            n_changes = current.replace(entry) if replace else current.update(entry)
+            results.append({"uniq": entry.uniq, "n_changes": n_changes})
+        return results
+
+    def _finish_batch(self, changed: typing.Set[typing.Tuple[str, str]], modified: bool):
+        """Write the session and the stats of changed, then commit."""
+        self._session.flush()
+        if changed:
+            # Stats of many prefixes are read in one query, chunked to bound its size
+            pairs = sorted(changed)
+            for i in range(0, len(pairs), self.PREFETCH_SIZE):
+                self._prefixes_changed(pairs[i:i + self.PREFETCH_SIZE])
+        elif modified:
+            self._bump_version()
+        self._session.commit()
+
+    def upsert_many(
+        self, entries: typing.Iterable[PidDefinition], replace: bool = False
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Add or update many definitions in one transaction.
+
+        Existing definitions are read in one query per PREFETCH_SIZE entries,
+        compared in memory, and the changes written together, with new rows
+        inserted in batches. Each entry is updated as by update(), or with
+        replace all of its fields are taken. An entry with a lower revision
+        property than the existing definition is not applied.
+
+        Returns a result per entry as from add_or_update(): n_changes is -1
+        for an added definition, and an "error" is included if not applied.
+        """
+        entries = [entry.normalize() for entry in entries]
+        existing = self._prefetch(entry.uniq for entry in entries)
+        changed = set()
         try:
-            res["uniq"] = self.add(entry)
-        except sqlalchemy.exc.IntegrityError:
+            results = self._upsert(entries, existing, replace, changed)
+            self._finish_batch(changed, any(r["n_changes"] != 0 for r in results))
+        except Exception:
             self._session.rollback()
-            entry.uniq = calculate_definition_uniq(
-                entry.scheme, entry.prefix, entry.value
-            )
-            res["uniq"] = entry.uniq
-            res["n_changes"] = self.update(entry)
+            raise
+        return results
+
+    def apply_batch(
+        self,
+        records: typing.Sequence[typing.Mapping[str, typing.Any]],
+        deletes: typing.Sequence[str] = (),
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Put the definitions of records and delete those with uniq in deletes.
+
+        Existing definitions take all the fields of their record, as
+        upsert_many with replace, and the batch is applied in one
+        transaction. Returns the results of the records.
+        """
+        entries = [PidDefinition.from_dict(record) for record in records]
+        deletes = [normalize_uniq(uniq) for uniq in deletes]
+        existing = self._prefetch([entry.uniq for entry in entries] + deletes)
+        changed = set()
+        try:
+            for uniq in deletes:
+                entry = existing.pop(uniq, None)
+                if entry is not None:
+                    changed.add((entry.scheme, entry.prefix))
+                    self._session.delete(entry)
+            results = self._upsert(entries, existing, True, changed)
+            self._finish_batch(changed, any(r["n_changes"] != 0 for r in results))
+        except Exception:
+            self._session.rollback()
+            raise
+        return results
+
+    def add_or_update(self, entry: PidDefinition) -> typing.Dict:
+        """Add entry or update the existing definition, see upsert_many.
+
+        Raises ValueError if the existing definition has a newer revision.
+        """
+        res = self.upsert_many([entry])[0]
+        if "error" in res:
+            raise ValueError(res.pop("error"))
         return res
 
     def parse(
-        self, pid_str: str, resolve_synonym: bool = True
-    ) -> typing.Tuple[dict, typing.Optional[PidDefinition]]:
-        parts = rslv.lib_rslv.split_identifier_string(pid_str)
-        parts["suffix"] = ""
+        self,
+        pid_str: str,
+        resolve_synonym: bool = True,
+        parts: typing.Optional[rslv.lib_rslv.ParsedIdentifier] = None,
+    ) -> typing.Tuple[rslv.lib_rslv.ParsedIdentifier, typing.Optional[PidDefinition]]:
+        """Split pid_str and find the best matching definition.
+
+        parts may be provided if pid_str has already been split.
+        """
+        if parts is None:
+            parts = rslv.lib_rslv.split_identifier_string(pid_str)
+        lookup = rslv.lib_rslv.splitters.scheme_splitter(parts.scheme).prepare(parts)
         pid_definition = self.get(
-            scheme=parts["scheme"],
-            prefix=parts["prefix"],
-            value=parts["value"],
+            scheme=lookup.scheme,
+            prefix=lookup.prefix,
+            value=lookup.value,
             resolve_synonym=resolve_synonym,
         )
         if pid_definition is None:
-            return parts, None
-        if pid_definition.splitter is not None:
-            # TODO: implement additional split
-            pass
+            return parts._replace(suffix=""), None
         # was_synonym = False
-        if parts["scheme"] != pid_definition.scheme:
-            # was_synonym = True
-            parts["scheme"] = pid_definition.scheme
+        scheme = pid_definition.scheme
+        prefix = parts.prefix
         if pid_definition.prefix is not None:
-            if parts["prefix"] != pid_definition.prefix:
-                # was_synonym = True
-                parts["prefix"] = pid_definition.prefix
+            # was_synonym = parts.prefix != pid_definition.prefix
+            prefix = pid_definition.prefix
 
         # Compute the suffix
-        _content = parts.get("content", None)
-        if _content is not None:
+        content = parts.content
+        suffix = ""
+        if content is not None:
             pd_value = "" if pid_definition.value is None else pid_definition.value
-            suffix_pos = pid_str.find(_content) + len(
+            suffix_pos = pid_str.find(content) + len(
                 f"{pid_definition.prefix}/{pd_value}"
             )
-            parts["suffix"] = pid_str[suffix_pos:]
-
-        # Hack alert - Optionally need to deal with the oddness of ARK identifiers ignoring hyphens.
-        if parts["scheme"] == "ark":
-            # Hyphen stripping for ARKs is optionally set at the definition level
-            # and defaults to True to match the legacy resolver behavior
-            strip_ark_hyphens = True
-            if pid_definition.properties is not None:
-                strip_ark_hyphens = pid_definition.properties.get("strip_hyphens", True)
-            if strip_ark_hyphens:
-                # remove hyphens from the content and value portions, but not from the query portion, if present...
-                parts["content"] = rslv.lib_rslv.remove_hyphens(parts["content"])
-                parts["value"] = rslv.lib_rslv.remove_hyphens(parts["value"])
-                parts["suffix"] = rslv.lib_rslv.remove_hyphens(parts["suffix"])
-        return parts, pid_definition
+            suffix = pid_str[suffix_pos:]
+        splitter = rslv.lib_rslv.splitters.definition_splitter(pid_definition)
+        return (
+            splitter.finish(
+                parts._replace(scheme=scheme, prefix=prefix, suffix=suffix),
+                pid_definition,
+            ),
+            pid_definition,
+        )
+
+    def iter_definitions(self, batch_size: int = 1000) -> typing.Iterator[PidDefinition]:
+        """All definitions in uniq (code point) order, fetched batch_size rows at a time.
+
+        Rows are streamed from a server side cursor where supported, so
+        memory use does not grow with the size of the catalog.
+        """
+        order = PidDefinition.uniq
+        if self._session.get_bind().dialect.name == "postgresql":
+            # Code point order, the same as for SQLite and comparing str in Python
+            order = PidDefinition.uniq.collate("C")
+        q = (
+            sqlalchemy.select(PidDefinition)
+            .order_by(order)
+            .execution_options(yield_per=batch_size)
+        )
+        for entry in self._session.scalars(q):
+            yield entry
+            # Loaded definitions are not needed again
+            self._session.expunge(entry)
 
     def list_schemes(self, valid_targets_only: bool = False):
-        q = sqlalchemy.select(PidDefinition.scheme).distinct(PidDefinition.scheme)
+        q = sqlalchemy.select(PidDefinition.scheme).distinct()
         if valid_targets_only:
             q = q.filter(
                 sqlalchemy.or_(
@@ -504,15 +904,25 @@ class PidDefinitionCatalog:
         return result
 
 
+# An engine, or a callable returning the engine to use for each read
+EngineSource = typing.Union[sqla.engine.Engine, typing.Callable[[], sqla.engine.Engine]]
+
+
+def engine_getter(engine: EngineSource) -> typing.Callable[[], sqla.engine.Engine]:
+    if isinstance(engine, sqla.engine.Engine):
+        return lambda: engine
+    return engine
+
+
 def get_session(engine):
     return sqlalchemy.orm.sessionmaker(bind=engine)()
 
 
 @contextlib.contextmanager
-def get_catalog(engine):
+def get_catalog(engine, index=None):
     session = get_session(engine)
     try:
-        yield PidDefinitionCatalog(session)
+        yield PidDefinitionCatalog(session, index=index)
     finally:
         session.close()
 
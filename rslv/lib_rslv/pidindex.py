@@ -0,0 +1,229 @@
+"""
+Read-only in-memory index of a definition catalog.
+
+The index is intended to be built once in a parent process and then shared
+by forked worker processes. All definitions are held in a few flat buffers
+(two bytes objects and two offset arrays) rather than as many small Python
+objects, so reference count updates in workers do not touch the pages
+holding the catalog and the memory stays shared copy-on-write.
+"""
+
+import array
+import functools
+import json
+import typing
+
+import sqlalchemy
+import sqlalchemy.orm as sqlorm
+import sqlalchemy.orm.instrumentation
+
+import rslv.lib_rslv.piddefine
+
+# Separator between the scheme, prefix, and value portions of an index key
+KEY_SEPARATOR = "\x1f"
+
+
+def index_key(scheme: str, prefix: typing.Optional[str], value: typing.Optional[str]) -> bytes:
+    p = prefix if prefix is not None else ""
+    v = value if value is not None else ""
+    return f"{scheme}{KEY_SEPARATOR}{p}{KEY_SEPARATOR}{v}".encode("utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def _definition_manager():
+    # Mappers are otherwise configured on first ORM query, which may not happen
+    # when definitions only come from the index.
+    sqlalchemy.orm.configure_mappers()
+    return sqlalchemy.orm.instrumentation.manager_of_class(
+        rslv.lib_rslv.piddefine.PidDefinition
+    )
+
+
+class PidDefinitionIndex:
+    """Sorted, immutable lookup table of PidDefinition records.
+
+    Keys are the utf-8 encoded scheme, prefix, and value joined by
+    KEY_SEPARATOR, concatenated in sorted order into a single bytes
+    object. Records are the JSON serialized definition columns,
+    concatenated in the same order. Lookups are a binary search over the
+    key offsets.
+    """
+
+    __slots__ = (
+        "_keys",
+        "_key_offsets",
+        "_records",
+        "_record_offsets",
+        "max_value_length",
+    )
+
+    def __init__(
+        self,
+        keys: bytes,
+        key_offsets: array.array,
+        records: bytes,
+        record_offsets: array.array,
+        max_value_length: int,
+    ):
+        self._keys = keys
+        self._key_offsets = key_offsets
+        self._records = records
+        self._record_offsets = record_offsets
+        self.max_value_length = max_value_length
+
+    @classmethod
+    def from_records(
+        cls, records: typing.Iterable[typing.Mapping[str, typing.Any]]
+    ) -> "PidDefinitionIndex":
+        """Build the index from mappings of PidDefinition column names to values."""
+        columns = [c.key for c in rslv.lib_rslv.piddefine.PidDefinition.__table__.columns]
+        entries = []
+        max_value_length = 0
+        for row in records:
+            record = {c: row[c] for c in columns}
+            entries.append(
+                (
+                    index_key(record["scheme"], record["prefix"], record["value"]),
+                    json.dumps(record, separators=(",", ":")).encode("utf-8"),
+                )
+            )
+            if record["value"] is not None:
+                max_value_length = max(max_value_length, len(record["value"]))
+        entries.sort(key=lambda e: e[0])
+        key_offsets = array.array("q", [0])
+        record_offsets = array.array("q", [0])
+        for key, record in entries:
+            key_offsets.append(key_offsets[-1] + len(key))
+            record_offsets.append(record_offsets[-1] + len(record))
+        return cls(
+            b"".join(e[0] for e in entries),
+            key_offsets,
+            b"".join(e[1] for e in entries),
+            record_offsets,
+            max_value_length,
+        )
+
+    @classmethod
+    def from_definitions(
+        cls, definitions: typing.Iterable[rslv.lib_rslv.piddefine.PidDefinition]
+    ) -> "PidDefinitionIndex":
+        return cls.from_records(d.__dict__ for d in definitions)
+
+    @classmethod
+    def from_session(cls, session: sqlorm.Session, yield_per: int = 1000) -> "PidDefinitionIndex":
+        """Build the index from all definitions in the catalog database.
+
+        Rows are read as plain column mappings since ORM instances are not needed.
+        """
+        q = sqlalchemy.select(rslv.lib_rslv.piddefine.PidDefinition.__table__).execution_options(
+            yield_per=yield_per
+        )
+        return cls.from_records(session.execute(q).mappings())
+
+    def __len__(self) -> int:
+        return len(self._key_offsets) - 1
+
+    def nbytes(self) -> int:
+        """Approximate size of the index buffers."""
+        return (
+            len(self._keys)
+            + len(self._records)
+            + self._key_offsets.itemsize * len(self._key_offsets)
+            + self._record_offsets.itemsize * len(self._record_offsets)
+        )
+
+    def _find(self, key: bytes) -> int:
+        offsets = self._key_offsets
+        keys = self._keys
+        lo = 0
+        hi = len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = keys[offsets[mid]:offsets[mid + 1]]
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Position of the first key not less than key."""
+        offsets = self._key_offsets
+        keys = self._keys
+        lo = 0
+        hi = len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[offsets[mid]:offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def has_prefix(self, scheme: str, prefix: typing.Optional[str]) -> bool:
+        """True if there are definitions with scheme and prefix."""
+        base = index_key(scheme, prefix, None)
+        i = self._lower_bound(base)
+        if i >= len(self):
+            return False
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]].startswith(base)
+
+    def _record(self, i: int) -> rslv.lib_rslv.piddefine.PidDefinition:
+        record = json.loads(
+            self._records[self._record_offsets[i]:self._record_offsets[i + 1]]
+        )
+        # Records were validated when stored, so populate the instance as the
+        # ORM does when loading a row rather than through __init__, which
+        # runs validators and attribute events for every column.
+        definition = _definition_manager().new_instance()
+        definition.__dict__.update(record)
+        return definition
+
+    def definitions(
+        self, start: int = 0, stop: typing.Optional[int] = None
+    ) -> typing.Iterator[rslv.lib_rslv.piddefine.PidDefinition]:
+        """Iterate over definitions in key order, optionally over a range of positions."""
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for i in range(start, stop):
+            yield self._record(i)
+
+    def get_exact(
+        self,
+        scheme: str,
+        prefix: typing.Optional[str] = None,
+        value: typing.Optional[str] = None,
+    ) -> typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]:
+        """Return the definition exactly matching scheme, prefix, and value."""
+        i = self._find(index_key(scheme, prefix, value))
+        if i < 0:
+            return None
+        return self._record(i)
+
+    def get_longest(
+        self,
+        scheme: str,
+        prefix: str,
+        value: str,
+        max_value_length: typing.Optional[int] = None,
+    ) -> typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]:
+        """Return the definition with the longest value matching the start of value."""
+        if max_value_length is None:
+            max_value_length = self.max_value_length
+        base = index_key(scheme, prefix, None)
+        for i in range(min(len(value), max_value_length), 0, -1):
+            j = self._find(base + value[:i].encode("utf-8"))
+            if j >= 0:
+                return self._record(j)
+        return None
+
+
+def load_index(engine: sqlalchemy.engine.Engine) -> PidDefinitionIndex:
+    """Load the index from the catalog database at engine."""
+    session = rslv.lib_rslv.piddefine.get_session(engine)
+    try:
+        return PidDefinitionIndex.from_session(session)
+    finally:
+        session.close()
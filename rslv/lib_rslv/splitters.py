@@ -0,0 +1,222 @@
+"""
+Scheme specific handling of split identifiers.
+
+split_identifier_string splits every identifier the same way. A splitter
+adjusts the parts for a particular scheme at two points while parsing:
+
+- prepare() before the definition lookup, returning the parts used to find
+  the matching definition. The splitter is chosen by the identifier scheme.
+- finish() after a definition is matched and the suffix computed,
+  returning the parts used for the response and templates. The splitter
+  named by PidDefinition.splitter is used, otherwise the one for the
+  definition scheme.
+
+Splitters are referenced by a registered name (see SPLITTERS) or by the
+dotted name of a class or callable returning a splitter. Instances are
+created once and cached, so no imports happen per request. A definition
+naming a splitter that can not be loaded is logged and parsed with the
+splitter for its scheme.
+
+Where prepare() normalizes the prefix or value, e.g. lower casing DOIs,
+definition_key() applies the same to definitions as they are stored so
+that lookups match them.
+
+The urn splitter is registered but not used for the urn scheme unless
+enabled with set_scheme_splitters(), e.g. from the scheme_splitters setting,
+since it changes which definitions legacy URN identifiers match.
+"""
+
+import functools
+import logging
+import typing
+
+import rslv.lib_rslv
+
+DEFAULT_SPLITTER = "default"
+
+
+def get_logger():
+    return logging.getLogger("rslv.splitters")
+
+
+class Splitter:
+    """Base splitter that leaves parts unchanged."""
+
+    def definition_key(
+        self, prefix: typing.Optional[str], value: typing.Optional[str]
+    ) -> typing.Tuple[typing.Optional[str], typing.Optional[str]]:
+        """The prefix and value of a definition as prepare() makes them for matching."""
+        return prefix, value
+
+    def prepare(self, parts: rslv.lib_rslv.ParsedIdentifier) -> rslv.lib_rslv.ParsedIdentifier:
+        return parts
+
+    def finish(
+        self, parts: rslv.lib_rslv.ParsedIdentifier, definition
+    ) -> rslv.lib_rslv.ParsedIdentifier:
+        return parts
+
+
+class ArkSplitter(Splitter):
+    """ARKs ignore hyphens in the content.
+
+    Hyphens are removed from the content, value, and suffix but not from a
+    query string. This is set per definition by the strip_hyphens property
+    and defaults to True to match the legacy resolver behavior.
+    """
+
+    def finish(
+        self, parts: rslv.lib_rslv.ParsedIdentifier, definition
+    ) -> rslv.lib_rslv.ParsedIdentifier:
+        if definition.properties is not None and not definition.properties.get(
+            "strip_hyphens", True
+        ):
+            return parts
+        return parts._replace(
+            content=rslv.lib_rslv.remove_hyphens(parts.content),
+            value=rslv.lib_rslv.remove_hyphens(parts.value),
+            suffix=rslv.lib_rslv.remove_hyphens(parts.suffix),
+        )
+
+
+class DoiSplitter(Splitter):
+    """DOI names are case insensitive.
+
+    The prefix and value are lower cased for matching, and DOI definitions
+    are stored in lower case. The parts returned keep the case of the
+    requested identifier.
+    """
+
+    def definition_key(self, prefix, value):
+        return (
+            prefix.lower() if prefix is not None else None,
+            value.lower() if value is not None else None,
+        )
+
+    def prepare(self, parts: rslv.lib_rslv.ParsedIdentifier) -> rslv.lib_rslv.ParsedIdentifier:
+        return parts._replace(
+            prefix=parts.prefix.lower() if parts.prefix is not None else None,
+            value=parts.value.lower() if parts.value is not None else None,
+        )
+
+
+class UrnSplitter(Splitter):
+    """URNs are urn:<NID>:<NSS> rather than scheme:prefix/value.
+
+    The namespace identifier (NID) is the prefix, lower cased as it is case
+    insensitive, and the namespace specific string (NSS) is the value.
+    Definitions stored by the default split, e.g. prefix "nbn:nl:ui", are
+    keyed as prefix "nbn" and value "nl:ui".
+    """
+
+    def _nid_nss(self, content: typing.Optional[str]):
+        if content is None:
+            return None, None
+        nid, _, nss = content.partition(":")
+        return nid, nss if nss != "" else None
+
+    def definition_key(self, prefix, value):
+        if prefix is None:
+            return None, value
+        nid, _, nss = prefix.partition(":")
+        if nss != "":
+            value = nss if value in (None, "") else f"{nss}/{value}"
+        return nid.lower(), value
+
+    def prepare(self, parts: rslv.lib_rslv.ParsedIdentifier) -> rslv.lib_rslv.ParsedIdentifier:
+        nid, nss = self._nid_nss(parts.content)
+        if nid is None:
+            return parts
+        return parts._replace(prefix=nid.lower(), value=nss)
+
+    def finish(
+        self, parts: rslv.lib_rslv.ParsedIdentifier, definition
+    ) -> rslv.lib_rslv.ParsedIdentifier:
+        _, nss = self._nid_nss(parts.content)
+        return parts._replace(value=nss)
+
+
+# Registered splitters by name
+SPLITTERS: typing.Dict[str, typing.Union[str, Splitter]] = {
+    DEFAULT_SPLITTER: Splitter(),
+    "ark": ArkSplitter(),
+    "doi": DoiSplitter(),
+    "urn": UrnSplitter(),
+}
+
+# Name of the splitter used for identifiers and definitions of a scheme
+SCHEME_SPLITTERS: typing.Dict[str, str] = {
+    "ark": "ark",
+    "doi": "doi",
+}
+
+
+def register_splitter(
+    name: str, splitter: typing.Union[str, Splitter], schemes: typing.Iterable[str] = ()
+):
+    """Register splitter, an instance or dotted name, as name and the default for schemes."""
+    SPLITTERS[name] = splitter
+    for scheme in schemes:
+        SCHEME_SPLITTERS[scheme] = name
+    get_splitter.cache_clear()
+    scheme_splitter.cache_clear()
+    _named_splitter.cache_clear()
+
+
+@functools.lru_cache(maxsize=128)
+def get_splitter(name: typing.Optional[str]) -> Splitter:
+    """Return the splitter registered as name or loaded from the dotted name."""
+    if name is None or name == "":
+        name = DEFAULT_SPLITTER
+    splitter = SPLITTERS.get(name, name)
+    if isinstance(splitter, str):
+        if "." not in splitter:
+            raise ValueError(f"Unknown splitter: {name}")
+        try:
+            splitter = rslv.lib_rslv.load_parser(splitter)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Unable to load splitter {name}: {e}") from e
+        if isinstance(splitter, type) or not hasattr(splitter, "prepare"):
+            splitter = splitter()
+    return splitter
+
+
+@functools.lru_cache(maxsize=128)
+def scheme_splitter(scheme: typing.Optional[str]) -> Splitter:
+    return get_splitter(SCHEME_SPLITTERS.get(scheme, DEFAULT_SPLITTER))
+
+
+@functools.lru_cache(maxsize=128)
+def _named_splitter(name: str, scheme: typing.Optional[str]) -> Splitter:
+    try:
+        return get_splitter(name)
+    except ValueError as e:
+        # Cached, so logged once rather than failing every request for the definition
+        get_logger().error("%s, using the splitter for scheme %s", e, scheme)
+        return scheme_splitter(scheme)
+
+
+def definition_splitter(definition) -> Splitter:
+    """The splitter named by definition, or for its scheme if not set or not loadable."""
+    if definition.splitter is not None and definition.splitter != "":
+        return _named_splitter(definition.splitter, definition.scheme)
+    return scheme_splitter(definition.scheme)
+
+
+def definition_key(
+    scheme: typing.Optional[str], prefix: typing.Optional[str], value: typing.Optional[str]
+) -> typing.Tuple[typing.Optional[str], typing.Optional[str]]:
+    """The prefix and value of a definition of scheme as stored for matching."""
+    return scheme_splitter(scheme).definition_key(prefix, value)
+
+
+def set_scheme_splitters(splitters: typing.Mapping[str, str]):
+    """Use the splitters registered by name for schemes, e.g. {"urn": "urn"}.
+
+    Splitters are process wide, as are the definition keys they imply.
+    """
+    for scheme, name in splitters.items():
+        get_splitter(name)
+        SCHEME_SPLITTERS[scheme] = name
+    scheme_splitter.cache_clear()
+    _named_splitter.cache_clear()
@@ -8,11 +8,18 @@ Borrowed various pieces from:
 
 import json
 import logging
+import random
 import sys
+import threading
 import time
+import typing
 import fastapi
 import starlette.background
 import starlette.middleware.base
+import starlette.requests
+
+import rslv.health
+import rslv.metrics
 
 
 class JsonFormatter(logging.Formatter):
@@ -43,21 +50,190 @@ class JsonFormatter(logging.Formatter):
         if hasattr(record, "extra_info"):
             res["req"] = (record.extra_info["req"],)
             res["res"] = record.extra_info["res"]
+        if hasattr(record, "rollup"):
+            res["rollup"] = record.rollup
+        if hasattr(record, "top"):
+            res["top"] = record.top
         return json.dumps(res)
 
 
+def forwarded_for(conn: starlette.requests.HTTPConnection) -> typing.Optional[str]:
+    """The forward or x-forwarded-for header of a request, if any."""
+    return conn.headers.get("forward", conn.headers.get("x-forwarded-for", None))
+
+
+def client_key(conn: starlette.requests.HTTPConnection, trusted_proxies: int = 0) -> str:
+    """Address identifying the client of a request.
+
+    With trusted_proxies in front of the service, each appending the address
+    it received the request from to the forwarded header, the address added
+    by the outermost of them is used. Entries to the left of it are set by
+    the client and can not be trusted.
+    """
+    if trusted_proxies > 0:
+        fwd = forwarded_for(conn)
+        if fwd:
+            addresses = [a.strip() for a in fwd.split(",")]
+            return addresses[-min(trusted_proxies, len(addresses))]
+    if conn.client is None:
+        return ""
+    return conn.client.host
+
+
+class LogSampler:
+    """Decides which responses are written to the access log.
+
+    rates maps a status code (e.g. "404") or status class (e.g. "3xx") to
+    the fraction of responses kept. Responses without a rate are all kept.
+    """
+
+    def __init__(self, rates: typing.Optional[typing.Mapping[str, float]] = None):
+        self.rates = {str(k).lower(): float(v) for k, v in (rates or {}).items()}
+        self.kept = 0
+        self.dropped = 0
+
+    def keep(self, status_code: int) -> bool:
+        code = str(status_code)
+        rate = self.rates.get(code, self.rates.get(f"{code[0]}xx", 1.0))
+        if rate >= 1.0 or random.random() < rate:
+            self.kept += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {"kept": self.kept, "dropped": self.dropped}
+
+
+class LogAggregator:
+    """Periodic rollups of request counts and latency by scheme, prefix, and status.
+
+    Latency percentiles are computed from a reservoir sample of at most
+    reservoir_size requests per group. Requests beyond max_groups distinct
+    groups in an interval are counted under scheme and prefix "*".
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        interval: float = 60.0,
+        max_groups: int = 10000,
+        reservoir_size: int = 1000,
+    ):
+        self.logger = logger
+        self.interval = interval
+        self.max_groups = max_groups
+        self.reservoir_size = reservoir_size
+        # (scheme, prefix, status_code) -> [count, total latency, max latency, latency sample]
+        self._groups: typing.Dict[typing.Tuple[str, str, int], list] = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def add(self, scheme: str, prefix: str, status_code: int, latency: float):
+        key = (scheme, prefix, status_code)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                if len(self._groups) >= self.max_groups:
+                    key = ("*", "*", status_code)
+                    group = self._groups.get(key)
+                if group is None:
+                    group = [0, 0.0, 0.0, []]
+                    self._groups[key] = group
+            group[0] += 1
+            group[1] += latency
+            group[2] = max(group[2], latency)
+            sample = group[3]
+            if len(sample) < self.reservoir_size:
+                sample.append(latency)
+            else:
+                i = random.randrange(group[0])
+                if i < self.reservoir_size:
+                    sample[i] = latency
+
+    def rollup(self) -> typing.Dict[str, typing.Any]:
+        """Summary of the requests since the last rollup, resetting the counts."""
+        now = time.time()
+        with self._lock:
+            groups = self._groups
+            started = self._started
+            self._groups = {}
+            self._started = now
+        rows = []
+        for (scheme, prefix, status_code), (count, total, longest, sample) in sorted(
+            groups.items(), key=lambda item: -item[1][0]
+        ):
+            sample.sort()
+            rows.append({
+                "scheme": scheme,
+                "prefix": prefix,
+                "status_code": status_code,
+                "count": count,
+                "latency": {
+                    "mean": total / count,
+                    "p50": rslv.metrics.percentile(sample, 50),
+                    "p90": rslv.metrics.percentile(sample, 90),
+                    "p99": rslv.metrics.percentile(sample, 99),
+                    "max": longest,
+                },
+            })
+        return {
+            "start": started,
+            "seconds": now - started,
+            "requests": sum(row["count"] for row in rows),
+            "groups": rows,
+        }
+
+    def emit(self):
+        rollup = self.rollup()
+        if rollup["requests"] > 0:
+            self.logger.info(f"rollup {rollup['requests']} requests", extra={"rollup": rollup})
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.emit()
+
+    def start(self):
+        """Start a thread emitting a rollup every interval seconds."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rslv-logrollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and emit the requests since the last rollup."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.emit()
+
+
 class LogMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
+    """Writes an access log line per request.
+
+    With a sampler, only the responses it keeps are logged. With an
+    aggregator, every request is also added to the periodic rollups,
+    grouped by the scheme and prefix of the matched definition that the
+    resolver records in request.state.match. Health and readiness probes
+    are not logged or aggregated.
+    """
+
     def __init__(self, *args, **kwargs):
         self.logger = kwargs.pop("logger")
+        self.sampler: typing.Optional[LogSampler] = kwargs.pop("sampler", None)
+        self.aggregator: typing.Optional[LogAggregator] = kwargs.pop("aggregator", None)
         super().__init__(*args, **kwargs)
 
     def get_extra_info(self, request: fastapi.Request, response: fastapi.Response):
-        fwd = request.headers.get(
-            "forward", request.headers.get("x-forwarded-for", None)
-        )
+        fwd = forwarded_for(request)
         return {
             "req": {
                 "url": request.url.path,
+                "query": request.url.query,
+                # Distinguishes a bare "?", an inflection request, from no query
+                "has_query": "?" in str(request.url),
                 "headers": {
                     "host": request.headers["host"],
                     "user_agent": request.headers["user-agent"],
@@ -80,7 +256,15 @@ class LogMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
         )
 
     async def dispatch(self, request, call_next):
+        if request.url.path in rslv.health.PROBE_PATHS:
+            return await call_next(request)
+        t0 = time.perf_counter()
         response = await call_next(request)
+        if self.aggregator is not None:
+            scheme, prefix = getattr(request.state, "match", None) or ("", "")
+            self.aggregator.add(scheme, prefix, response.status_code, time.perf_counter() - t0)
+        if self.sampler is not None and not self.sampler.keep(response.status_code):
+            return response
         response.background = starlette.background.BackgroundTask(
             self.write_log_data, request, response
         )
@@ -0,0 +1,131 @@
+"""
+In-process metrics for the resolver service.
+
+Components register a collector, a callable returning a JSON serializable
+dict, under a name in the Collectors of their app (app.state.metrics). The
+collected values are exposed by the service at /.metrics. Collectors are only
+evaluated when metrics are requested, so registering one adds no per-request
+cost.
+"""
+
+import math
+import threading
+import typing
+
+Collector = typing.Callable[[], typing.Dict[str, typing.Any]]
+
+
+class Collectors:
+    """Named metrics collectors of one application."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors: typing.Dict[str, Collector] = {}
+
+    def register(self, name: str, collector: Collector) -> None:
+        """Register (or replace) the collector reporting metrics under name."""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def collect(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Evaluate all registered collectors."""
+        with self._lock:
+            collectors = list(self._collectors.items())
+        return {name: collector() for name, collector in collectors}
+
+
+def lru_cache_stats(cached_function) -> typing.Dict[str, typing.Any]:
+    """Summarize the cache_info() of a functools.lru_cache wrapped callable."""
+    info = cached_function.cache_info()
+    n_requests = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_ratio": info.hits / n_requests if n_requests > 0 else 0.0,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+    }
+
+
+def percentile(ordered: typing.Sequence[float], p: float) -> float:
+    """Nearest rank percentile of an ordered sequence."""
+    if len(ordered) == 0:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Histogram:
+    """Thread safe histogram of observations over fixed bucket upper bounds.
+
+    Percentiles are estimated as the upper bound of the bucket containing
+    the requested rank, which is adequate for spotting queueing.
+    """
+
+    # Upper bounds in seconds
+    DEFAULT_BOUNDS = (
+        0.0001,
+        0.0005,
+        0.001,
+        0.005,
+        0.01,
+        0.05,
+        0.1,
+        0.5,
+        1.0,
+        5.0,
+        10.0,
+        30.0,
+    )
+
+    def __init__(self, bounds: typing.Optional[typing.Sequence[float]] = None):
+        self.bounds = tuple(self.DEFAULT_BOUNDS if bounds is None else bounds)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        n = len(self.bounds)
+        while i < n and value > self.bounds[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p: float) -> float:
+        """Estimated value at percentile p (0-100)."""
+        if self.count == 0:
+            return 0.0
+        rank = p / 100.0 * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= rank and c > 0:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                return self.max
+        return self.max
+
+    def summary(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count > 0 else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
@@ -0,0 +1,176 @@
+"""
+Per client rate limiting and admission control.
+
+RateLimiter keeps a token bucket per client for each configured
+path prefix. A bucket holds up to burst tokens and is refilled at rate
+tokens per second; each request takes one token, and a request finding
+the bucket empty is answered with 429 and a Retry-After header giving the
+seconds until a token is available. The longest configured prefix
+matching the request path applies, so e.g. /.info may be limited
+separately from resolve requests under /.
+
+Bucket tables are bounded. Buckets idle long enough to have refilled are
+the same as new ones and are evicted periodically, and when a table is
+full the least recently used half is dropped.
+
+A global cap on the number of requests in progress sheds load with 503
+before queues build up and latency collapses for everyone.
+
+Health and readiness probes are neither limited nor counted, so a load
+balancer probing from one address does not see a busy worker as dead.
+
+State is per worker process, so the effective limits with "rslv serve"
+are multiplied by the number of workers.
+"""
+
+import math
+import time
+import typing
+
+import starlette.requests
+import starlette.responses
+import starlette.types
+
+import rslv.health
+import rslv.log_middleware
+
+
+class TokenBuckets:
+    """Token buckets by client key, all with the same rate and burst."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_clients: int = 100000,
+        evict_interval: float = 60.0,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self.evict_interval = evict_interval
+        # key -> [tokens, time of last update]
+        self._buckets: typing.Dict[str, typing.List[float]] = {}
+        self._next_evict = 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, now: typing.Optional[float] = None) -> float:
+        """Take a token for key, returns 0 if admitted or the seconds until a token is available."""
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_evict:
+            self.evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self.evict(now, force=True)
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1.0 - bucket[0]) / self.rate
+
+    def evict(self, now: float, force: bool = False):
+        """Drop buckets that have refilled, and if force and still full the least recently used half."""
+        self._next_evict = now + self.evict_interval
+        if self.rate > 0:
+            refill = self.burst / self.rate
+            self._buckets = {k: b for k, b in self._buckets.items() if now - b[1] < refill}
+        if force and len(self._buckets) >= self.max_clients:
+            recent = sorted(self._buckets.items(), key=lambda item: item[1][1])
+            self._buckets = dict(recent[len(recent) // 2:])
+
+
+class RateLimiter:
+    """Token buckets by path prefix and the count of requests in progress."""
+
+    def __init__(
+        self,
+        limits: typing.Optional[typing.Mapping[str, typing.Tuple[float, float]]] = None,
+        max_concurrent: int = 0,
+        trusted_proxies: int = 0,
+        max_clients: int = 100000,
+    ):
+        # (prefix, buckets), longest prefix first
+        self.buckets = [
+            (prefix, TokenBuckets(rate, burst, max_clients=max_clients))
+            for prefix, (rate, burst) in sorted(
+                (limits or {}).items(), key=lambda item: len(item[0]), reverse=True
+            )
+        ]
+        self.max_concurrent = max_concurrent
+        self.trusted_proxies = trusted_proxies
+        self.in_flight = 0
+        self.limited = 0
+        self.shed = 0
+
+    def buckets_for(self, path: str) -> typing.Optional[TokenBuckets]:
+        for prefix, buckets in self.buckets:
+            if path.startswith(prefix):
+                return buckets
+        return None
+
+    def check(self, scope: starlette.types.Scope) -> typing.Optional[starlette.responses.Response]:
+        """The response rejecting a request, or None if it is admitted."""
+        if scope["path"] in rslv.health.PROBE_PATHS:
+            return None
+        if self.max_concurrent > 0 and self.in_flight >= self.max_concurrent:
+            self.shed += 1
+            return starlette.responses.JSONResponse(
+                {"error": "Service is busy"}, status_code=503, headers={"Retry-After": "1"}
+            )
+        buckets = self.buckets_for(scope["path"])
+        if buckets is None:
+            return None
+        key = rslv.log_middleware.client_key(
+            starlette.requests.HTTPConnection(scope), trusted_proxies=self.trusted_proxies
+        )
+        wait = buckets.take(key)
+        if wait == 0:
+            return None
+        self.limited += 1
+        retry_after = "3600" if math.isinf(wait) else str(max(1, math.ceil(wait)))
+        return starlette.responses.JSONResponse(
+            {"error": "Too many requests"}, status_code=429, headers={"Retry-After": retry_after}
+        )
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "in_flight": self.in_flight,
+            "limited": self.limited,
+            "shed": self.shed,
+            "clients": {prefix: len(buckets) for prefix, buckets in self.buckets},
+        }
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: starlette.types.ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        scope: starlette.types.Scope,
+        receive: starlette.types.Receive,
+        send: starlette.types.Send,
+    ):
+        if scope["type"] != "http" or scope["path"] in rslv.health.PROBE_PATHS:
+            await self.app(scope, receive, send)
+            return
+        response = self.limiter.check(scope)
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        self.limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.in_flight -= 1
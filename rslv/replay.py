@@ -0,0 +1,208 @@
+"""
+Replay JSON-lines access logs written by rslv.log_middleware against a service.
+
+Requests are sent either to a running instance at a base URL or in-process
+to the ASGI app. They may be sent as fast as possible with a fixed number
+of concurrent clients, or following the original timing of the log
+(optionally sped up), in which case concurrency bounds the number of
+requests in flight.
+
+httpx is required.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import datetime
+import json
+import time
+import typing
+
+import rslv.metrics
+
+TIMING_FAST = "fast"
+TIMING_ORIGINAL = "original"
+
+# Headers recorded in the access log and the request header they are sent as
+LOGGED_HEADERS = {
+    "accept": "accept",
+    "user_agent": "user-agent",
+}
+
+
+@dataclasses.dataclass
+class ReplayRequest:
+    method: str
+    url: str
+    headers: typing.Dict[str, str]
+    # Seconds since epoch of the original request, if known
+    t: typing.Optional[float] = None
+
+
+@dataclasses.dataclass
+class ReplayResult:
+    status: typing.Union[int, str]
+    latency: float
+
+
+def parse_log_time(value: typing.Optional[str]) -> typing.Optional[float]:
+    if value is None:
+        return None
+    try:
+        ts = datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        return None
+    return ts.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def parse_log_line(line: str) -> typing.Optional[ReplayRequest]:
+    """Parse an access log line to a ReplayRequest, None if not an access record."""
+    line = line.strip()
+    if line == "":
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    req = record.get("req")
+    # Older log lines wrote req as a single element list
+    if isinstance(req, list):
+        req = req[0] if len(req) > 0 else None
+    if not isinstance(req, dict) or "url" not in req:
+        return None
+    url = req["url"]
+    query = req.get("query")
+    # An inflection request ending with a bare "?" has an empty query
+    if query or req.get("has_query"):
+        url = f"{url}?{query or ''}"
+    headers = {}
+    for k, header in LOGGED_HEADERS.items():
+        v = req.get("headers", {}).get(k)
+        if v is not None:
+            headers[header] = v
+    return ReplayRequest(
+        method=req.get("method", "GET"),
+        url=url,
+        headers=headers,
+        t=parse_log_time(record.get("t")),
+    )
+
+
+def read_access_log(
+    lines: typing.Iterable[str], limit: typing.Optional[int] = None
+) -> typing.List[ReplayRequest]:
+    requests = []
+    for line in lines:
+        request = parse_log_line(line)
+        if request is None:
+            continue
+        requests.append(request)
+        if limit is not None and len(requests) >= limit:
+            break
+    return requests
+
+
+def summarize(results: typing.List[ReplayResult], duration: float) -> typing.Dict[str, typing.Any]:
+    latencies = sorted(r.latency for r in results)
+    statuses = collections.Counter(str(r.status) for r in results)
+    return {
+        "requests": len(results),
+        "duration": duration,
+        "throughput": len(results) / duration if duration > 0 else 0.0,
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": rslv.metrics.percentile(latencies, 50),
+            "p90": rslv.metrics.percentile(latencies, 90),
+            "p99": rslv.metrics.percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "status": dict(sorted(statuses.items())),
+    }
+
+
+async def send(client, request: ReplayRequest) -> ReplayResult:
+    t0 = time.perf_counter()
+    try:
+        response = await client.request(
+            request.method, request.url, headers=request.headers
+        )
+        status = response.status_code
+    except Exception as e:
+        status = e.__class__.__name__
+    return ReplayResult(status=status, latency=time.perf_counter() - t0)
+
+
+async def replay(
+    client,
+    requests: typing.List[ReplayRequest],
+    concurrency: int = 10,
+    timing: str = TIMING_FAST,
+    speed: float = 1.0,
+) -> typing.Dict[str, typing.Any]:
+    """Send requests using the httpx.AsyncClient client and summarize the results."""
+    results: typing.List[ReplayResult] = []
+    t_start = time.perf_counter()
+    if timing == TIMING_ORIGINAL:
+        semaphore = asyncio.Semaphore(concurrency)
+        times = [r.t for r in requests if r.t is not None]
+        t0 = min(times) if times else 0.0
+
+        async def timed(request: ReplayRequest):
+            async with semaphore:
+                results.append(await send(client, request))
+
+        tasks = []
+        for request in requests:
+            if request.t is not None:
+                delay = (request.t - t0) / speed - (time.perf_counter() - t_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(timed(request)))
+        await asyncio.gather(*tasks)
+    else:
+        queue = collections.deque(requests)
+
+        async def worker():
+            while queue:
+                results.append(await send(client, queue.popleft()))
+
+        await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    return summarize(results, time.perf_counter() - t_start)
+
+
+def create_client(base_url: typing.Optional[str] = None, app=None, concurrency: int = 10):
+    """Create an httpx.AsyncClient for a running instance or an in-process ASGI app."""
+    import httpx
+
+    if app is not None:
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://testserver" if base_url is None else base_url,
+            follow_redirects=False,
+        )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        follow_redirects=False,
+        limits=httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        ),
+    )
+
+
+async def replay_log(
+    requests: typing.List[ReplayRequest],
+    base_url: typing.Optional[str] = None,
+    app=None,
+    concurrency: int = 10,
+    timing: str = TIMING_FAST,
+    speed: float = 1.0,
+) -> typing.Dict[str, typing.Any]:
+    """Replay requests against base_url or, if provided, in-process against app.
+
+    The lifespan of app is run around the replay so it is set up as when served.
+    """
+    async with create_client(base_url=base_url, app=app, concurrency=concurrency) as client:
+        if app is None:
+            return await replay(client, requests, concurrency, timing, speed)
+        async with app.router.lifespan_context(app):
+            return await replay(client, requests, concurrency, timing, speed)
@@ -3,14 +3,29 @@ import typing
 import starlette.responses
 
 
+def render_json(content: typing.Any) -> bytes:
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=2,
+        separators=(", ", ": "),
+    ).encode("utf-8")
+
+
+def render_json_members(content: typing.Dict[str, typing.Any]) -> bytes:
+    """The members of a non-empty object as rendered by render_json, for use with join_json."""
+    return render_json(content)[2:-2]
+
+
+def join_json(content: typing.Dict[str, typing.Any], members: bytes) -> bytes:
+    """Render content followed by pre-rendered members as a single object."""
+    # The item separator of render_json is ", " before the line break
+    return render_json(content)[:-2] + b", \n" + members + b"\n}"
+
+
 class PrettyJSONResponse(starlette.responses.Response):
     media_type = "application/json"
 
     def render(self, content: typing.Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=2,
-            separators=(", ", ": "),
-        ).encode("utf-8")
+        return render_json(content)
@@ -1,13 +1,17 @@
 """FastAPI router implementing identifier resolver functionality."""
 
 import dataclasses
+import functools
 import re
-import string
 import typing
 import urllib.parse
 import fastapi
+import rslv.lib_rslv
+import rslv.lib_rslv.lrucache
+import rslv.lib_rslv.negotiate
 import rslv.lib_rslv.piddefine
 import rslv.config
+import rslv.metrics
 
 
 router = fastapi.APIRouter(
@@ -18,17 +22,8 @@ router = fastapi.APIRouter(
 )
 
 
-def pid_format(parts, template):
-    """Given a dict of identifier parts and a template, return the filled template."""
-    # Quick hack to avoid "None" appearing in generated string.
-    if template is None:
-        template = "/.info/${pid}"
-    _parts = {}
-    for k, v in parts.items():
-        if v is None:
-            v = ""
-        _parts[k] = v
-    return string.Template(template).substitute(_parts)
+# Template filling is implemented in rslv.lib_rslv, name kept for existing imports
+pid_format = rslv.lib_rslv.pid_format
 
 
 def adjust_response_status_code_for_method(
@@ -47,13 +42,15 @@ def adjust_response_status_code_for_method(
     return status_code
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class CleanedIdentifierRequest:
     original: str
     cleaned: typing.Optional[str] = None
     is_introspection: bool = False
     has_service_url: bool = False
     introspection_part: typing.Optional[str] = None
+    # Components of the cleaned identifier, populated by IdentifierRequestCleaner
+    parts: typing.Optional[rslv.lib_rslv.ParsedIdentifier] = None
 
     @classmethod
     def from_request_url(
@@ -66,30 +63,52 @@ class CleanedIdentifierRequest:
 
         service_pattern is a regexp string used to match the service URL
         """
+        return get_request_cleaner(service_pattern).clean(request_url, app_extracted)
+
+
+class IdentifierRequestCleaner:
+    """Cleans and splits identifiers extracted from request URLs.
+
+    The service_pattern is compiled once and results are memoized in a
+    bounded LRU cache keyed on the request URL and extracted identifier,
+    since clients frequently resolve the same identifier repeatedly.
+    Instances are created once per settings object and kept on app.state.
+    """
+
+    # ARK resolvers have behavior of returning an
+    # introspection ("inflection") when the URL ends with
+    # "?", "??", or "?info". It is necessary to examine the raw URL
+    # to determine this since it is non-standard behavior.
+    INTROSPECTION_CHECKS = (
+        "??",
+        "?info",
+        "?",
+    )
+
+    def __init__(self, service_pattern: typing.Optional[str] = None, cache_size: int = 4096):
+        self.service_re = None
+        if service_pattern is not None:
+            self.service_re = re.compile(service_pattern, flags=re.IGNORECASE)
+        self.clean = functools.lru_cache(maxsize=cache_size)(self._clean)
+
+    def cache_stats(self) -> typing.Dict[str, typing.Any]:
+        return rslv.metrics.lru_cache_stats(self.clean)
+
+    def _clean(self, request_url: str, app_extracted: str) -> CleanedIdentifierRequest:
         cleaned = urllib.parse.unquote(app_extracted)
         cleaned = cleaned.lstrip(" /:.;,")
         has_service_url = False
         is_introspection = False
         introspection_part = None
-        if service_pattern is not None:
-            (cleaned, n_subs) = re.subn(
-                service_pattern, "", cleaned, count=1, flags=re.IGNORECASE
-            )
+        if self.service_re is not None:
+            (cleaned, n_subs) = self.service_re.subn("", cleaned, count=1)
             if n_subs > 0:
                 has_service_url = True
         request_url = urllib.parse.unquote(request_url)
         requested_identifier = request_url[request_url.find(cleaned):]
         _original = requested_identifier
 
-        # ARK resolvers have behavior of returning an
-        # introspection ("inflection") when the URL ends with
-        # "?", "??", or "?info". It is necessary to examine the raw URL
-        # to determine this since it is non-standard behavior.
-        for check in (
-            "??",
-            "?info",
-            "?",
-        ):
+        for check in self.INTROSPECTION_CHECKS:
             if request_url.endswith(check):
                 if requested_identifier.endswith(check):
                     requested_identifier = requested_identifier[: -len(check)]
@@ -102,9 +121,87 @@ class CleanedIdentifierRequest:
             is_introspection=is_introspection,
             has_service_url=has_service_url,
             introspection_part=introspection_part,
+            parts=rslv.lib_rslv.split_identifier_string(requested_identifier),
         )
 
 
+@functools.lru_cache(maxsize=16)
+def get_request_cleaner(
+    service_pattern: typing.Optional[str] = None, cache_size: int = 4096
+) -> IdentifierRequestCleaner:
+    return IdentifierRequestCleaner(service_pattern, cache_size=cache_size)
+
+
+def rejected(request: fastapi.Request, cleaned_identifier: CleanedIdentifierRequest) -> bool:
+    """True if the lookup filter of the app shows no definition matches the identifier."""
+    lookup_filter = getattr(request.app.state, "lookup_filter", None)
+    return lookup_filter is not None and lookup_filter.rejects(cleaned_identifier.parts)
+
+
+def record_unmatched(
+    request: fastapi.Request, pid_config, cleaned_identifier: CleanedIdentifierRequest
+):
+    lookup_filter = getattr(request.app.state, "lookup_filter", None)
+    if lookup_filter is not None:
+        lookup_filter.unmatched(pid_config, cleaned_identifier.parts)
+
+
+def record_match(
+    request: fastapi.Request, definition: typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]
+):
+    """Record the scheme and prefix of the matched definition for the access log rollups."""
+    if definition is not None:
+        request.state.match = (definition.scheme, definition.prefix or "")
+
+
+def record_resolved(
+    request: fastapi.Request, definition: typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]
+):
+    """Count the resolved definition in the traffic tracker of the app, if any."""
+    tracker = getattr(request.app.state, "traffic_tracker", None)
+    if tracker is not None and definition is not None:
+        tracker.add(definition.uniq, definition.scheme, definition.prefix or "", definition.value or "")
+
+
+def get_pid_catalog(request: fastapi.Request) -> rslv.lib_rslv.piddefine.PidDefinitionCatalog:
+    """Return the catalog for the request, using the preloaded index if available."""
+    return rslv.lib_rslv.piddefine.PidDefinitionCatalog(
+        request.state.dbsession,
+        index=getattr(request.app.state, "catalog_index", None),
+    )
+
+
+def clean_request_identifier(
+    request: fastapi.Request, identifier: str
+) -> CleanedIdentifierRequest:
+    """Clean the identifier using the cleaner configured for the app settings."""
+    cleaner = getattr(request.app.state, "identifier_cleaner", None)
+    if cleaner is None:
+        cleaner = get_request_cleaner(request.app.state.settings.service_pattern)
+    # Negotiation parameters select the target and are not part of the identifier
+    request_url = rslv.lib_rslv.negotiate.strip_query_params(str(request.url))
+    return cleaner.clean(request_url, identifier)
+
+
+def select_target(
+    request: fastapi.Request, definition: rslv.lib_rslv.piddefine.PidDefinition
+) -> typing.Tuple[rslv.lib_rslv.negotiate.Target, str, rslv.lib_rslv.negotiate.DispatchTable]:
+    """Select the target of definition for the request by content negotiation.
+
+    Returns the target, how it was selected, and the dispatch table of definition.
+    """
+    table = rslv.lib_rslv.negotiate.dispatch_table(definition)
+    if not table.negotiated:
+        return table.default, rslv.lib_rslv.negotiate.BY_DEFAULT, table
+    target, selected_by = table.select(
+        accept=request.headers.get("accept"),
+        accept_profile=request.headers.get("accept-profile"),
+        mediatype_param=request.query_params.get("_mediatype"),
+        profile_param=request.query_params.get("_profile"),
+    )
+    return target, selected_by, table
+
+
 @router.head(
     "/.info",
     summary="Retrieve information about the service.",
@@ -116,7 +213,7 @@ class CleanedIdentifierRequest:
     response_class=rslv.routers.PrettyJSONResponse,
 )
 def get_service_info(request: fastapi.Request, valid: bool = True):
-    pid_config = rslv.lib_rslv.piddefine.PidDefinitionCatalog(request.state.dbsession)
+    pid_config = get_pid_catalog(request)
     schemes = pid_config.list_schemes(valid_targets_only=valid)
     return {
         "about": pid_config.get_metadata(),
@@ -125,52 +222,99 @@ def get_service_info(request: fastapi.Request, valid: bool = True):
     }
 
 
+# Entries of the cache of rendered introspection responses kept per app, since
+# the catalog version validating them is only meaningful for one database
+INFO_CACHE_SIZE = 4096
+
+
+def get_info_cache(request: fastapi.Request) -> rslv.lib_rslv.lrucache.LruCache:
+    """The introspection cache of the app, set by create_app or on first use."""
+    cache = getattr(request.app.state, "info_cache", None)
+    if cache is None:
+        cache = rslv.lib_rslv.lrucache.LruCache(maxsize=INFO_CACHE_SIZE)
+        request.app.state.info_cache = cache
+    return cache
+
+
+def definition_info(
+    info_cache: rslv.lib_rslv.lrucache.LruCache,
+    pid_config,
+    pid_parts: rslv.lib_rslv.ParsedIdentifier,
+    definition: rslv.lib_rslv.piddefine.PidDefinition,
+    table: rslv.lib_rslv.negotiate.DispatchTable,
+) -> bytes:
+    """The properties and definition members of an introspection response.
+
+    Rendered once per definition and catalog version and kept in info_cache
+    by (uniq, listing). The prefixes of the
+    scheme are listed for a scheme match and the values of the prefix for a
+    match without a value, so parts only determine which listing is included.
+    """
+    listing = None
+    if pid_parts.prefix == "":
+        listing = "prefixes"
+    elif pid_parts.value in ("", None):
+        listing = "values"
+    key = (definition.uniq, listing)
+    version = pid_config.get_version()
+    members = info_cache.get(key, version)
+    if members is not None:
+        return members
+    defn = {
+        "uniq": definition.uniq,
+        "scheme": definition.scheme,
+        "prefix": definition.prefix,
+        "value": definition.value,
+        "target": definition.target,
+        "canonical": definition.canonical,
+        "synonym_for": definition.synonym_for,
+        "http_code": definition.http_code,
+    }
+    if table.negotiated:
+        defn["targets"] = [t.as_dict() for t in table.targets]
+    if listing == "prefixes":
+        prefixes = pid_config.list_prefixes(pid_parts.scheme)
+        defn["prefixes"] = [p[0] for p in prefixes]
+    elif listing == "values":
+        values = pid_config.list_values(pid_parts.scheme, pid_parts.prefix)
+        defn["values"] = [v[0] for v in values]
+    members = rslv.routers.render_json_members(
+        {"properties": definition.properties, "definition": defn}
+    )
+    info_cache.put(key, members, version)
+    return members
+
+
 def handle_get_info(
     request: fastapi.Request,
     cleaned_identifier: CleanedIdentifierRequest,
     pid_config,
-    pid_parts: dict,
+    pid_parts: rslv.lib_rslv.ParsedIdentifier,
     definition: typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]
 ):
-    #pid_config = rslv.lib_rslv.piddefine.PidDefinitionCatalog(request.state.dbsession)
-    #pid_parts, definition = pid_config.parse(
-    #    cleaned_identifier.cleaned, resolve_synonym=False
-    #)
     # TODO: This is where a definition specific handler can be used for
     #   further processing of the PID, e.g. to remove hyphens from an ark.
     #   Basically, add a property to the definition that contains the name
     #   of a handler, then if set, load the handler and have it process the
     #   rendering of the PID.
+    content = pid_parts.as_dict()
     if definition is not None:
-        pid_parts["target"] = pid_format(pid_parts, definition.target)
-        pid_parts["canonical"] = pid_format(pid_parts, definition.canonical)
-        pid_parts["status_code"] = adjust_response_status_code_for_method(
-            request, definition.http_code
+        target, selected_by, table = select_target(request, definition)
+        content["target"] = target.format(pid_parts)
+        content["selected_target"] = {"name": target.name, "selected_by": selected_by}
+        content["canonical"] = pid_format(pid_parts, definition.canonical)
+        content["status_code"] = adjust_response_status_code_for_method(
+            request, target.http_code
         )
-        pid_parts["properties"] = definition.properties
-        defn = {
-            "uniq": definition.uniq,
-            "scheme": definition.scheme,
-            "prefix": definition.prefix,
-            "value": definition.value,
-            "target": definition.target,
-            "canonical": definition.canonical,
-            "synonym_for": definition.synonym_for,
-            "http_code": definition.http_code,
-        }
-        if pid_parts["prefix"] == "":
-            prefixes = pid_config.list_prefixes(pid_parts["scheme"])
-            defn["prefixes"] = [p[0] for p in prefixes]
-        elif pid_parts["value"] in (
-            "",
-            None,
-        ):
-            values = pid_config.list_values(pid_parts["scheme"], pid_parts["prefix"])
-            defn["values"] = [v[0] for v in values]
-        pid_parts["definition"] = defn
-        return pid_parts
-    pid_parts["error"] = f"No match was found for {cleaned_identifier.cleaned}"
-    return fastapi.responses.JSONResponse(content=pid_parts, status_code=404)
+        # Only the parts of the request are rendered here, the rest is cached
+        return fastapi.responses.Response(
+            content=rslv.routers.join_json(
+                content, definition_info(get_info_cache(request), pid_config, pid_parts, definition, table)
+            ),
+            media_type="application/json",
+        )
+    content["error"] = f"No match was found for {cleaned_identifier.cleaned}"
+    return fastapi.responses.JSONResponse(content=content, status_code=404)
 
 
 @router.head(
@@ -220,14 +364,22 @@ def get_info(
             detail="No dbsession available. Check server configuration.",
         )
 
-    cleaned_identifier = CleanedIdentifierRequest.from_request_url(
-        str(request.url), identifier, request.app.state.settings.service_pattern
-    )
+    cleaned_identifier = clean_request_identifier(request, identifier)
+
+    if rejected(request, cleaned_identifier):
+        return handle_get_info(
+            request, cleaned_identifier, None, cleaned_identifier.parts._replace(suffix=""), None
+        )
 
-    pid_config = rslv.lib_rslv.piddefine.PidDefinitionCatalog(request.state.dbsession)
+    pid_config = get_pid_catalog(request)
     pid_parts, definition = pid_config.parse(
-        cleaned_identifier.cleaned, resolve_synonym=False
+        cleaned_identifier.cleaned,
+        resolve_synonym=False,
+        parts=cleaned_identifier.parts,
     )
+    if definition is None:
+        record_unmatched(request, pid_config, cleaned_identifier)
+    record_match(request, definition)
 
     return handle_get_info(
         request,
@@ -238,6 +390,16 @@ def get_info(
     )
 
 
+def not_found(
+    cleaned_identifier: CleanedIdentifierRequest, pid_parts: rslv.lib_rslv.ParsedIdentifier
+) -> fastapi.responses.JSONResponse:
+    # Return a 404 response and include the pid parts in the body with a
+    # message indicating not found
+    content = pid_parts.as_dict()
+    content["error"] = f"No match was found for {cleaned_identifier.original}"
+    return fastapi.responses.JSONResponse(content=content, status_code=404)
+
+
 @router.head(
     "/{identifier:path}",
     summary="Redirect to the identified resource or present resolver information.",
@@ -290,16 +452,26 @@ def get_resolve(
         )
 
     # Clean up the identifier extracted from the request URL
-    cleaned_identifier = CleanedIdentifierRequest.from_request_url(
-        str(request.url), identifier, request.app.state.settings.service_pattern
-    )
+    cleaned_identifier = clean_request_identifier(request, identifier)
 
+    # Answer identifiers that can not match any definition without a lookup
+    if rejected(request, cleaned_identifier):
+        pid_parts = cleaned_identifier.parts._replace(suffix="")
+        if cleaned_identifier.is_introspection:
+            return handle_get_info(request, cleaned_identifier, None, pid_parts, None)
+        return not_found(cleaned_identifier, pid_parts)
 
     # Get the identifier configuration catalog
-    pid_config = rslv.lib_rslv.piddefine.PidDefinitionCatalog(request.state.dbsession)
+    pid_config = get_pid_catalog(request)
 
     # Split the identifier string into components and find the best match from the catalog
-    pid_parts, definition = pid_config.parse(cleaned_identifier.cleaned)
+    pid_parts, definition = pid_config.parse(
+        cleaned_identifier.cleaned, parts=cleaned_identifier.parts
+    )
+    if definition is None:
+        record_unmatched(request, pid_config, cleaned_identifier)
+    record_match(request, definition)
+    record_resolved(request, definition)
 
     # If the request was for introspection (inflection) use the info handler
     # Note: introspection handler should only be called if there is an exact
@@ -307,7 +479,7 @@ def get_resolve(
     # request should be forwarded as a normal resolve redirect for the
     # downstream service to handle the request.
     # If there's no suffix then it's an exact match to the definition
-    if pid_parts["suffix"] == "" and cleaned_identifier.is_introspection:
+    if pid_parts.suffix == "" and cleaned_identifier.is_introspection:
     #if cleaned_identifier.is_introspection:
         return handle_get_info(
             request,
@@ -318,24 +490,21 @@ def get_resolve(
         )
 
     if definition is None:
-        # Return a 404 response and include the pid parts in the body with a
-        # message indicating not found
-        pid_parts["error"] = f"No match was found for {cleaned_identifier.original}"
-        return fastapi.responses.JSONResponse(content=pid_parts, status_code=404)
+        return not_found(cleaned_identifier, pid_parts)
     # We have a match from the definition catalog.
     # Redirect the response, but include our gathered info in the body
     # to assist with debugging.
+    target, selected_by, table = select_target(request, definition)
     response_status_code = adjust_response_status_code_for_method(
-        request, definition.http_code
+        request, target.http_code
     )
-    pid_parts["target"] = pid_format(pid_parts, definition.target)
-    _target = pid_parts["target"]
+    _target = target.format(pid_parts)
 
     # If there's no value component in the PID, then return the information
     # this service has about the identifier.
     # TODO: Should this be checking the content portion instead of the value? That is, if the
     # content matches the definition content, then engage auto-introspection.
-    if request.app.state.settings.auto_introspection and pid_parts["value"] in [
+    if request.app.state.settings.auto_introspection and pid_parts.value in [
         None,
         "",
     ]:
@@ -352,7 +521,7 @@ def get_resolve(
     # the auto_introspection configuration boolean value.
     if (
         request.app.state.settings.auto_introspection
-        and pid_parts["value"] == definition.value
+        and pid_parts.value == definition.value
     ):
         return handle_get_info(
             request,
@@ -366,18 +535,23 @@ def get_resolve(
     # generated target URL.
     if cleaned_identifier.is_introspection:
         _target = f"{_target}{cleaned_identifier.introspection_part}"
-        pid_parts["target"]  = _target
 
     # OK, past all the edge cases, redirect the client to the registered target.
-    pid_parts["canonical"] = pid_format(pid_parts, definition.canonical)
-    pid_parts["status_code"] = response_status_code
+    content = pid_parts.as_dict()
+    content["target"] = _target
+    content["selected_target"] = {"name": target.name, "selected_by": selected_by}
+    content["canonical"] = pid_format(pid_parts, definition.canonical)
+    content["status_code"] = response_status_code
     headers = {"Location": _target}
+    if table.negotiated:
+        # The redirect depends on these request headers, so caches must too
+        headers["Vary"] = "Accept, Accept-Profile"
     # Check if request includes no redirect header and
     # override the redirect if so.
     if request.app.state.settings.request_no_redirect in request.headers:
         response_status_code = 200
     return fastapi.responses.JSONResponse(
-        content=pid_parts,
+        content=content,
         headers=headers,
         status_code=response_status_code,
     )
@@ -0,0 +1,73 @@
+"""FastAPI router implementing operational endpoints of the service."""
+
+import fastapi
+import fastapi.responses
+import rslv.health
+import rslv.routers
+
+
+router = fastapi.APIRouter(
+    tags=["service"],
+)
+
+
+@router.get(
+    "/.metrics",
+    summary="Retrieve in-process metrics for this service worker.",
+    response_class=rslv.routers.PrettyJSONResponse,
+)
+def get_metrics(request: fastapi.Request):
+    return request.app.state.metrics.collect()
+
+
+HEALTHY = b'{"status": "ok"}'
+
+
+@router.get(
+    "/.health",
+    summary="Report that this service worker is alive.",
+    response_class=fastapi.responses.Response,
+)
+async def get_health():
+    """
+    Liveness, answered from the event loop without touching the database.
+    """
+    return fastapi.responses.Response(HEALTHY, media_type="application/json")
+
+
+@router.get(
+    "/.ready",
+    summary="Report whether this service worker is ready to serve requests.",
+    response_class=fastapi.responses.Response,
+)
+async def get_ready(request: fastapi.Request):
+    """
+    Readiness as of the last background check of the database, the catalog, and
+    the connection pool. Responds with 503 while not ready or warming up.
+    """
+    checker = getattr(request.app.state, "health_checker", None)
+    if checker is not None:
+        ready, body = checker.result()
+    else:
+        warmup = getattr(request.app.state, "warmup", None)
+        ready = warmup is None or warmup.ready
+        body = b'{"ready": true}' if ready else rslv.health.WARMING_UP
+    return fastapi.responses.Response(
+        body, status_code=200 if ready else 503, media_type="application/json"
+    )
+
+
+@router.get(
+    "/.top",
+    summary="Retrieve the most resolved definitions and prefixes of this service worker.",
+    response_class=rslv.routers.PrettyJSONResponse,
+)
+def get_top(request: fastapi.Request, n: int = fastapi.Query(default=20, ge=1, le=1000)):
+    """
+    Approximate counts of the n most resolved definitions and (scheme, prefix) pairs since
+    the worker started. A count may overestimate the true count by at most its error.
+    """
+    tracker = getattr(request.app.state, "traffic_tracker", None)
+    if tracker is None:
+        raise fastapi.HTTPException(status_code=404, detail="Traffic tracking is not enabled.")
+    return tracker.top(n)
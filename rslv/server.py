@@ -0,0 +1,238 @@
+"""
+Pre-forking production launcher for the resolver service.
+
+The parent process creates the application and loads the definition catalog
+into a rslv.lib_rslv.pidindex.PidDefinitionIndex once, binds the listening
+socket, and then forks worker processes that each run a uvicorn server on
+the shared socket. The app and index are inherited by the workers
+copy-on-write, so N workers do not hold N copies of the catalog.
+
+The parent supervises the workers:
+
+- SIGHUP reloads the catalog, starts a new generation of workers, then
+  gracefully stops the previous generation. The listening socket remains
+  open throughout so no requests are refused.
+- SIGTERM or SIGINT gracefully stops all workers and exits.
+- Workers that exit unexpectedly are replaced.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+import typing
+
+import sqlalchemy
+
+import rslv.config
+import rslv.lib_rslv.pidindex
+
+# Seconds to wait for workers to finish in-flight requests when stopping
+GRACEFUL_TIMEOUT = 30
+# Seconds between checks of worker status by the supervisor
+SUPERVISOR_INTERVAL = 0.25
+
+
+def get_logger():
+    return logging.getLogger("rslv.server")
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_catalog_index(
+    settings: rslv.config.Settings,
+) -> rslv.lib_rslv.pidindex.PidDefinitionIndex:
+    """Load the catalog index using an engine that is disposed before forking."""
+    engine = sqlalchemy.create_engine(settings.db_connection_string)
+    try:
+        return rslv.lib_rslv.pidindex.load_index(engine)
+    finally:
+        engine.dispose()
+
+
+def create_app(settings: rslv.config.Settings):
+    import rslv.app
+
+    return rslv.app.create_app(settings=settings)
+
+
+class PreforkServer:
+    """Supervises a set of forked uvicorn worker processes sharing one socket."""
+
+    def __init__(
+        self,
+        settings: rslv.config.Settings,
+        workers: int = 1,
+        app_factory: typing.Optional[typing.Callable[[rslv.config.Settings], typing.Any]] = None,
+        uvicorn_options: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    ):
+        self.settings = settings
+        self.n_workers = max(1, workers)
+        self.app_factory = create_app if app_factory is None else app_factory
+        self.uvicorn_options = {} if uvicorn_options is None else uvicorn_options
+        self.sock: typing.Optional[socket.socket] = None
+        self.app = None
+        self.workers: typing.Dict[int, int] = {}  # pid: generation
+        self.generation = 0
+        self._stop = False
+        self._reload = False
+
+    def load(self):
+        """Create the app if necessary and (re)load the catalog index."""
+        L = get_logger()
+        if self.app is None:
+            self.app = self.app_factory(self.settings)
+        t0 = time.monotonic()
+        index = load_catalog_index(self.settings)
+        self.app.state.catalog_index = index
+        L.info(
+            "Loaded %s definitions (%s bytes) in %.3fs",
+            len(index),
+            index.nbytes(),
+            time.monotonic() - t0,
+        )
+        # Move everything allocated so far out of the reach of the cyclic
+        # garbage collector so collections in workers do not write to, and
+        # so un-share, the pages holding the preloaded app and catalog.
+        gc.collect()
+        gc.freeze()
+
+    def spawn_worker(self) -> int:
+        pid = os.fork()
+        if pid != 0:
+            self.workers[pid] = self.generation
+            return pid
+        # In the worker process
+        exit_code = 0
+        try:
+            self.run_worker()
+        except BaseException:
+            get_logger().exception("Worker failed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def run_worker(self):
+        import uvicorn
+
+        # Reloads are coordinated by the parent, uvicorn handles SIGTERM and SIGINT
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+            **self.uvicorn_options,
+        )
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.sock])
+
+    def signal_workers(self, sig: int, generation: typing.Optional[int] = None):
+        for pid, gen in list(self.workers.items()):
+            if generation is None or gen == generation:
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    self.workers.pop(pid, None)
+
+    def reap_workers(self) -> typing.List[typing.Tuple[int, int]]:
+        """Collect exited workers, returning a list of (pid, generation)."""
+        reaped = []
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            generation = self.workers.pop(pid, None)
+            if generation is not None:
+                reaped.append((pid, generation))
+        return reaped
+
+    def restart(self):
+        """Reload the catalog and replace all workers without closing the socket."""
+        L = get_logger()
+        L.info("Reloading catalog and restarting workers")
+        previous = self.generation
+        gc.unfreeze()
+        try:
+            self.load()
+        except Exception:
+            L.exception("Reload failed, continuing with current workers")
+            gc.freeze()
+            return
+        self.generation += 1
+        for _ in range(self.n_workers):
+            self.spawn_worker()
+        self.signal_workers(signal.SIGTERM, generation=previous)
+
+    def stop(self):
+        L = get_logger()
+        L.info("Stopping %s workers", len(self.workers))
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.workers and time.monotonic() < deadline:
+            self.reap_workers()
+            time.sleep(SUPERVISOR_INTERVAL)
+        self.signal_workers(signal.SIGKILL)
+        self.reap_workers()
+
+    def _handle_stop(self, signum, frame):
+        self._stop = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+    def run(self, host: str, port: int):
+        L = get_logger()
+        self.load()
+        self.sock = bind_socket(host, port)
+        L.info("Listening on %s:%s with %s workers", host, port, self.n_workers)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        for _ in range(self.n_workers):
+            self.spawn_worker()
+        try:
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    self.restart()
+                for pid, generation in self.reap_workers():
+                    if generation == self.generation and not self._stop:
+                        L.warning("Worker %s exited, starting replacement", pid)
+                        self.spawn_worker()
+                time.sleep(SUPERVISOR_INTERVAL)
+        finally:
+            self.stop()
+            self.sock.close()
+
+
+def serve(
+    settings: rslv.config.Settings,
+    workers: typing.Optional[int] = None,
+    host: typing.Optional[str] = None,
+    port: typing.Optional[int] = None,
+    **uvicorn_options,
+):
+    server = PreforkServer(
+        settings,
+        workers=settings.workers if workers is None else workers,
+        uvicorn_options=uvicorn_options,
+    )
+    server.run(
+        settings.host if host is None else host,
+        settings.port if port is None else port,
+    )
@@ -0,0 +1,213 @@
+"""
+Warm-up of per worker caches from traffic history.
+
+A worker starts with empty caches, so the first requests after a restart
+are slower. Warmup resolves a list of frequently requested identifiers
+against the catalog when the worker starts, which fills the split
+identifier cache and the dispatch tables of the matched definitions,
+records identifiers without a definition in the lookup filter, and pages
+the definition rows into the database cache.
+
+The list is read from a file that may be:
+
+- the JSON document returned by /.top, whose definitions and prefixes are
+  converted to identifiers;
+- a JSON-lines access log as written by the service, whose requested
+  identifiers are ordered by frequency;
+- a text file of identifiers, one per line, most requested first, as
+  written by "rslv hot".
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+import typing
+
+import rslv.lib_rslv
+import rslv.lib_rslv.heavyhitters
+import rslv.lib_rslv.lookupfilter
+import rslv.lib_rslv.negotiate
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
+import rslv.replay
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Most identifiers counted when reading an access log
+LOG_CAPACITY = 100000
+
+
+def get_logger():
+    return logging.getLogger("rslv.warmup")
+
+
+def top_identifiers(document: typing.Mapping[str, typing.Any]) -> typing.List[str]:
+    """Identifiers of the definitions and prefixes of a /.top document."""
+    identifiers = []
+    for entry in document.get("definitions", []):
+        pid = f"{entry['scheme']}:{entry['prefix']}"
+        if entry.get("value"):
+            pid = f"{pid}/{entry['value']}"
+        identifiers.append(pid)
+    for entry in document.get("prefixes", []):
+        identifiers.append(f"{entry['scheme']}:{entry['prefix']}")
+    return identifiers
+
+
+def log_identifiers(lines: typing.Iterable[str], capacity: int = LOG_CAPACITY) -> typing.List[str]:
+    """Identifiers requested in an access log, most frequent first.
+
+    The log is streamed and the capacity most frequent identifiers are
+    counted with SpaceSaving, so memory does not grow with the log.
+    """
+    counts = rslv.lib_rslv.heavyhitters.SpaceSaving(capacity)
+    for line in lines:
+        request = rslv.replay.parse_log_line(line)
+        if request is None:
+            continue
+        path = request.url.split("?", 1)[0].lstrip("/")
+        # Service endpoints such as /.info and /.metrics
+        if path == "" or path.startswith("."):
+            continue
+        counts.add(path)
+    return [entry["key"] for entry in counts.top(capacity)]
+
+
+def load_identifiers(filename: str, limit: typing.Optional[int] = None) -> typing.List[str]:
+    with open(filename, "r") as f:
+        return read_identifiers(f, limit=limit)
+
+
+def read_identifiers(lines: typing.Iterable[str], limit: typing.Optional[int] = None) -> typing.List[str]:
+    """Unique identifiers listed in a /.top document, access log, or text file, in order.
+
+    The format is recognized from the first line that is not blank, the
+    remaining lines are read once.
+    """
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip() != ""), None)
+    if first is None:
+        return []
+    identifiers: typing.Iterable[str]
+    if first.lstrip().startswith("{"):
+        log_line = True
+        try:
+            document = json.loads(first)
+        except json.JSONDecodeError:
+            # A /.top document spread over lines, which is small
+            log_line = False
+            try:
+                document = json.loads(first + "".join(lines))
+            except json.JSONDecodeError:
+                document = None
+        if isinstance(document, dict) and ("definitions" in document or "prefixes" in document):
+            identifiers = top_identifiers(document)
+        elif log_line:
+            capacity = LOG_CAPACITY if limit is None else max(LOG_CAPACITY, limit)
+            identifiers = log_identifiers(itertools.chain([first], lines), capacity=capacity)
+        else:
+            identifiers = []
+    else:
+        identifiers = (
+            line.strip()
+            for line in itertools.chain([first], lines)
+            if line.strip() != "" and not line.lstrip().startswith("#")
+        )
+    unique = {}
+    for pid in identifiers:
+        unique[pid] = None
+        if limit is not None and len(unique) >= limit:
+            break
+    return list(unique)
+
+
+class Warmup:
+    """Resolves a list of identifiers to warm the caches of a worker."""
+
+    # Identifiers resolved with each database session
+    BATCH_SIZE = 1000
+
+    def __init__(self, identifiers: typing.Optional[typing.List[str]] = None):
+        self.identifiers = identifiers or []
+        self.state = PENDING
+        self.matched = 0
+        self.seconds = 0.0
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once warm-up has finished, successfully or not."""
+        return self.done.is_set()
+
+    def warm(
+        self,
+        engine: rslv.lib_rslv.piddefine.EngineSource,
+        index: typing.Optional[rslv.lib_rslv.pidindex.PidDefinitionIndex] = None,
+        lookup_filter: typing.Optional[rslv.lib_rslv.lookupfilter.LookupFilter] = None,
+    ):
+        """Resolve each identifier as a request would, then mark warm-up done.
+
+        engine is an engine, or a callable returning the engine for each
+        BATCH_SIZE identifiers, e.g. to spread them over read replicas.
+        """
+        self.state = RUNNING
+        t0 = time.perf_counter()
+        engine = rslv.lib_rslv.piddefine.engine_getter(engine)
+        try:
+            for i in range(0, len(self.identifiers), self.BATCH_SIZE):
+                if self._stop.is_set():
+                    break
+                with rslv.lib_rslv.piddefine.get_catalog(engine(), index=index) as catalog:
+                    for pid in self.identifiers[i:i + self.BATCH_SIZE]:
+                        if self._stop.is_set():
+                            break
+                        parts = rslv.lib_rslv.split_identifier_string(pid)
+                        _, definition = catalog.parse(pid, parts=parts)
+                        if definition is not None:
+                            rslv.lib_rslv.negotiate.dispatch_table(definition)
+                            self.matched += 1
+                        elif lookup_filter is not None:
+                            lookup_filter.unmatched(catalog, parts)
+            self.state = DONE
+        except Exception as e:
+            # A worker with cold caches still serves requests correctly
+            get_logger().warning("Warm-up failed: %s", e)
+            self.state = FAILED
+        self.seconds = time.perf_counter() - t0
+        get_logger().info(
+            "Warm-up %s, %s of %s identifiers matched in %.2fs",
+            self.state, self.matched, len(self.identifiers), self.seconds,
+        )
+        self.done.set()
+
+    def start(self, engine: rslv.lib_rslv.piddefine.EngineSource, **kwargs):
+        """Warm up in a thread so the worker starts serving while caches fill."""
+        self._thread = threading.Thread(
+            target=self.warm, args=(engine,), kwargs=kwargs, name="rslv-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def join(self, timeout: typing.Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+    def stop(self):
+        """Stop warming up, e.g. when the worker shuts down before it finished."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "state": self.state,
+            "identifiers": len(self.identifiers),
+            "matched": self.matched,
+            "seconds": self.seconds,
+        }
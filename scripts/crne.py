@@ -1,56 +1,196 @@
 """
-Script for comparing resolved target for an ARK when using rslv, n2t, and ezid.
+Script for comparing resolved targets for identifiers when using rslv, n2t, and ezid.
 
 This is for diagnostic purposes to help ensure appropriate configuration
 of rslv for ARK identifier resolution.
 
+Identifiers are provided as arguments and/or read from a file with one
+identifier per line. Each identifier is resolved by every resolver
+concurrently, with the number of requests in flight bounded and a single
+pooled client shared across all requests. The final target, status, and
+number of redirect hops are compared across resolvers and identifiers with
+differences are written as JSON lines to the report. A summary is
+printed to stderr.
+
+Example:
+
+    python scripts/crne.py -f naans.txt -c 50 -o diff.jsonl
+    python scripts/crne.py -r local=http://localhost:8000/{pid} -r n2t=https://n2t.net/{pid} ark:/12345/foo
+
 See also: https://hopper.rslv.xyz/ for viewing the redirect hops.
 """
 import asyncio
+import itertools
 import json
 import logging
 import sys
+import typing
 import click
 import httpx
 
 logging.basicConfig(level=logging.INFO)
 L = logging.getLogger()
 
+DEFAULT_RESOLVERS = {
+    "N2T": "https://legacy-n2t.net/{pid}",
+    "RSLV": "https://n2t.net/{pid}",
+    "EZID": "https://uc3-ezid-n2t-prd.cdlib.org/{pid}",
+}
 
-async def get_response(session, url):
-    response = await session.request(method="GET", url=url, follow_redirects=True, timeout=30)
+
+async def get_response(session, url, semaphore=None, timeout=30):
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    async with semaphore:
+        try:
+            response = await session.request(
+                method="GET", url=url, follow_redirects=True, timeout=timeout
+            )
+        except httpx.HTTPError as e:
+            return {
+                "start": url,
+                "final": None,
+                "target": None,
+                "status": e.__class__.__name__,
+                "hops": None,
+            }
+    hops = len(response.history)
     result = {
         "start": url,
         "final": str(response.url),
-        "status": response.status_code
+        # The resolved target, None if the resolver responded without redirecting
+        "target": str(response.url) if hops > 0 else None,
+        "status": response.status_code,
+        "hops": hops,
     }
     return result
 
 
-async def do_work(ark):
-    bases = [
-        "https://legacy-n2t.net/{pid}",
-        "https://n2t.net/{pid}",
-        "https://uc3-ezid-n2t-prd.cdlib.org/{pid}",
-    ]
-    urls = [base.format(pid=ark) for base in bases]
-    session = httpx.AsyncClient()
-    results = await asyncio.gather(*[get_response(session, url) for url in urls])
-    await session.aclose()
-    return results
+def compare(pid: str, results: typing.Dict[str, dict]) -> dict:
+    """Compare the target, status, and hops of results keyed by resolver name."""
+    differences = []
+    names = list(results.keys())
+    for field in ("target", "status", "hops"):
+        values = {results[n][field] for n in names}
+        if len(values) > 1:
+            differences.append(field)
+    return {
+        "input": pid,
+        "match": len(differences) == 0,
+        "differences": differences,
+        "results": results,
+    }
 
 
-@click.command()
-@click.argument("ark")
-def main(ark:str):
-    results = asyncio.run(do_work(ark))
-    results = {
-        "input": ark,
-        "N2T": results[0],
-        "RSLV": results[1],
-        "EZID": results[2]
+async def compare_identifier(session, pid, resolvers, semaphore, timeout=30):
+    urls = [template.format(pid=pid) for template in resolvers.values()]
+    responses = await asyncio.gather(
+        *[get_response(session, url, semaphore, timeout=timeout) for url in urls]
+    )
+    return compare(pid, dict(zip(resolvers.keys(), responses)))
+
+
+async def do_work(
+    pids: typing.Iterable[str],
+    resolvers: typing.Optional[typing.Dict[str, str]] = None,
+    concurrency: int = 10,
+    session: typing.Optional[httpx.AsyncClient] = None,
+    timeout: float = 30,
+) -> typing.AsyncIterator[dict]:
+    """Yield comparison results for pids as they complete.
+
+    At most concurrency requests are in flight at once. If session is not
+    provided, a pooled client is created and closed here.
+    """
+    if resolvers is None:
+        resolvers = DEFAULT_RESOLVERS
+    own_session = session is None
+    if own_session:
+        session = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            )
+        )
+    semaphore = asyncio.Semaphore(concurrency)
+    # Bound the number of pending identifier tasks so very long lists are
+    # not all scheduled at once.
+    pending = set()
+    try:
+        for pid in pids:
+            pending.add(
+                asyncio.ensure_future(
+                    compare_identifier(session, pid, resolvers, semaphore, timeout=timeout)
+                )
+            )
+            if len(pending) >= concurrency * 2:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if own_session:
+            await session.aclose()
+
+
+async def run_comparison(pids, resolvers, concurrency, report, include_matches=False, session=None):
+    summary = {
+        "identifiers": 0,
+        "matches": 0,
+        "differences": {"target": 0, "status": 0, "hops": 0},
     }
-    print(json.dumps(results, indent=2))
+    async for result in do_work(pids, resolvers, concurrency=concurrency, session=session):
+        summary["identifiers"] += 1
+        if result["match"]:
+            summary["matches"] += 1
+        for field in result["differences"]:
+            summary["differences"][field] += 1
+        if include_matches or not result["match"]:
+            report.write(json.dumps(result) + "\n")
+    return summary
+
+
+def read_identifiers(lines: typing.Iterable[str]) -> typing.Iterator[str]:
+    for line in lines:
+        line = line.strip()
+        if line != "" and not line.startswith("#"):
+            yield line
+
+
+def parse_resolvers(values: typing.Sequence[str]) -> typing.Dict[str, str]:
+    if len(values) == 0:
+        return DEFAULT_RESOLVERS
+    resolvers = {}
+    for value in values:
+        name, template = value.split("=", 1)
+        resolvers[name] = template
+    return resolvers
+
+
+@click.command()
+@click.argument("arks", nargs=-1)
+@click.option("-f", "--identifiers", "identifiers_file", type=click.File("r"), default=None,
+              help="File with one identifier per line")
+@click.option("-r", "--resolver", "resolver_templates", multiple=True,
+              help="NAME=URL_TEMPLATE with {pid} placeholder. Default is N2T, RSLV, and EZID.")
+@click.option("-c", "--concurrency", default=10, show_default=True, help="Maximum requests in flight")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Report file, JSON lines")
+@click.option("-a", "--all", "include_matches", is_flag=True, help="Include matching identifiers in report")
+def main(arks, identifiers_file, resolver_templates, concurrency, output, include_matches):
+    pids = iter(arks)
+    if identifiers_file is not None:
+        pids = itertools.chain(pids, read_identifiers(identifiers_file))
+    resolvers = parse_resolvers(resolver_templates)
+    summary = asyncio.run(
+        run_comparison(pids, resolvers, concurrency, output, include_matches=include_matches)
+    )
+    print(json.dumps(summary, indent=2), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+"""
+Show database query plans for the definition lookups made when resolving identifiers.
+
+Each identifier is parsed with PidDefinitionCatalog as the resolver does.
+The SQL statements issued are captured and explained, using EXPLAIN QUERY
+PLAN for SQLite and EXPLAIN for PostgreSQL, to check that lookups are
+served by the piddef indexes rather than table scans, e.g.:
+
+    python scripts/explain_lookup.py sqlite:///data/pids.sqlite ark:/99999/fk4abc
+    python scripts/explain_lookup.py postgresql://rslv@localhost/rslv doi:10.1234/foo
+"""
+import json
+import sys
+import typing
+
+import click
+import sqlalchemy
+import sqlalchemy.event
+
+import rslv.lib_rslv.piddefine
+
+DEFAULT_IDENTIFIERS = (
+    "ark:",
+    "ark:/99999",
+    "ark:/99999/fk4abc",
+    "doi:10.1234/foo",
+)
+
+
+def explain_prefix(engine: sqlalchemy.engine.Engine) -> str:
+    if engine.dialect.name == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    return "EXPLAIN "
+
+
+def capture_lookups(
+    engine: sqlalchemy.engine.Engine, identifiers: typing.Iterable[str]
+) -> typing.List[typing.Tuple[str, str, typing.Any]]:
+    """Parse identifiers and return the (identifier, statement, parameters) executed."""
+    captured = []
+    current = [None]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current[0], statement, parameters))
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+            # Read the cached max value length before capturing lookups
+            catalog.get_max_value_length()
+            captured.clear()
+            for identifier in identifiers:
+                current[0] = identifier
+                catalog.parse(identifier)
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+def explain(
+    engine: sqlalchemy.engine.Engine, identifiers: typing.Iterable[str]
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Query plans for the lookups made when parsing identifiers."""
+    prefix = explain_prefix(engine)
+    plans = []
+    for identifier, statement, parameters in capture_lookups(engine, identifiers):
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+        if engine.dialect.name == "sqlite":
+            # (id, parent, notused, detail)
+            plan = [row[-1] for row in rows]
+        else:
+            plan = [row[0] for row in rows]
+        plans.append({"identifier": identifier, "statement": statement, "plan": plan})
+    return plans
+
+
+@click.command()
+@click.argument("db_connection_string")
+@click.argument("identifiers", nargs=-1)
+def main(db_connection_string, identifiers):
+    if len(identifiers) == 0:
+        identifiers = DEFAULT_IDENTIFIERS
+    engine = sqlalchemy.create_engine(db_connection_string)
+    print(json.dumps(explain(engine, identifiers), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
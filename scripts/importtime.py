@@ -0,0 +1,82 @@
+"""
+Report module import time for rslv entry points using `python -X importtime`.
+
+Each target is imported in a fresh interpreter and the cumulative import
+times reported by the interpreter are summarized. Use this to track the
+cold start cost of the CLI and the service, e.g.:
+
+    python scripts/importtime.py
+    python scripts/importtime.py -n 20 rslv.app
+"""
+import json
+import subprocess
+import sys
+import typing
+
+import click
+
+DEFAULT_TARGETS = (
+    "rslv",
+    "rslv.__main__",
+    "rslv.app",
+)
+
+
+def parse_importtime(text: str) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Parse -X importtime output to a list of {module, self_us, cumulative_us, depth}."""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _self, _cumulative, _name = line[len("import time:"):].split("|", 2)
+            entry = {
+                "self_us": int(_self),
+                "cumulative_us": int(_cumulative),
+                "module": _name.strip(),
+                "depth": (len(_name) - len(_name.lstrip()) - 1) // 2,
+            }
+        except ValueError:
+            # header line
+            continue
+        entries.append(entry)
+    return entries
+
+
+def measure(target: str, python: str = sys.executable) -> typing.List[typing.Dict[str, typing.Any]]:
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def summarize(target: str, entries: typing.List[typing.Dict[str, typing.Any]], n_top: int = 10):
+    top_level = [e for e in entries if e["depth"] == 0]
+    total = sum(e["cumulative_us"] for e in top_level)
+    slowest = sorted(top_level, key=lambda e: e["cumulative_us"], reverse=True)[:n_top]
+    return {
+        "target": target,
+        "total_ms": round(total / 1000, 1),
+        "n_modules": len(entries),
+        "slowest": [
+            {"module": e["module"], "cumulative_ms": round(e["cumulative_us"] / 1000, 1)}
+            for e in slowest
+        ],
+    }
+
+
+@click.command()
+@click.option("-n", "--n-top", default=10, help="Number of slowest top level imports to list")
+@click.argument("targets", nargs=-1)
+def main(n_top, targets):
+    if len(targets) == 0:
+        targets = DEFAULT_TARGETS
+    results = [summarize(t, measure(t), n_top=n_top) for t in targets]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Fixtures shared by the tests.
+"""
+import fastapi.testclient
+import pytest
+import sqlalchemy
+
+import rslv.app
+import rslv.config
+import rslv.lib_rslv.piddefine
+
+
+@pytest.fixture()
+def app_client(tmp_path):
+    """Start apps for a test, returning the TestClient of each.
+
+    Call with the definitions of a new SQLite catalog (by default a single
+    ark definition), or the db_url of an existing catalog, and any settings
+    to override. Apps are shut down at the end of the test.
+    """
+    clients = []
+
+    def start(definitions=None, db_url=None, **settings):
+        if db_url is None:
+            if definitions is None:
+                definitions = [
+                    rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", target="https://example.org/${pid}")
+                ]
+            db_url = f"sqlite:///{tmp_path / f'app{len(clients)}.sqlite'}"
+            engine = sqlalchemy.create_engine(db_url)
+            rslv.lib_rslv.piddefine.create_database(engine, "test")
+            with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+                for definition in definitions:
+                    cfg.add(definition)
+            engine.dispose()
+        settings.setdefault("service_pattern", None)
+        app = rslv.app.create_app(
+            settings=rslv.config.Settings(db_connection_string=db_url, **settings)
+        )
+        client = fastapi.testclient.TestClient(app)
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield start
+    for client in reversed(clients):
+        client.__exit__(None, None, None)
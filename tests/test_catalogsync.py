@@ -0,0 +1,130 @@
+"""
+Tests for comparing and synchronizing definition catalogs.
+"""
+import json
+
+import click.testing
+import pytest
+import sqlalchemy
+
+import rslv.__main__
+import rslv.lib_rslv.catalogsync
+import rslv.lib_rslv.piddefine
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+catalogsync = rslv.lib_rslv.catalogsync
+
+
+def record(uniq, **fields):
+    scheme, _, rest = uniq.partition(":")
+    prefix, _, value = rest.partition("/")
+    return dict(uniq=uniq, scheme=scheme, prefix=prefix, value=value, **fields)
+
+
+def test_diff():
+    source = [
+        record("ark:", target="a"),
+        record("ark:99999", target="b", properties={"revision": 2}),
+        record("doi:10.1", target="c", properties={"revision": 1}),
+        record("hdl:", target="d"),
+    ]
+    target = [
+        record("ark:", target="a"),
+        record("ark:99999", target="x", properties={"revision": 1}),
+        record("ark:abc", target="y"),
+        record("doi:10.1", target="z", properties={"revision": 3}),
+    ]
+    changes = [(c.kind, c.uniq, c.fields) for c in catalogsync.diff(source, target)]
+    assert changes == [
+        (catalogsync.CHANGED, "ark:99999", ["target", "properties"]),
+        (catalogsync.REMOVED, "ark:abc", []),
+        (catalogsync.OLDER, "doi:10.1", ["target", "properties"]),
+        (catalogsync.ADDED, "hdl:", []),
+    ]
+    with pytest.raises(ValueError):
+        list(catalogsync.diff(list(reversed(source)), target))
+
+
+def create_catalog(path, entries):
+    db_url = f"sqlite:///{path}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        for entry in entries:
+            cfg.add(entry)
+    return db_url, engine
+
+
+@pytest.fixture()
+def catalogs(tmp_path):
+    source_url, source = create_catalog(tmp_path / "source.sqlite", [
+        PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"),
+        PidDefinition(scheme="ark", prefix="99999", target="https://new.example.org/${value}"),
+        PidDefinition(scheme="ark", prefix="99999", value="fk4", target="https://fk4.example.org/${value}"),
+        PidDefinition(scheme="doi", prefix="10.1234", target="https://doi.example.org/${value}",
+                      properties={"revision": 1}),
+    ])
+    target_url, target = create_catalog(tmp_path / "target.sqlite", [
+        PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"),
+        PidDefinition(scheme="ark", prefix="99999", target="https://old.example.org/${value}"),
+        PidDefinition(scheme="ark", prefix="12345", target="https://gone.example.org/${value}"),
+        PidDefinition(scheme="doi", prefix="10.1234", target="https://keep.example.org/${value}",
+                      properties={"revision": 2}),
+    ])
+    yield source_url, source, target_url, target
+    source.dispose()
+    target.dispose()
+
+
+def definitions(engine):
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        return list(catalogsync.read_catalog(catalog))
+
+
+def test_sync(catalogs):
+    _, source, _, target = catalogs
+    with rslv.lib_rslv.piddefine.get_catalog(source) as s, rslv.lib_rslv.piddefine.get_catalog(target) as t:
+        changes = list(catalogsync.diff(catalogsync.read_catalog(s), catalogsync.read_catalog(t)))
+    with rslv.lib_rslv.piddefine.get_catalog(target) as catalog:
+        version = catalog.get_version()
+        counts = catalogsync.sync(catalog, changes, batch_size=2)
+        assert catalog.get_version() > version
+    assert counts == {"added": 1, "changed": 1, "removed": 1, "older": 1}
+    synced = definitions(target)
+    expected = definitions(source)
+    # The newer revision in the target is kept
+    assert [r for r in synced if r["scheme"] != "doi"] == [r for r in expected if r["scheme"] != "doi"]
+    assert synced[-1]["target"] == "https://keep.example.org/${value}"
+    with rslv.lib_rslv.piddefine.get_catalog(target) as catalog:
+        assert catalog.get_prefix_stats("ark", "12345") is None
+        assert catalog.get_prefix_stats("ark", "99999").values == 1
+        _, definition = catalog.parse("ark:99999/fk4abc")
+        assert definition.target == "https://fk4.example.org/${value}"
+        # Nothing left to apply
+        version = catalog.get_version()
+        changes = list(catalogsync.diff(catalogsync.read_catalog(catalog), definitions(target)))
+        assert changes == []
+        assert catalogsync.sync(catalog, changes) == {"added": 0, "changed": 0, "removed": 0, "older": 0}
+        assert catalog.get_version() == version
+
+
+def run(db_url, *args):
+    runner = click.testing.CliRunner()
+    result = runner.invoke(rslv.__main__.main, list(args), env={"RSLV_DB_CONNECTION_STRING": db_url})
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_sync_commands(catalogs, tmp_path):
+    source_url, source, target_url, target = catalogs
+    dump_file = tmp_path / "source.jsonl"
+    dump_file.write_text(run(source_url, "dump").stdout)
+    result = run(target_url, "diff", str(dump_file))
+    changes = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [c["change"] for c in changes] == ["removed", "changed", "added", "older"]
+    assert json.loads(result.stderr) == {"removed": 1, "changed": 1, "added": 1, "older": 1}
+    result = run(target_url, "sync", source_url, "--keep")
+    assert json.loads(result.stdout) == {"added": 1, "changed": 1, "removed": 0, "older": 1}
+    assert [c["change"] for c in map(json.loads, run(target_url, "diff", source_url).stdout.splitlines())] == [
+        "removed", "older"
+    ]
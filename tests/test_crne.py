@@ -0,0 +1,97 @@
+"""
+Tests for the multi-resolver comparison script using in-process stand-in resolvers.
+"""
+import asyncio
+import io
+import json
+
+import fastapi
+import fastapi.responses
+import httpx
+
+import scripts.crne
+
+
+def stand_in_resolver(target_base, extra_hop=()):
+    app = fastapi.FastAPI()
+
+    @app.get("/hop/{identifier:path}")
+    async def hop(identifier: str):
+        return fastapi.responses.RedirectResponse(f"{target_base}/{identifier}")
+
+    @app.get("/{identifier:path}")
+    async def resolve(identifier: str):
+        if identifier.startswith("ark:/99999/missing"):
+            return fastapi.responses.JSONResponse({}, status_code=404)
+        if any(identifier.startswith(p) for p in extra_hop):
+            return fastapi.responses.RedirectResponse(f"/hop/{identifier}")
+        return fastapi.responses.RedirectResponse(f"{target_base}/{identifier}")
+
+    return app
+
+
+def target_app():
+    app = fastapi.FastAPI()
+
+    @app.get("/{path:path}")
+    async def landing(path: str):
+        return {"path": path}
+
+    return app
+
+
+def get_session():
+    return httpx.AsyncClient(
+        mounts={
+            "http://a.test": httpx.ASGITransport(app=stand_in_resolver("http://target.test")),
+            "http://b.test": httpx.ASGITransport(
+                app=stand_in_resolver("http://target.test", extra_hop=("ark:/12345",))
+            ),
+            "http://c.test": httpx.ASGITransport(app=stand_in_resolver("http://other.test")),
+            "http://target.test": httpx.ASGITransport(app=target_app()),
+            "http://other.test": httpx.ASGITransport(app=target_app()),
+        }
+    )
+
+
+def run(pids, resolvers, include_matches=True):
+    report = io.StringIO()
+
+    async def _run():
+        async with get_session() as session:
+            return await scripts.crne.run_comparison(
+                pids, resolvers, 4, report, include_matches=include_matches, session=session
+            )
+
+    summary = asyncio.run(_run())
+    results = {r["input"]: r for r in map(json.loads, report.getvalue().splitlines())}
+    return summary, results
+
+
+def test_compare_matching():
+    resolvers = scripts.crne.parse_resolvers(["A=http://a.test/{pid}", "B=http://b.test/{pid}"])
+    pids = [f"ark:/99999/fk{i}" for i in range(25)]
+    summary, results = run(pids, resolvers)
+    assert summary["identifiers"] == 25
+    assert summary["matches"] == 25
+    assert results["ark:/99999/fk3"]["results"]["A"]["final"] == "http://target.test/ark:/99999/fk3"
+    assert results["ark:/99999/fk3"]["results"]["A"]["hops"] == 1
+
+
+def test_compare_differences():
+    resolvers = scripts.crne.parse_resolvers(
+        ["A=http://a.test/{pid}", "B=http://b.test/{pid}", "C=http://c.test/{pid}"]
+    )
+    pids = ["ark:/12345/foo", "ark:/99999/missing"]
+    summary, results = run(pids, resolvers, include_matches=False)
+    assert summary["identifiers"] == 2
+    assert summary["matches"] == 1
+    assert results["ark:/12345/foo"]["differences"] == ["target", "hops"]
+    assert results["ark:/12345/foo"]["results"]["B"]["hops"] == 2
+    # same 404 from every resolver is a match and so not reported
+    assert "ark:/99999/missing" not in results
+
+
+def test_read_identifiers():
+    lines = ["ark:/12345/a\n", "\n", "# comment\n", " ark:/12345/b \n"]
+    assert list(scripts.crne.read_identifiers(lines)) == ["ark:/12345/a", "ark:/12345/b"]
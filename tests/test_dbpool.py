@@ -0,0 +1,70 @@
+"""
+Tests for connection pool instrumentation, including behavior at pool exhaustion.
+"""
+import concurrent.futures
+import time
+
+import pytest
+import sqlalchemy
+import sqlalchemy.exc
+
+import rslv.dbpool
+import rslv.metrics
+
+
+def get_engine(tmp_path, **options):
+    return rslv.dbpool.create_engine(f"sqlite:///{tmp_path}/pool.sqlite", **options)
+
+
+def test_memory_sqlite_not_pooled():
+    engine = rslv.dbpool.create_engine("sqlite://", pool_size=2, max_overflow=0)
+    assert not isinstance(engine.pool, rslv.dbpool.InstrumentedQueuePool)
+    assert "pool" in rslv.dbpool.pool_metrics(engine)
+
+
+def test_pool_exhaustion(tmp_path):
+    engine = get_engine(tmp_path, pool_size=1, max_overflow=0, pool_timeout=0.2)
+    with engine.connect():
+        metrics = rslv.dbpool.pool_metrics(engine)
+        assert metrics["checked_out"] == 1
+        assert metrics["saturation"] == 1.0
+        t0 = time.perf_counter()
+        with pytest.raises(sqlalchemy.exc.TimeoutError):
+            with engine.connect():
+                pass
+        assert time.perf_counter() - t0 >= 0.2
+    metrics = rslv.dbpool.pool_metrics(engine)
+    assert metrics["timeouts"] == 1
+    assert metrics["checked_out"] == 0
+    assert metrics["checkout_wait"]["max"] >= 0.2
+    engine.dispose()
+
+
+def test_pool_queueing(tmp_path):
+    # More concurrent users than connections, checkouts queue but succeed
+    engine = get_engine(tmp_path, pool_size=2, max_overflow=0, pool_timeout=5)
+
+    def work(i):
+        with engine.connect() as connection:
+            connection.execute(sqlalchemy.text("SELECT 1"))
+            time.sleep(0.05)
+        return i
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+        assert sorted(executor.map(work, range(6))) == list(range(6))
+    metrics = rslv.dbpool.pool_metrics(engine)
+    assert metrics["timeouts"] == 0
+    assert metrics["max_checked_out"] == 2
+    assert metrics["checkout_wait"]["count"] == 6
+    assert metrics["checkout_wait"]["max"] >= 0.04
+    engine.dispose()
+
+
+def test_histogram():
+    h = rslv.metrics.Histogram(bounds=(1, 2, 3))
+    for v in (0.5, 1.5, 1.5, 2.5, 10):
+        h.observe(v)
+    assert h.count == 5
+    assert h.percentile(50) == 2
+    assert h.percentile(100) == 10
+    assert h.summary()["max"] == 10
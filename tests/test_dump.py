@@ -0,0 +1,118 @@
+"""
+Tests for dumping and loading the definition catalog as JSON lines.
+"""
+import json
+
+import click.testing
+import pytest
+import sqlalchemy
+
+import rslv.__main__
+import rslv.lib_rslv.piddefine
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+
+def create_catalog(path, description="test"):
+    db_url = f"sqlite:///{path}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, description)
+    return db_url, engine
+
+
+@pytest.fixture()
+def source(tmp_path):
+    db_url, engine = create_catalog(tmp_path / "source.sqlite")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}", properties={"revision": 2}))
+        cfg.add(PidDefinition(scheme="ark", prefix="99999", value="", target="https://example.org/${value}"))
+        cfg.add(PidDefinition(
+            scheme="doi",
+            prefix="10.1234",
+            target="https://example.org/${value}",
+            targets={"metadata": {"target": "https://example.org/${value}.ttl", "media_types": ["text/turtle"]}},
+            http_code=303,
+            canonical="https://doi.org/${prefix}/${value}",
+        ))
+        cfg.add(PidDefinition(scheme="hdl", synonym_for="doi:10.1234"))
+    yield db_url, engine
+    engine.dispose()
+
+
+def run(db_url, *args):
+    runner = click.testing.CliRunner()
+    result = runner.invoke(rslv.__main__.main, list(args), env={"RSLV_DB_CONNECTION_STRING": db_url})
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_iter_definitions(source):
+    _, engine = source
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        uniqs = [entry.uniq for entry in catalog.iter_definitions(batch_size=2)]
+    assert uniqs == sorted(uniqs)
+    assert len(uniqs) == 4
+
+
+def test_dump_round_trip(source, tmp_path):
+    db_url, _ = source
+    dump = run(db_url, "dump")
+    lines = dump.splitlines()
+    assert len(lines) == 4
+    records = [json.loads(line) for line in lines]
+    assert set(records[0]) == set(PidDefinition.DUMP_FIELDS)
+    # An empty value gives the same uniq as no value
+    assert "ark:99999" in [r["uniq"] for r in records]
+
+    target_url, target_engine = create_catalog(tmp_path / "target.sqlite")
+    dump_file = tmp_path / "dump.jsonl"
+    dump_file.write_text(dump)
+    result = json.loads(run(target_url, "load", str(dump_file)))
+    assert result == {"added": 4, "updated": 0, "unchanged": 0, "errors": []}
+    assert run(target_url, "dump") == dump
+    with rslv.lib_rslv.piddefine.get_catalog(target_engine) as catalog:
+        _, definition = catalog.parse("doi:10.1234/foo")
+        assert definition.http_code == 303
+        assert catalog.get_prefix_stats("doi", "10.1234").definitions == 1
+
+    # Loading again changes nothing, and older revisions are not loaded
+    records[0]["properties"] = {"revision": 1}
+    records[0]["target"] = "https://old.example.org/${pid}"
+    records[2]["target"] = "https://new.example.org/${value}"
+    dump_file.write_text("".join(json.dumps(r) + "\n" for r in records))
+    result = json.loads(run(target_url, "load", str(dump_file)))
+    assert result["updated"] == 1
+    assert result["unchanged"] == 2
+    assert [e["uniq"] for e in result["errors"]] == [records[0]["uniq"]]
+    target_engine.dispose()
+
+
+def test_from_dict_unknown_field():
+    with pytest.raises(ValueError):
+        PidDefinition.from_dict({"scheme": "ark", "tagret": "https://example.org/"})
+
+
+def test_load_errors(source, tmp_path):
+    db_url, _ = source
+    records = [json.loads(line) for line in run(db_url, "dump").splitlines()]
+    target_url, target_engine = create_catalog(tmp_path / "target.sqlite")
+    dump_file = tmp_path / "dump.jsonl"
+    # A line that is not JSON, and a batch failing on a definition without a scheme
+    lines = [json.dumps(records[0]), "{not json", json.dumps(records[1]), json.dumps({"scheme": None})]
+    lines += [json.dumps(r) for r in records[2:]]
+    dump_file.write_text("\n".join(lines) + "\n")
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        rslv.__main__.main, ["load", "-b", "2", str(dump_file)], env={"RSLV_DB_CONNECTION_STRING": target_url}
+    )
+    assert result.exit_code == 1
+    report = json.loads(result.output)
+    assert report["added"] == 3
+    assert report["errors"][0]["line"] == 2
+    assert report["errors"][1]["lines"] == [4, 5]
+    assert report["errors"][1]["uniq"] == [None, records[2]["uniq"]]
+    assert report["errors"][1]["error"].startswith("(sqlite3.IntegrityError)")
+    with rslv.lib_rslv.piddefine.get_catalog(target_engine) as catalog:
+        assert catalog.get_by_uniq(records[2]["uniq"]) is None
+        assert catalog.get_by_uniq(records[3]["uniq"]) is not None
+    target_engine.dispose()
@@ -0,0 +1,162 @@
+"""
+Tests for export of definitions as edge proxy redirect rules.
+
+Exported rules are checked against the responses of the resolver.
+"""
+import re
+
+import pytest
+import sqlalchemy
+
+import rslv.lib_rslv.export
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
+import rslv.lib_rslv.splitters
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+DEFINITIONS = [
+    PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"),
+    PidDefinition(scheme="ark", prefix="99999", target="https://example.org/p/${content}", http_code=301),
+    PidDefinition(scheme="ark", prefix="99999", value="fk4", target="https://fk4.example.org/${suffix}?v=${value}"),
+    PidDefinition(scheme="ark", prefix="99999", value="fk", target="https://fk.example.org/${prefix}/${suffix}"),
+    PidDefinition(
+        scheme="ark",
+        prefix="12345",
+        target="https://example.org/h/${value}",
+        properties={"strip_hyphens": False},
+    ),
+    PidDefinition(scheme="ark", prefix="22222", synonym_for="ark:99999"),
+    PidDefinition(scheme="ark", prefix="33333", target="https://example.org/${value_enc}"),
+    PidDefinition(scheme="ark", prefix="44444", splitter="nosuch.Splitter"),
+    PidDefinition(
+        scheme="ark",
+        prefix="55555",
+        target="https://example.org/${value}",
+        targets={"meta": {"target": "https://example.org/${value}.ttl", "media_types": ["text/turtle"]}},
+    ),
+    PidDefinition(scheme="ark", prefix="6666.6", target="https://example.org/6/${value}"),
+    PidDefinition(scheme="doi", target="https://doi.example.org/${content}"),
+    PidDefinition(scheme="doi", prefix="10.5061", value="dryad", target="https://dryad.example.org/${value}"),
+    PidDefinition(scheme="urn", prefix="isbn", target="https://example.org/isbn/${value}"),
+]
+
+URIS = [
+    "/ark:/99999/fk4abc",
+    "/ark:99999/fk4abc",
+    "/ark:/99999/fk4",
+    "/ark:/99999/fkabc",
+    "/ark:/99999/fk-4abc",
+    "/ark:/99999/fk4a//b",
+    "/ark:/99999/x1y2",
+    "/ark:/99999/",
+    "/ark:/99999",
+    "/ark://99999/x1",
+    "/ark:/99999/x1?info",
+    "/ark:/99999/x%31",
+    "/ark:/99999/x1/./y",
+    "/ark:/12345/a-b-c",
+    "/ark:/22222/x1",
+    "/ark:/33333/x1",
+    "/ark:/44444/x1",
+    "/ark:/55555/x1",
+    "/ark:/6666.6/x1",
+    "/ark:/6666x6/x1",
+    "/ark:/77777/x1/y2",
+    "/ark:/77777/x-1",
+    "/ark::77777/x1",
+    "/ark:/77777",
+    "/ARK:/77777/x1",
+    "/doi:10.5061/dryad.abc",
+    "/doi:10.5061/DRYAD.abc",
+    "/doi:10.5061/other",
+    "/doi:10.9999/foo",
+    "/urn:isbn:12345",
+]
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    # Identifiers of schemes with their own splitter are passed to the resolver
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": "urn"})
+    db_url = f"sqlite:///{tmp_path_factory.mktemp('export') / 'pids.sqlite'}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        for definition in DEFINITIONS:
+            cfg.add(definition)
+    index = rslv.lib_rslv.pidindex.load_index(engine)
+    rules, skipped = rslv.lib_rslv.export.compile_rules(index.definitions())
+    yield rules, skipped, db_url
+    engine.dispose()
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": rslv.lib_rslv.splitters.DEFAULT_SPLITTER})
+
+
+def test_skipped(catalog):
+    _, skipped, _ = catalog
+    reasons = {entry.uniq: entry.reason for entry in skipped}
+    assert reasons == {
+        "ark:22222": "synonym",
+        "ark:33333": "template",
+        "ark:44444": "splitter",
+        "ark:55555": "alternate_targets",
+        "urn:isbn": "splitter",
+    }
+
+
+@pytest.mark.parametrize("uri", URIS)
+def test_rules_match_resolver(catalog, app_client, uri):
+    rules, _, db_url = catalog
+    exported = rslv.lib_rslv.export.apply_rules(rules, uri)
+    if exported is None:
+        return
+    client = app_client(db_url=db_url)
+    response = client.get(uri, follow_redirects=False)
+    assert (response.status_code, response.headers["location"]) == exported
+
+
+@pytest.mark.parametrize(
+    "uri,expected",
+    [
+        ("/ark:/99999/fk4abc", (302, "https://fk4.example.org/abc?v=fk4abc")),
+        ("/ark:99999/fkabc", (302, "https://fk.example.org/99999/abc")),
+        ("/ark:/99999/x1y2", (301, "https://example.org/p/99999/x1y2")),
+        ("/ark:/12345/a-b-c", (302, "https://example.org/h/a-b-c")),
+        ("/ark:/77777/x1/y2", (302, "https://n2t.example.org/ark:/77777/x1/y2")),
+        ("/doi:10.5061/DRYAD.abc", (302, "https://dryad.example.org/DRYAD.abc")),
+        ("/doi:10.9999/foo", (302, "https://doi.example.org/10.9999/foo")),
+        # Passed to the resolver
+        ("/ark:/99999/fk4", None),
+        ("/ark:/99999/fk-4abc", None),
+        ("/ark:/99999/x1?info", None),
+        ("/ark:/99999/x%31", None),
+        ("/ark:/99999/x1/./y", None),
+        ("/ark:/22222/x1", None),
+        ("/ark:/55555/x1", None),
+        ("/ark:/6666x6/x1", (302, "https://n2t.example.org/ark:/6666x6/x1")),
+        ("/ARK:/77777/x1", None),
+        ("/urn:isbn:12345", None),
+    ],
+)
+def test_apply_rules(catalog, uri, expected):
+    rules, _, _ = catalog
+    assert rslv.lib_rslv.export.apply_rules(rules, uri) == expected
+
+
+def test_nginx_map(catalog):
+    rules, _, _ = catalog
+    text = rslv.lib_rslv.export.nginx_map(rules, no_redirect_header="x-no-redirect")
+    assert 'map "$request_method:$http_x_no_redirect:$request_uri" $rslv_redirect {' in text
+    assert '"302 https://fk4.example.org/${rslv_suffix}?v=${rslv_value}";' in text
+    assert "return 301 $rslv_location;" in text
+    entries = re.findall(r'^    "~(.*)" "(.*)";$', text, re.MULTILINE)
+    assert len(entries) == len(rules)
+    for pattern, _ in entries:
+        re.compile(pattern)
+
+
+def test_table(catalog):
+    rules, _, _ = catalog
+    lines = rslv.lib_rslv.export.table(rules).splitlines()
+    assert len(lines) == len(rules)
+    assert lines[0].split("\t")[0] == "ark:12345"
@@ -1,7 +1,7 @@
 import pytest
 
 
-from rslv.routers.resolver import CleanedIdentifierRequest
+from rslv.routers.resolver import CleanedIdentifierRequest, IdentifierRequestCleaner
 
 
 test_cases = (
@@ -122,3 +122,16 @@ def test_get_request_identifier(test, expected):
     assert res.cleaned == expected["cleaned"]
     assert res.is_introspection == expected["is_introspection"]
     assert res.has_service_url == expected["has_service_url"]
+
+
+def test_cleaner_memoized():
+    cleaner = IdentifierRequestCleaner(r"^https?://example.com/", cache_size=8)
+    a = cleaner.clean("http://example.com/ark:/12345/foo?info", "ark:/12345/foo?info")
+    b = cleaner.clean("http://example.com/ark:/12345/foo?info", "ark:/12345/foo?info")
+    assert a is b
+    assert a.parts.prefix == "12345"
+    assert a.parts.value == "foo"
+    stats = cleaner.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,86 @@
+"""
+Tests for the liveness and readiness endpoints.
+"""
+import json
+import types
+
+import pytest
+import sqlalchemy
+import sqlalchemy.event
+
+import rslv.config
+import rslv.health
+import rslv.lib_rslv.piddefine
+
+
+@pytest.fixture()
+def db_url(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'pids.sqlite'}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", target="https://example.org/${pid}"))
+    engine.dispose()
+    return db_url
+
+
+def worker_state(engine, preload_catalog=False):
+    return types.SimpleNamespace(
+        dbengine=engine,
+        settings=rslv.config.Settings(preload_catalog=preload_catalog),
+        catalog_index=None,
+        lookup_filter=None,
+        warmup=None,
+    )
+
+
+def test_checker(db_url):
+    engine = sqlalchemy.create_engine(db_url)
+    checker = rslv.health.HealthChecker(worker_state(engine), interval=1.0)
+    # Not ready before the first check
+    assert checker.result()[0] is False
+    result = checker.check()
+    assert result["ready"] is True
+    assert result["catalog_version"] == 1
+    ready, body = checker.result()
+    assert ready
+    assert json.loads(body)["catalog_version"] == 1
+    # A result that was not refreshed is stale
+    checker.max_age = -1
+    ready, body = checker.result()
+    assert not ready
+    assert json.loads(body)["failures"] == ["check: result is stale"]
+    engine.dispose()
+
+
+def test_checker_failures(tmp_path, db_url):
+    engine = sqlalchemy.create_engine(f"sqlite:///file:{tmp_path / 'missing.sqlite'}?mode=ro&uri=true")
+    checker = rslv.health.HealthChecker(worker_state(engine), interval=1.0)
+    result = checker.check()
+    assert not result["ready"]
+    assert result["failures"][0].startswith("database:")
+    engine = sqlalchemy.create_engine(db_url)
+    checker = rslv.health.HealthChecker(worker_state(engine, preload_catalog=True), interval=1.0)
+    assert checker.check()["failures"] == ["catalog: index not loaded"]
+    engine.dispose()
+
+
+def test_probes(app_client):
+    client = app_client(health_check_interval=60)
+    dbengine = client.app.state.dbengine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(dbengine, "before_cursor_execute", before_cursor_execute)
+    for _ in range(10):
+        response = client.get("/.health")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+        response = client.get("/.ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+    # Probes are answered from the last background check
+    assert statements == []
+    sqlalchemy.event.remove(dbengine, "before_cursor_execute", before_cursor_execute)
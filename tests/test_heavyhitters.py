@@ -0,0 +1,62 @@
+"""
+Tests for the space-saving tracker of the most resolved definitions.
+"""
+import collections
+import random
+
+import rslv.lib_rslv.heavyhitters
+
+
+def test_exact_below_capacity():
+    counter = rslv.lib_rslv.heavyhitters.SpaceSaving(capacity=10)
+    for key in "abacabad":
+        counter.add(key, label=key.upper())
+    assert counter.top(2) == [
+        {"key": "a", "count": 4, "error": 0, "label": "A"},
+        {"key": "b", "count": 2, "error": 0, "label": "B"},
+    ]
+    assert len(counter) == 4
+
+
+def test_replace_minimum():
+    counter = rslv.lib_rslv.heavyhitters.SpaceSaving(capacity=2)
+    for key in "aab":
+        counter.add(key)
+    counter.add("c")
+    # c replaces b, the key with the minimum count, and inherits its count
+    assert {e["key"]: (e["count"], e["error"]) for e in counter.top()} == {"a": (2, 0), "c": (2, 1)}
+    counter.add("d")
+    # The oldest key with the minimum count is replaced
+    assert {e["key"]: (e["count"], e["error"]) for e in counter.top()} == {"c": (2, 1), "d": (3, 2)}
+    assert counter.total == 5
+
+
+def test_heavy_hitters_bounds():
+    rng = random.Random(1)
+    capacity = 50
+    counter = rslv.lib_rslv.heavyhitters.SpaceSaving(capacity=capacity)
+    stream = [f"k{min(int(rng.paretovariate(1.0)), 5000)}" for _ in range(20000)]
+    for key in stream:
+        counter.add(key)
+    actual = collections.Counter(stream)
+    top = {e["key"]: e for e in counter.top(capacity)}
+    assert len(top) == capacity
+    for key, n in actual.items():
+        if n > len(stream) / capacity:
+            assert key in top
+    for key, e in top.items():
+        assert e["count"] - e["error"] <= actual[key] <= e["count"]
+
+
+def test_traffic_tracker():
+    tracker = rslv.lib_rslv.heavyhitters.TrafficTracker(capacity=10)
+    tracker.add("ark:99999", "ark", "99999", "")
+    tracker.add("ark:99999/x", "ark", "99999", "x")
+    tracker.add("ark:99999", "ark", "99999", "")
+    top = tracker.top(1)
+    assert top["requests"] == 3
+    assert top["definitions"] == [
+        {"uniq": "ark:99999", "scheme": "ark", "prefix": "99999", "value": "", "count": 2, "error": 0}
+    ]
+    assert top["prefixes"] == [{"scheme": "ark", "prefix": "99999", "count": 3, "error": 0}]
+    assert tracker.stats() == {"requests": 3, "definitions": 2, "prefixes": 1}
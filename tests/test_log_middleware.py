@@ -0,0 +1,85 @@
+"""
+Tests for access log sampling and rollups.
+"""
+import json
+import logging
+
+import pytest
+
+import rslv.lib_rslv.piddefine
+import rslv.log_middleware
+import rslv.replay
+
+
+def test_log_sampler():
+    sampler = rslv.log_middleware.LogSampler({"3xx": 0.0, "404": 1.0, "4xx": 0.0})
+    assert sampler.keep(200)
+    assert not sampler.keep(302)
+    assert sampler.keep(404)
+    assert not sampler.keep(429)
+    assert sampler.keep(500)
+    assert sampler.stats() == {"kept": 3, "dropped": 2}
+    sampler = rslv.log_middleware.LogSampler({"3xx": 0.25})
+    kept = sum(sampler.keep(302) for _ in range(4000))
+    assert 800 < kept < 1200
+
+
+def test_log_aggregator():
+    aggregator = rslv.log_middleware.LogAggregator(
+        logging.getLogger("test"), max_groups=2, reservoir_size=10
+    )
+    for i in range(100):
+        aggregator.add("ark", "99999", 302, (i + 1) / 1000.0)
+    aggregator.add("doi", "", 302, 0.5)
+    aggregator.add("doi", "10.1234", 302, 0.2)
+    aggregator.add("doi", "10.5678", 404, 0.1)
+    rollup = aggregator.rollup()
+    assert rollup["requests"] == 103
+    groups = {(g["scheme"], g["prefix"], g["status_code"]): g for g in rollup["groups"]}
+    ark = groups[("ark", "99999", 302)]
+    assert ark["count"] == 100
+    assert ark["latency"]["max"] == pytest.approx(0.1)
+    assert ark["latency"]["mean"] == pytest.approx(0.0505)
+    # Groups beyond the maximum are counted together
+    assert groups[("*", "*", 302)]["count"] == 1
+    assert groups[("*", "*", 404)]["count"] == 1
+    # Counts are reset by a rollup
+    assert aggregator.rollup()["requests"] == 0
+
+
+def test_rollup_format():
+    formatter = rslv.log_middleware.JsonFormatter("%(asctime)s")
+    record = logging.LogRecord("rslv", logging.INFO, __file__, 1, "rollup 1 requests", None, None)
+    record.rollup = {"requests": 1, "groups": []}
+    line = formatter.format(record)
+    assert json.loads(line)["rollup"]["requests"] == 1
+    # Rollups are not replayed as requests
+    assert rslv.replay.parse_log_line(line) is None
+
+
+@pytest.fixture()
+def client(app_client):
+    definitions = [
+        rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"),
+        rslv.lib_rslv.piddefine.PidDefinition(
+            scheme="ark", prefix="99999", target="https://example.org/${value}"
+        ),
+    ]
+    return app_client(definitions, log_sample_rates={"3xx": 0.0}, log_rollup_interval=3600)
+
+
+def test_sampled_access_log(client, caplog):
+    caplog.set_level(logging.INFO, logger="rslv")
+    for _ in range(3):
+        assert client.get("/ark:99999/foo", follow_redirects=False).status_code == 302
+    assert client.get("/ark:12345/foo", follow_redirects=False).status_code == 302
+    assert client.get("/bark:99999/foo").status_code == 404
+    # Probes are neither logged nor aggregated
+    assert client.get("/.health").status_code == 200
+    assert client.get("/.ready").status_code == 200
+    requests = [r for r in caplog.records if hasattr(r, "extra_info")]
+    assert [r.extra_info["res"]["status_code"] for r in requests] == [404]
+    assert requests[0].extra_info["req"]["has_query"] is False
+    rollup = client.app.state.log_aggregator.rollup()
+    counts = {(g["scheme"], g["prefix"], g["status_code"]): g["count"] for g in rollup["groups"]}
+    assert counts == {("ark", "99999", 302): 3, ("ark", "", 302): 1, ("", "", 404): 1}
@@ -0,0 +1,100 @@
+"""
+Tests for early rejection of identifiers that can not match a definition.
+"""
+import pytest
+import sqlalchemy
+import sqlalchemy.event
+
+import rslv.lib_rslv
+import rslv.lib_rslv.lookupfilter
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+split = rslv.lib_rslv.split_identifier_string
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'pids.sqlite'}")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"))
+        cfg.add(PidDefinition(scheme="ark", prefix="99999", target="https://example.org/${value}"))
+        cfg.add(PidDefinition(scheme="doi", prefix="10.1234", target="https://example.org/${value}"))
+        cfg.add(PidDefinition(scheme="doi", prefix="10.5678", value="abc", target="https://example.org/${value}"))
+    yield engine
+    engine.dispose()
+
+
+def test_reject_unknown_scheme(engine):
+    lookup_filter = rslv.lib_rslv.lookupfilter.LookupFilter()
+    # Nothing is rejected before loading
+    assert not lookup_filter.rejects(split("wp-login.php"))
+    assert lookup_filter.refresh(engine)
+    assert not lookup_filter.refresh(engine)
+    assert lookup_filter.rejects(split("wp-login.php"))
+    assert lookup_filter.rejects(split("bark:99999/foo"))
+    assert not lookup_filter.rejects(split("ark:99999/foo"))
+    assert not lookup_filter.rejects(split("doi:10.9999/foo"))
+    assert lookup_filter.stats()["rejected_schemes"] == 2
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_unmatched_prefix(engine, use_index):
+    lookup_filter = rslv.lib_rslv.lookupfilter.LookupFilter()
+    lookup_filter.refresh(engine)
+    index = rslv.lib_rslv.pidindex.load_index(engine) if use_index else None
+    with rslv.lib_rslv.piddefine.get_catalog(engine, index=index) as catalog:
+        for pid in ("doi:10.9999/foo", "doi:10.5678/xyz", "ark:00000/foo"):
+            lookup_filter.unmatched(catalog, split(pid))
+    # Only cached if no value could match
+    assert lookup_filter.rejects(split("doi:10.9999/bar"))
+    assert lookup_filter.rejects(split("doi:10.9999/BAR"))
+    assert not lookup_filter.rejects(split("doi:10.5678/abc"))
+    assert not lookup_filter.rejects(split("ark:00000/foo"))
+    # Catalog changes invalidate unmatched pairs
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(PidDefinition(scheme="doi", prefix="10.9999", target="https://example.org/${value}"))
+        cfg.add(PidDefinition(scheme="purl", target="https://purl.example.org/${content}"))
+    assert lookup_filter.refresh(engine)
+    assert not lookup_filter.rejects(split("doi:10.9999/bar"))
+    assert not lookup_filter.rejects(split("purl:dc/terms"))
+
+
+def test_has_prefix(engine):
+    index = rslv.lib_rslv.pidindex.load_index(engine)
+    assert index.has_prefix("ark", "")
+    assert index.has_prefix("ark", "99999")
+    assert index.has_prefix("doi", "10.5678")
+    assert not index.has_prefix("doi", "10.567")
+    assert not index.has_prefix("doi", "")
+    assert not index.has_prefix("zzz", "")
+
+
+def test_fast_not_found(engine, app_client):
+    client = app_client(db_url=str(engine.url), config_poll_interval=60)
+    dbengine = client.app.state.dbengine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(dbengine, "before_cursor_execute", before_cursor_execute)
+    response = client.get("/wp-login.php")
+    assert response.status_code == 404
+    assert response.json()["error"] == "No match was found for wp-login.php"
+    response = client.get("/.info/bark:99999")
+    assert response.status_code == 404
+    assert statements == []
+    # The first unmatched lookup is remembered
+    assert client.get("/doi:10.9999/foo").status_code == 404
+    n = len(statements)
+    assert n > 0
+    assert client.get("/doi:10.9999/bar").status_code == 404
+    assert len(statements) == n
+    assert client.get("/ark:99999/foo", follow_redirects=False).status_code == 302
+    metrics = client.get("/.metrics").json()["lookup_filter"]
+    assert metrics["rejected_schemes"] == 2
+    assert metrics["rejected_prefixes"] == 1
+    sqlalchemy.event.remove(dbengine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,157 @@
+"""
+Tests for incremental maintenance of catalog metadata.
+"""
+import pytest
+import sqlalchemy
+import sqlalchemy.event
+import sqlalchemy.exc
+import rslv.lib_rslv.piddefine
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+
+def stats_rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(
+            sqlalchemy.select(rslv.lib_rslv.piddefine.PidPrefixStats.__table__).order_by(
+                "scheme", "prefix"
+            )
+        ).fetchall()
+
+
+def test_incremental_metadata():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        version = catalog.get_metadata()["version"]
+        catalog.add(PidDefinition(scheme="ark"))
+        catalog.add(PidDefinition(scheme="ark", prefix="99999"))
+        catalog.add(PidDefinition(scheme="ark", prefix="99999", value="fk4"))
+        catalog.add(PidDefinition(scheme="ark", prefix="99999", value="fk4tst"))
+        catalog.add(PidDefinition(scheme="ark", prefix="12345", value="x"))
+        assert catalog.get_metadata()["version"] == version + 5
+        assert catalog.get_max_value_length() == 6
+        stats = catalog.get_prefix_stats("ark", "99999")
+        assert (stats.definitions, stats.values) == (3, 2)
+        assert (stats.min_value_length, stats.max_value_length) == (3, 6)
+        assert catalog.get_prefix_stats("ark", "").values == 0
+        assert catalog.get_prefix_stats("ark", "55555") is None
+
+        _, definition = catalog.parse("ark:/99999/fk4tstabc")
+        assert definition.uniq == "ark:99999/fk4tst"
+        # Shorter than the shortest value under the prefix
+        _, definition = catalog.parse("ark:/99999/fk")
+        assert definition.uniq == "ark:99999"
+        # No definitions under the prefix
+        _, definition = catalog.parse("ark:/55555/fk4")
+        assert definition.uniq == "ark:"
+
+        catalog.update(PidDefinition(uniq="ark:99999/fk4", target="https://example.org/", properties={}))
+        assert catalog.get_metadata()["version"] == version + 6
+
+        assert catalog.delete("ark:99999/fk4tst")
+        assert not catalog.delete("ark:99999/fk4tst")
+        assert catalog.get_metadata()["version"] == version + 7
+        assert catalog.get_max_value_length() == 3
+        stats = catalog.get_prefix_stats("ark", "99999")
+        assert (stats.min_value_length, stats.max_value_length) == (3, 3)
+        assert catalog.delete("ark:12345/x")
+        assert catalog.get_prefix_stats("ark", "12345") is None
+
+        # A full recompute agrees with the incrementally maintained stats
+        incremental = stats_rows(engine)
+        catalog.refresh_metadata()
+        assert stats_rows(engine) == incremental
+        assert catalog.get_metadata()["version"] == version + 9
+
+
+def test_max_value_length_incremental():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if "max(piddef_stats.max_value_length)" in statement:
+            statements.append(statement)
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        catalog.add(PidDefinition(scheme="ark", prefix="1", value="abcd"))
+        catalog.add(PidDefinition(scheme="ark", prefix="2", value="ab"))
+        catalog.delete("ark:2/ab")
+        # Additions and changes to shorter prefixes do not scan all prefix stats
+        assert statements == []
+        assert catalog.get_max_value_length() == 4
+        catalog.add(PidDefinition(scheme="ark", prefix="2", value="abc"))
+        catalog.delete("ark:1/abcd")
+        assert len(statements) == 1
+        assert catalog.get_max_value_length() == 3
+    sqlalchemy.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_unique_definitions():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert catalog.add(PidDefinition(scheme="ark", prefix="12345")) == "ark:12345"
+    # A missing and an empty value are the same definition
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
+            catalog.add(PidDefinition(scheme="ark", prefix="12345", value=""))
+    # Also when given a different uniq, e.g. from an old dump
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
+            catalog.add(PidDefinition(uniq="ark:12345/", scheme="ark", prefix="12345", value=""))
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert PidDefinition.from_dict({"uniq": "ark:12345/", "scheme": "ark", "prefix": "12345"}).uniq == "ark:12345"
+        assert catalog.get_by_uniq("ark:12345/").uniq == "ark:12345"
+        assert catalog.get_prefix_stats("ark", "12345").definitions == 1
+
+
+def test_upsert_many():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        catalog.add(PidDefinition(scheme="ark", prefix="99999", target="https://a.example.org/", properties={"revision": 2}))
+        catalog.add(PidDefinition(scheme="ark", prefix="12345", target="https://b.example.org/"))
+        version = catalog.get_version()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement.split()[0], executemany))
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        entries = [
+            PidDefinition(scheme="ark", prefix="99999", target="https://old.example.org/", properties={"revision": 1}),
+            PidDefinition(scheme="ark", prefix="12345", target="https://c.example.org/", pid_model="ark"),
+            PidDefinition(scheme="ark", prefix="12345", value="x", target="https://d.example.org/"),
+            PidDefinition(scheme="ark", prefix="12345", value="y", target="https://e.example.org/"),
+            PidDefinition(scheme="ark", prefix="55555", value="z", target="https://f.example.org/"),
+        ]
+        results = catalog.upsert_many(entries)
+    sqlalchemy.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert [(r["uniq"], r["n_changes"]) for r in results] == [
+        ("ark:99999", 0), ("ark:12345", 2), ("ark:12345/x", -1), ("ark:12345/y", -1), ("ark:55555/z", -1)
+    ]
+    assert "newer revision" in results[0]["error"]
+    # Existing definitions and prefix stats are each read with one query,
+    # and new definitions inserted together
+    assert [s[0] for s in statements].count("SELECT") == 4
+    assert ("INSERT", True) in statements
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert catalog.get_by_uniq("ark:99999").target == "https://a.example.org/"
+        assert catalog.get_by_uniq("ark:12345").pid_model == "ark"
+        assert catalog.get_prefix_stats("ark", "12345").values == 2
+        assert catalog.get_prefix_stats("ark", "55555").values == 1
+        assert catalog.get_version() > version
+        # Nothing to change
+        version = catalog.get_version()
+        results = catalog.upsert_many([PidDefinition(scheme="ark", prefix="12345", value="x")])
+        assert results == [{"uniq": "ark:12345/x", "n_changes": 0}]
+        assert catalog.get_version() == version
+        # With replace, fields missing from the entry take their defaults
+        results = catalog.upsert_many([PidDefinition(scheme="ark", prefix="12345", http_code=303)], replace=True)
+        assert results[0]["n_changes"] == 3
+        definition = catalog.get_by_uniq("ark:12345")
+        assert (definition.target, definition.pid_model, definition.http_code) == (None, "", 303)
@@ -0,0 +1,214 @@
+"""
+Tests for upgrading catalog databases created with earlier schemas.
+"""
+import pytest
+import sqlalchemy
+import rslv.lib_rslv.migrations
+import rslv.lib_rslv.piddefine
+
+# piddef as created before uniq became the primary key
+OLD_SCHEMA = [
+    """CREATE TABLE piddef (
+        uniq VARCHAR NOT NULL,
+        scheme VARCHAR NOT NULL,
+        prefix VARCHAR NOT NULL,
+        value VARCHAR NOT NULL,
+        splitter VARCHAR,
+        pid_model VARCHAR NOT NULL,
+        target VARCHAR,
+        http_code INTEGER NOT NULL,
+        canonical VARCHAR NOT NULL,
+        properties JSON,
+        synonym_for VARCHAR,
+        PRIMARY KEY (scheme, prefix, value),
+        UNIQUE (scheme, prefix, value)
+    )""",
+    "CREATE INDEX ix_piddef_uniq ON piddef (uniq)",
+    "CREATE INDEX ix_piddef_scheme ON piddef (scheme)",
+    "CREATE INDEX ix_piddef_prefix ON piddef (prefix)",
+    "CREATE INDEX ix_piddef_value ON piddef (value)",
+    """CREATE TABLE piddef_meta (
+        "key" INTEGER NOT NULL,
+        created DATETIME NOT NULL,
+        updated DATETIME,
+        max_value_length INTEGER NOT NULL,
+        description VARCHAR,
+        PRIMARY KEY ("key")
+    )""",
+    """INSERT INTO piddef_meta ("key", created, max_value_length, description)
+    VALUES (0, '2024-01-01 00:00:00', 3, 'old')""",
+]
+
+OLD_ROWS = [
+    ("ark:/", "ark", "", "", "https://n2t.net/ark:${content}", None),
+    ("ark:99999/", "ark", "99999", "", "https://example.org/${value}", None),
+    ("ark:99999/fk4", "ark", "99999", "fk4", "https://example.org/fk4/${value}", None),
+    ("ark:88888/", "ark", "88888", "", None, "ark:99999"),
+]
+
+
+def create_old_database(url="sqlite://"):
+    engine = sqlalchemy.create_engine(url)
+    with engine.begin() as connection:
+        for ddl in OLD_SCHEMA:
+            connection.exec_driver_sql(ddl)
+        for row in OLD_ROWS:
+            connection.exec_driver_sql(
+                "INSERT INTO piddef (uniq, scheme, prefix, value, pid_model, target, "
+                "http_code, canonical, synonym_for) VALUES (?, ?, ?, ?, '', ?, 302, '${pid}', ?)",
+                row,
+            )
+    return engine
+
+
+def test_migrate():
+    engine = create_old_database()
+    applied = ["uniq_primary_key", "prefix_stats", "definition_targets", "unique_definitions", "definition_keys"]
+    assert rslv.lib_rslv.migrations.pending(engine) == applied
+    assert rslv.lib_rslv.migrations.migrate(engine) == applied
+    assert rslv.lib_rslv.migrations.pending(engine) == []
+    assert rslv.lib_rslv.migrations.migrate(engine) == []
+    with engine.connect() as connection:
+        version = rslv.lib_rslv.migrations.get_schema_version(connection)
+    assert version == rslv.lib_rslv.piddefine.SCHEMA_VERSION
+    inspector = sqlalchemy.inspect(engine)
+    assert inspector.get_pk_constraint("piddef")["constrained_columns"] == ["uniq"]
+    assert [(i["name"], i["unique"]) for i in inspector.get_indexes("piddef")] == [("ix_piddef_lookup", 1)]
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert catalog.get_max_value_length() == 3
+        assert catalog.get_by_uniq("ark:99999/fk4").value_length == 3
+        parts, definition = catalog.parse("ark:/99999/fk4abc")
+        assert definition.uniq == "ark:99999/fk4"
+        parts, definition = catalog.parse("ark:/88888/foo")
+        assert definition.uniq == "ark:99999"
+
+
+def test_migrate_unique_definitions():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "v3")
+    # Schema version 3 allowed definitions differing only in the uniq of a missing value
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_piddef_lookup")
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_piddef_lookup ON piddef (scheme, prefix, value, value_length)"
+        )
+        for uniq, prefix in [("ark:12345", "12345"), ("ark:12345/", "12345"), ("ark:99999/", "99999")]:
+            connection.exec_driver_sql(
+                "INSERT INTO piddef (uniq, scheme, prefix, value, value_length, pid_model, http_code, canonical) "
+                "VALUES (?, 'ark', ?, '', 0, '', 302, '${pid}')",
+                (uniq, prefix),
+            )
+        rslv.lib_rslv.migrations.set_schema_version(connection, 3)
+    assert rslv.lib_rslv.migrations.migrate(engine) == ["unique_definitions", "definition_keys"]
+    with engine.connect() as connection:
+        uniqs = connection.exec_driver_sql("SELECT uniq FROM piddef ORDER BY uniq").scalars().all()
+    assert uniqs == ["ark:12345", "ark:99999"]
+    assert sqlalchemy.inspect(engine).get_indexes("piddef")[0]["unique"]
+
+
+def test_migrate_definition_keys():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "v4")
+    # Schema version 4 stored DOI definitions as given, which were never matched
+    with engine.begin() as connection:
+        for uniq, prefix, value in [
+            ("doi:10.5061/DRYAD", "10.5061", "DRYAD"),
+            ("doi:10.1234/Abc", "10.1234", "Abc"),
+            ("doi:10.1234/abc", "10.1234", "abc"),
+        ]:
+            connection.exec_driver_sql(
+                "INSERT INTO piddef (uniq, scheme, prefix, value, value_length, pid_model, http_code, canonical) "
+                "VALUES (?, 'doi', ?, ?, ?, '', 302, '${pid}')",
+                (uniq, prefix, value, len(value)),
+            )
+        rslv.lib_rslv.migrations.set_schema_version(connection, 4)
+    assert rslv.lib_rslv.migrations.migrate(engine) == ["definition_keys"]
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert [d.uniq for d in catalog.iter_definitions()] == ["doi:10.1234/abc", "doi:10.5061/dryad"]
+        _, definition = catalog.parse("doi:10.5061/DRYAD.x")
+        assert definition.uniq == "doi:10.5061/dryad"
+
+
+def test_migrate_current():
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "current")
+    assert rslv.lib_rslv.migrations.pending(engine) == []
+
+
+def test_migrate_uninitialized():
+    engine = sqlalchemy.create_engine("sqlite://")
+    assert rslv.lib_rslv.migrations.pending(engine) == []
+    with pytest.raises(ValueError):
+        rslv.lib_rslv.migrations.migrate(engine)
+
+
+def assert_rebuilt(engine):
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        assert catalog.get_metadata()["description"] == "old"
+        assert catalog.get_max_value_length() == 3
+        parts, definition = catalog.parse("ark:/99999/fk4abc")
+        assert definition.uniq == "ark:99999/fk4"
+    with engine.connect() as connection:
+        version = rslv.lib_rslv.migrations.get_schema_version(connection)
+    assert version == rslv.lib_rslv.piddefine.SCHEMA_VERSION
+    inspector = sqlalchemy.inspect(engine)
+    assert [(i["name"], i["unique"]) for i in inspector.get_indexes("piddef")] == [("ix_piddef_lookup", 1)]
+    assert not inspector.has_table("piddef_rebuild")
+
+
+def test_rebuild_file(tmp_path):
+    db_path = tmp_path / "pids.sqlite"
+    engine = create_old_database(f"sqlite:///{db_path}")
+    result = rslv.lib_rslv.migrations.rebuild(engine)
+    assert result == {"method": "file", "definitions": len(OLD_ROWS)}
+    assert not (tmp_path / "pids.sqlite_rebuild").exists()
+    assert_rebuilt(engine)
+
+
+def test_rebuild_table(tmp_path):
+    engine = create_old_database(f"sqlite:///{tmp_path / 'pids.sqlite'}")
+    # The table rebuild only replaces piddef, so the schema must be current
+    with pytest.raises(ValueError):
+        rslv.lib_rslv.migrations.rebuild(engine, method="table")
+    rslv.lib_rslv.migrations.migrate(engine)
+    result = rslv.lib_rslv.migrations.rebuild(engine, method="table")
+    assert result == {"method": "table", "definitions": len(OLD_ROWS)}
+    assert_rebuilt(engine)
+
+
+def test_rebuild_table_from_source(tmp_path):
+    source = create_old_database(f"sqlite:///{tmp_path / 'source.sqlite'}")
+    engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(engine, "old")
+    result = rslv.lib_rslv.migrations.rebuild(engine, source_engine=source)
+    assert result == {"method": "table", "definitions": len(OLD_ROWS)}
+    assert_rebuilt(engine)
+
+
+def test_rebuild_normalizes_source(tmp_path):
+    # Schema version 3 had no unique lookup index and did not normalize keys
+    source = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'source.sqlite'}")
+    rslv.lib_rslv.piddefine.create_database(source, "old")
+    with source.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_piddef_lookup")
+        for uniq, prefix, value, target in [
+            ("doi:10.5061/DRYAD", "10.5061", "DRYAD", "https://example.org/${value}"),
+            ("doi:10.1234/", "10.1234", "", "https://example.org/dup/${value}"),
+            ("doi:10.1234", "10.1234", "", "https://example.org/${value}"),
+        ]:
+            connection.exec_driver_sql(
+                "INSERT INTO piddef (uniq, scheme, prefix, value, value_length, pid_model, target, "
+                "http_code, canonical) VALUES (?, 'doi', ?, ?, ?, '', ?, 302, '${pid}')",
+                (uniq, prefix, value, len(value), target),
+            )
+        rslv.lib_rslv.migrations.set_schema_version(connection, 3)
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'pids.sqlite'}")
+    rslv.lib_rslv.piddefine.create_database(engine, "current")
+    result = rslv.lib_rslv.migrations.rebuild(engine, source_engine=source, method="file")
+    assert result == {"method": "file", "definitions": 2}
+    assert rslv.lib_rslv.migrations.pending(engine) == []
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        _, definition = catalog.parse("doi:10.5061/dryad.abc")
+        assert definition.uniq == "doi:10.5061/dryad"
+        # The definition stored with the normalized uniq is kept
+        assert catalog.get_by_uniq("doi:10.1234").target == "https://example.org/${value}"
@@ -5,6 +5,7 @@ import pytest
 import sqlalchemy
 import sqlalchemy.orm
 import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
 
 # In memory database for testing
 db_connection_string = "sqlite://"
@@ -116,6 +117,29 @@ def test_parse(test, expected):
             assert definition.value == expected.get("value", '')
 
 
+@pytest.mark.parametrize("test,expected", parse_cases)
+def test_parse_indexed(test, expected):
+    index = rslv.lib_rslv.pidindex.load_index(engine)
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        expected_parts, expected_definition = cfg.parse(test)
+    with rslv.lib_rslv.piddefine.get_catalog(engine, index=index) as cfg:
+        parts, definition = cfg.parse(test)
+    assert parts == expected_parts
+    if expected_definition is None:
+        assert definition is None
+    else:
+        assert definition.uniq == expected_definition.uniq
+        assert definition.properties == expected_definition.properties
+
+
+def test_index_buffers():
+    index = rslv.lib_rslv.pidindex.load_index(engine)
+    assert len(index) == 9
+    assert index.get_exact("ark", "99999", "fk4").uniq == "ark:99999/fk4"
+    assert index.get_exact("ark", "99999", "fk44") is None
+    assert index.get_longest("ark", "99999", "fk44").value == "fk4"
+
+
 def test_update():
     with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
         revised_entry = rslv.lib_rslv.piddefine.PidDefinition(
@@ -137,3 +161,19 @@ def test_update():
         assert n == 1
         e = cfg.get_by_uniq(revised_entry.uniq)
         assert e.properties == revised_entry.properties
+
+
+def test_lookup_query_plan():
+    import scripts.explain_lookup
+
+    plans = scripts.explain_lookup.explain(
+        engine, ["ark:", "ark:/99999", "ark:/99999/fk4abc", "ark:/12345/foo"]
+    )
+    assert len(plans) > 0
+    for entry in plans:
+        # Every lookup is an index search, never a table scan
+        assert not any(p.startswith("SCAN") for p in entry["plan"])
+        if "FROM piddef \n" in entry["statement"]:
+            assert any("USING INDEX ix_piddef_lookup" in p for p in entry["plan"])
+        else:
+            assert any("USING INDEX sqlite_autoindex_piddef_stats" in p for p in entry["plan"])
@@ -0,0 +1,88 @@
+"""
+Tests for offline validation of definition templates.
+"""
+import pytest
+import sqlalchemy
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.pidindex
+import rslv.lib_rslv.pidcheck
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+engine = sqlalchemy.create_engine("sqlite://", echo=False)
+rslv.lib_rslv.piddefine.clear_database(engine)
+rslv.lib_rslv.piddefine.create_database(engine, "test")
+
+with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+    cfg.add(PidDefinition(scheme="ark", target="https://n2t.net/ark:${content}"))
+    cfg.add(PidDefinition(scheme="ark", prefix="99999", target="https://example.org/${value}"))
+    cfg.add(PidDefinition(scheme="ark", prefix="12345", target="https://example.org/${bogus}"))
+    cfg.add(PidDefinition(scheme="ark", prefix="12346", target="example.org/${value}"))
+    cfg.add(PidDefinition(scheme="ark", prefix="12347", target="/.info/${pid}"))
+    cfg.add(PidDefinition(scheme="ark", prefix="22222", synonym_for="ark:99999"))
+    cfg.add(PidDefinition(scheme="ark", prefix="33333", synonym_for="nope:77777"))
+    cfg.add(PidDefinition(scheme="ark", prefix="44444", synonym_for="ark:55555"))
+    cfg.add(PidDefinition(scheme="ark", prefix="55555", synonym_for="ark:44444"))
+    cfg.add(PidDefinition(scheme="ark", prefix="66666", splitter="nosuch.Splitter"))
+    cfg.add(
+        PidDefinition(
+            scheme="ark",
+            prefix="77777",
+            target="https://example.org/${value}",
+            targets={"meta": {"target": "ftp://example.org/${value}", "media_types": ["text/turtle"]}},
+        )
+    )
+
+index = rslv.lib_rslv.pidindex.load_index(engine)
+
+
+@pytest.mark.parametrize(
+    "template,expected",
+    [
+        (None, 0),
+        ("https://example.org/${value}", 0),
+        ("https://example.org/$value/${value_enc}", 0),
+        ("https://example.org/${bogus}", 1),
+        ("https://example.org/${value", 1),
+        ("https://example.org/$$value", 0),
+    ],
+)
+def test_template_problems(template, expected):
+    assert len(rslv.lib_rslv.pidcheck.template_problems(template)) == expected
+
+
+@pytest.mark.parametrize(
+    "url,ok",
+    [
+        ("https://example.org/foo", True),
+        ("/.info/ark:99999", True),
+        ("example.org/foo", False),
+        ("ftp://example.org/foo", False),
+        ("https://example.org/foo bar", False),
+        ("https:///foo", False),
+    ],
+)
+def test_url_problem(url, ok):
+    assert (rslv.lib_rslv.pidcheck.url_problem(url) is None) == ok
+
+
+def test_check_index():
+    problems = rslv.lib_rslv.pidcheck.check_index(index, jobs=1)
+    found = {(p.uniq, p.problem) for p in problems}
+    assert found == {
+        ("ark:12345", "bad_placeholder"),
+        ("ark:12346", "invalid_url"),
+        ("ark:33333", "synonym_missing"),
+        ("ark:44444", "synonym_loop"),
+        ("ark:55555", "synonym_loop"),
+        ("ark:66666", "bad_splitter"),
+        ("ark:77777", "invalid_url"),
+    }
+
+
+def test_check_index_parallel():
+    serial = rslv.lib_rslv.pidcheck.check_index(index, jobs=1)
+    parallel = rslv.lib_rslv.pidcheck.check_index(index, jobs=2, chunk_size=2)
+    assert sorted((p.uniq, p.problem, p.detail) for p in parallel) == sorted(
+        (p.uniq, p.problem, p.detail) for p in serial
+    )
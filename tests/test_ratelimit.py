@@ -0,0 +1,106 @@
+"""
+Tests for per client rate limiting and admission control.
+"""
+import pytest
+import starlette.requests
+
+import rslv.log_middleware
+import rslv.ratelimit
+
+
+def test_token_buckets():
+    buckets = rslv.ratelimit.TokenBuckets(rate=2.0, burst=3.0)
+    assert [buckets.take("a", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("a", now=0.0) == pytest.approx(0.5)
+    # Other clients have their own bucket
+    assert buckets.take("b", now=0.0) == 0.0
+    # Refilled at rate tokens per second
+    assert buckets.take("a", now=0.5) == 0.0
+    assert buckets.take("a", now=0.5) == pytest.approx(0.5)
+
+
+def test_token_buckets_bounded():
+    buckets = rslv.ratelimit.TokenBuckets(rate=0.01, burst=2.0, max_clients=10, evict_interval=100.0)
+    for i in range(10):
+        buckets.take(str(i), now=float(i))
+    assert len(buckets) == 10
+    # Full table drops the least recently used half
+    buckets.take("new", now=10.0)
+    assert len(buckets) == 6
+    assert buckets.take("9", now=10.0) == 0.0
+    # Refilled buckets are evicted periodically
+    buckets.take("x", now=1000.0)
+    assert len(buckets) == 1
+
+
+def test_client_key():
+    scope = {
+        "type": "http",
+        "headers": [(b"x-forwarded-for", b"203.0.113.9, 192.0.2.1, 10.0.0.1")],
+        "client": ("10.0.0.2", 1234),
+    }
+    conn = starlette.requests.HTTPConnection(scope)
+    assert rslv.log_middleware.client_key(conn) == "10.0.0.2"
+    assert rslv.log_middleware.client_key(conn, trusted_proxies=1) == "10.0.0.1"
+    assert rslv.log_middleware.client_key(conn, trusted_proxies=2) == "192.0.2.1"
+    assert rslv.log_middleware.client_key(conn, trusted_proxies=5) == "203.0.113.9"
+
+
+def test_concurrency_cap():
+    limiter = rslv.ratelimit.RateLimiter(max_concurrent=2)
+    scope = {"type": "http", "path": "/ark:99999/foo", "headers": [], "client": ("10.0.0.1", 1234)}
+    assert limiter.check(scope) is None
+    limiter.in_flight = 2
+    response = limiter.check(scope)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert limiter.stats()["shed"] == 1
+
+
+@pytest.fixture()
+def client(app_client):
+    return app_client(
+        rate_limit_enabled=True,
+        rate_limits={"/": (0.01, 2), "/.info": (0.01, 1)},
+        rate_limit_trusted_proxies=1,
+    )
+
+
+def test_rate_limit(client):
+    for _ in range(2):
+        response = client.get("/ark:99999/foo", follow_redirects=False)
+        assert response.status_code == 302
+    response = client.get("/ark:99999/foo", follow_redirects=False)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    # /.info has a separate limit
+    assert client.get("/.info/ark:99999").status_code == 200
+    assert client.get("/.info/ark:99999").status_code == 429
+    # Clients are keyed on the address added by the trusted proxy
+    headers = {"x-forwarded-for": "192.0.2.1, 10.0.0.1"}
+    response = client.get("/ark:99999/foo", headers=headers, follow_redirects=False)
+    assert response.status_code == 302
+    # Addresses set by the client do not select another bucket
+    headers = {"x-forwarded-for": "192.0.2.2, 10.0.0.1"}
+    response = client.get("/ark:99999/foo", headers=headers, follow_redirects=False)
+    assert response.status_code == 302
+    response = client.get("/ark:99999/foo", headers=headers, follow_redirects=False)
+    assert response.status_code == 429
+    assert client.app.state.rate_limiter.stats()["limited"] == 3
+
+
+def test_probes_exempt(client):
+    for _ in range(3):
+        client.get("/ark:99999/foo", follow_redirects=False)
+    # Probes from a limited client, or to a busy worker, are still answered
+    for _ in range(4):
+        assert client.get("/.health").status_code == 200
+        assert client.get("/.ready").status_code == 200
+    limiter = client.app.state.rate_limiter
+    limiter.max_concurrent = 1
+    limiter.in_flight = 1
+    try:
+        assert client.get("/.ready").status_code == 200
+        assert client.get("/.info/ark:99999").status_code == 503
+    finally:
+        limiter.in_flight = 0
@@ -0,0 +1,96 @@
+"""
+Tests for replaying access logs.
+"""
+import asyncio
+import json
+
+import fastapi
+import fastapi.responses
+
+import rslv.metrics
+import rslv.replay
+
+
+def make_log_line(url, t="2025-01-01T00:00:00.000Z", query="", status=302, has_query=None):
+    return json.dumps(
+        {
+            "t": t,
+            "level": "INFO",
+            "name": "rslv",
+            "msg": f"GET {url}",
+            "req": [
+                {
+                    "url": url,
+                    "query": query,
+                    "has_query": bool(query) if has_query is None else has_query,
+                    "headers": {"host": "example.com", "user_agent": "test", "accept": "*/*"},
+                    "method": "GET",
+                    "http_version": "1.1",
+                    "client_addr": "127.0.0.1",
+                    "forward": None,
+                }
+            ],
+            "res": {"status_code": status},
+        }
+    )
+
+
+def stand_in_app():
+    app = fastapi.FastAPI()
+
+    @app.get("/{identifier:path}")
+    async def resolve(identifier: str):
+        if identifier.startswith("ark:"):
+            return fastapi.responses.RedirectResponse(f"https://example.org/{identifier}")
+        return fastapi.responses.JSONResponse({"error": "not found"}, status_code=404)
+
+    return app
+
+
+def test_parse_log_line():
+    request = rslv.replay.parse_log_line(make_log_line("/ark:99999/foo", query="info"))
+    assert request.url == "/ark:99999/foo?info"
+    assert request.method == "GET"
+    assert request.headers == {"accept": "*/*", "user-agent": "test"}
+    assert request.t == 1735689600.0
+    # A bare "?" is kept
+    request = rslv.replay.parse_log_line(make_log_line("/ark:99999/foo", has_query=True))
+    assert request.url == "/ark:99999/foo?"
+    assert rslv.replay.parse_log_line(make_log_line("/ark:99999/foo")).url == "/ark:99999/foo"
+    assert rslv.replay.parse_log_line('{"t": "x", "msg": "not an access record"}') is None
+    assert rslv.replay.parse_log_line("garbage") is None
+
+
+def test_replay_fast():
+    lines = [make_log_line(f"/ark:99999/{i}") for i in range(20)]
+    lines += [make_log_line("/wp-login.php") for _ in range(5)]
+    requests = rslv.replay.read_access_log(lines)
+    report = asyncio.run(
+        rslv.replay.replay_log(requests, app=stand_in_app(), concurrency=4)
+    )
+    assert report["requests"] == 25
+    assert report["status"] == {"307": 20, "404": 5}
+    assert report["latency"]["p50"] <= report["latency"]["p99"] <= report["latency"]["max"]
+    assert report["throughput"] > 0
+
+
+def test_replay_original_timing():
+    lines = [
+        make_log_line("/ark:99999/a", t="2025-01-01T00:00:00.000Z"),
+        make_log_line("/ark:99999/b", t="2025-01-01T00:00:00.400Z"),
+    ]
+    requests = rslv.replay.read_access_log(lines)
+    report = asyncio.run(
+        rslv.replay.replay_log(
+            requests, app=stand_in_app(), timing=rslv.replay.TIMING_ORIGINAL, speed=2.0
+        )
+    )
+    assert report["requests"] == 2
+    assert 0.2 <= report["duration"] < 0.4
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert rslv.metrics.percentile(values, 50) == 50
+    assert rslv.metrics.percentile(values, 99) == 99
+    assert rslv.metrics.percentile([], 50) == 0.0
@@ -0,0 +1,121 @@
+"""
+Tests for reading the catalog from read replicas, using SQLite files as stand-ins.
+"""
+import time
+
+import pytest
+import sqlalchemy
+
+import rslv.dbpool
+import rslv.lib_rslv
+import rslv.lib_rslv.lookupfilter
+import rslv.lib_rslv.piddefine
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+
+def create_catalog(path, name):
+    db_url = f"sqlite:///{path}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, name)
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(PidDefinition(scheme="ark", target=f"https://{name}.example.org/${{pid}}"))
+    engine.dispose()
+    return db_url
+
+
+@pytest.fixture()
+def databases(tmp_path):
+    return {name: create_catalog(tmp_path / f"{name}.sqlite", name) for name in ("primary", "replica1", "replica2")}
+
+
+MISSING = "sqlite:///file:/nonexistent/replica.sqlite?mode=ro&uri=true"
+
+
+def test_read_engines(databases):
+    primary = sqlalchemy.create_engine(databases["primary"])
+    replicas = [sqlalchemy.create_engine(databases["replica1"]), sqlalchemy.create_engine(MISSING)]
+    read_engines = rslv.dbpool.ReadEngines(primary, replicas)
+    # Replicas are used in turn until checked
+    assert [read_engines.engine() for _ in range(4)] == replicas + replicas
+    assert read_engines.check() == 1
+    assert [read_engines.engine() for _ in range(2)] == [replicas[0], replicas[0]]
+    stats = read_engines.stats()
+    assert [r["healthy"] for r in stats["replicas"]] == [True, False]
+    assert stats["replicas"][0]["catalog_version"] == 1
+    # Reads fall back to the primary when no replica is available
+    read_engines.replicas[0] = sqlalchemy.create_engine(MISSING)
+    assert read_engines.check() == 0
+    assert read_engines.engine() is primary
+    assert read_engines.stats()["fallbacks"] == 1
+    primary.dispose()
+
+
+def test_replica_lag(databases):
+    primary = sqlalchemy.create_engine(databases["primary"])
+    replicas = [sqlalchemy.create_engine(databases["replica1"]), sqlalchemy.create_engine(databases["replica2"])]
+    read_engines = rslv.dbpool.ReadEngines(primary, replicas, max_lag=1)
+    assert read_engines.check() == 2
+    # replica2 stopped replicating while the primary changed
+    for prefix in ("1", "2"):
+        with rslv.lib_rslv.piddefine.get_catalog(primary) as catalog:
+            catalog.add(PidDefinition(scheme="ark", prefix=prefix))
+        with rslv.lib_rslv.piddefine.get_catalog(replicas[0]) as catalog:
+            catalog.add(PidDefinition(scheme="ark", prefix=prefix))
+    assert read_engines.check() == 1
+    stats = read_engines.stats()
+    assert stats["primary_version"] == 3
+    assert [(r["healthy"], r["lag"]) for r in stats["replicas"]] == [(True, 0), (False, 2)]
+    for engine in [primary] + replicas:
+        engine.dispose()
+
+
+def test_lookup_filter_follows_replicas(databases):
+    engines = [sqlalchemy.create_engine(databases[name]) for name in ("replica1", "replica2")]
+    with rslv.lib_rslv.piddefine.get_catalog(engines[1]) as catalog:
+        catalog.add(PidDefinition(scheme="doi"))
+    polled = []
+
+    def next_engine():
+        polled.append(engines[len(polled) % 2])
+        return polled[-1]
+
+    lookup_filter = rslv.lib_rslv.lookupfilter.LookupFilter()
+    lookup_filter.start(next_engine, interval=0.01)
+    try:
+        # Each refresh reads the engine returned for it
+        deadline = time.monotonic() + 5
+        while lookup_filter.version != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert lookup_filter.version == 2
+        assert len(polled) >= 2
+    finally:
+        lookup_filter.stop()
+    # Unmatched pairs are only cached from a catalog at the version of the filter
+    lookup_filter.refresh(engines[1])
+    parts = rslv.lib_rslv.split_identifier_string("doi:10.1234/foo")
+    with rslv.lib_rslv.piddefine.get_catalog(engines[0]) as catalog:
+        lookup_filter.unmatched(catalog, parts)
+    assert not lookup_filter.rejects(parts)
+    for engine in engines:
+        engine.dispose()
+
+
+def test_resolve_from_replicas(databases, app_client):
+    client = app_client(
+        db_url=databases["primary"],
+        db_read_connection_strings=[databases["replica1"], databases["replica2"], MISSING],
+    )
+    hosts = set()
+    for _ in range(4):
+        response = client.get("/ark:99999/foo", follow_redirects=False)
+        assert response.status_code == 302
+        hosts.add(response.headers["location"].split("/")[2])
+    assert hosts == {"replica1.example.org", "replica2.example.org"}
+    # Writes to the primary are not read until replicated
+    with rslv.lib_rslv.piddefine.get_catalog(client.app.state.dbengine) as catalog:
+        catalog.add(PidDefinition(scheme="doi", target="https://primary.example.org/${pid}"))
+    assert client.get("/doi:10.1234/foo").status_code == 404
+    metrics = client.get("/.metrics").json()["read_engines"]
+    assert metrics["healthy"] == 2
+    assert client.get("/.ready").status_code == 200
@@ -0,0 +1,125 @@
+"""
+Tests for the pre-forking server, run as "rslv serve" in a subprocess.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import click.testing
+import pytest
+import sqlalchemy
+
+import rslv.__main__
+import rslv.lib_rslv.piddefine
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="Worker processes are found through /proc"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    """Live child processes of pid."""
+    pids = set()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command may contain spaces, the fields after it do not
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid and fields[0] != "Z":
+            pids.add(int(entry))
+    return pids
+
+
+def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise AssertionError("Timed out waiting for condition")
+
+
+def healthy(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/.health", timeout=2) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+@pytest.fixture()
+def server(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'pids.sqlite'}"
+    engine = sqlalchemy.create_engine(db_url)
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", target="https://example.org/${pid}"))
+    engine.dispose()
+    port = free_port()
+    env = dict(
+        os.environ,
+        RSLV_DB_CONNECTION_STRING=db_url,
+        RSLV_HEALTH_CHECK_INTERVAL="0",
+        RSLV_CONFIG_POLL_INTERVAL="0",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "rslv", "serve", "-w", "2", "-h", "127.0.0.1", "-p", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        yield proc, port
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def test_prefork_lifecycle(server):
+    proc, port = server
+    wait_for(lambda: healthy(port))
+    workers = wait_for(lambda: len(children(proc.pid)) == 2 and children(proc.pid))
+
+    # SIGHUP starts a new generation of workers and stops the previous one
+    proc.send_signal(signal.SIGHUP)
+    restarted = wait_for(
+        lambda: (pids := children(proc.pid)) and len(pids) == 2 and not pids & workers and pids
+    )
+    assert healthy(port)
+
+    # A worker that dies is replaced
+    killed = next(iter(restarted))
+    os.kill(killed, signal.SIGKILL)
+    wait_for(lambda: (pids := children(proc.pid)) and len(pids) == 2 and killed not in pids)
+    wait_for(lambda: healthy(port))
+
+    # SIGTERM stops the workers, reaps them, and exits
+    workers = children(proc.pid)
+    proc.send_signal(signal.SIGTERM)
+    assert proc.wait(timeout=60) == 0
+    for pid in workers:
+        assert not os.path.exists(f"/proc/{pid}")
+
+
+def test_serve_without_uvicorn(monkeypatch):
+    # None in sys.modules makes the import fail
+    monkeypatch.setitem(sys.modules, "uvicorn", None)
+    result = click.testing.CliRunner().invoke(rslv.__main__.main, ["serve"])
+    assert result.exit_code == 1
+    assert "uvicorn is not available" in result.output
@@ -132,6 +132,26 @@ def setup_config():
                 properties={"tag": 10, "strip_hyphens": False},
             ),
         )
+        do_add(
+            cfg,
+            rslv.lib_rslv.piddefine.PidDefinition(
+                scheme="neg",
+                target="https://example.org/page/${content}",
+                targets={
+                    "metadata": {
+                        "target": "https://example.org/meta/${content}.ttl",
+                        "media_types": ["text/turtle", "application/ld+json"],
+                        "profiles": ["http://www.w3.org/ns/dcat#"],
+                        "http_code": 303,
+                    },
+                    "data": {
+                        "target": "https://example.org/data/${content}.csv",
+                        "media_types": ["text/csv"],
+                    },
+                },
+                properties={"tag": 11},
+            ),
+        )
         cfg.refresh_metadata()
     finally:
         session.close()
@@ -245,3 +265,101 @@ def test_resolve_schemes_no_redirect(test, expected):
     _match = response.json()
     L.info(json.dumps(_match, indent=2))
     assert response.status_code == 200
+
+
+def test_metrics():
+    client = fastapi.testclient.TestClient(rslv.app.app)
+    client.get("/ark:99999/foo")
+    client.get("/ark:99999/foo")
+    response = client.get("/.metrics")
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["identifier_cache"]["hits"] >= 1
+    assert "hit_ratio" in metrics["split_cache"]
+
+
+def test_top():
+    client = fastapi.testclient.TestClient(rslv.app.app)
+    for _ in range(3):
+        client.get("/ark:99999/top", follow_redirects=False)
+    response = client.get("/.top?n=5")
+    assert response.status_code == 200
+    top = response.json()
+    assert top["requests"] >= 3
+    assert any(p["scheme"] == "ark" and p["count"] >= 3 for p in top["prefixes"])
+    assert any(d["scheme"] == "ark" and d["count"] >= 3 for d in top["definitions"])
+
+
+negotiation_cases = (
+    ({"accept": ""}, "", "default", "default", "https://example.org/page/x/foo", 302),
+    ({}, "", "default", "accept", "https://example.org/page/x/foo", 302),
+    ({"accept": "text/html,application/xml;q=0.9,*/*;q=0.8"}, "", "default", "accept", "https://example.org/page/x/foo", 302),
+    ({"accept": "text/turtle"}, "", "metadata", "accept", "https://example.org/meta/x/foo.ttl", 303),
+    ({"accept": "text/html;q=0.5, text/csv"}, "", "data", "accept", "https://example.org/data/x/foo.csv", 302),
+    ({"accept": "image/png"}, "", "default", "default", "https://example.org/page/x/foo", 302),
+    ({"accept-profile": "<http://www.w3.org/ns/dcat#>"}, "", "metadata", "accept-profile", "https://example.org/meta/x/foo.ttl", 303),
+    # Negotiation parameters are removed from the identifier, others remain part of it
+    ({"accept": "text/turtle"}, "?_mediatype=text/csv", "data", "_mediatype", "https://example.org/data/x/foo.csv", 302),
+    ({}, "?_profile=metadata", "metadata", "_profile", "https://example.org/meta/x/foo.ttl", 303),
+)
+
+
+@pytest.mark.parametrize("headers,query,name,selected_by,target,status", negotiation_cases)
+def test_negotiated_target(headers, query, name, selected_by, target, status):
+    client = fastapi.testclient.TestClient(rslv.app.app)
+    response = client.get(f"/neg:x/foo{query}", headers=headers, follow_redirects=False)
+    content = response.json()
+    assert content["selected_target"] == {"name": name, "selected_by": selected_by}
+    assert response.headers["location"] == target
+    assert response.status_code == status
+    assert "Accept, Accept-Profile" in response.headers["vary"]
+
+
+def test_negotiated_info():
+    client = fastapi.testclient.TestClient(rslv.app.app)
+    response = client.get("/.info/neg:x/foo", headers={"accept": "text/csv"})
+    content = response.json()
+    assert content["target"] == "https://example.org/data/x/foo.csv"
+    assert content["selected_target"] == {"name": "data", "selected_by": "accept"}
+    assert [t["name"] for t in content["definition"]["targets"]] == ["default", "metadata", "data"]
+    # Other query parameters remain part of the identifier
+    content = client.get("/.info/neg:x/foo?a=1&_profile=metadata&b=2").json()
+    assert content["selected_target"] == {"name": "metadata", "selected_by": "_profile"}
+    assert content["pid"] == "neg:x/foo?a=1&b=2"
+    response = client.get("/ark:99999/foo", follow_redirects=False)
+    assert response.json()["selected_target"] == {"name": "default", "selected_by": "default"}
+    assert "Accept" not in response.headers.get("vary", "")
+
+
+def test_info_cache():
+    client = fastapi.testclient.TestClient(rslv.app.app)
+    response = client.get("/.info/ark:99999")
+    assert response.content == rslv.routers.render_json(response.json())
+    hits = rslv.app.app.state.info_cache.hits
+    response = client.get("/ark:99999?info")
+    assert rslv.app.app.state.info_cache.hits == hits + 1
+    assert response.json()["pid"] == "ark:99999"
+    values = response.json()["definition"]["values"]
+    assert "fk4" in values
+    # Changes to the catalog replace cached entries
+    session = get_session()
+    cfg = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+    try:
+        cfg.add(rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", prefix="99999", value="zz"))
+        response = client.get("/.info/ark:99999")
+        assert sorted(response.json()["definition"]["values"]) == sorted(values + ["zz"])
+        cfg.delete("ark:99999/zz")
+        response = client.get("/.info/ark:99999")
+        assert response.json()["definition"]["values"] == values
+    finally:
+        session.close()
+
+
+def test_info_cache_per_app(app_client):
+    # Catalogs of two apps at the same version are cached separately
+    clients = [
+        app_client([rslv.lib_rslv.piddefine.PidDefinition(scheme="ark", target=f"https://{name}.example.org/${{pid}}")])
+        for name in ("one", "two")
+    ]
+    targets = [c.get("/.info/ark:99999/x").json()["definition"]["target"] for c in clients]
+    assert targets == ["https://one.example.org/${pid}", "https://two.example.org/${pid}"]
@@ -202,3 +202,30 @@ def test_split(test, expected):
 def test_unsplit_identifier(test, template, expected):
     result = rslv.lib_rslv.unsplit_identifier_string(template, test)
     assert result == expected
+
+
+def test_parsed_identifier_immutable():
+    parsed = rslv.lib_rslv.split_identifier_string("ark:/12345/foo")
+    with pytest.raises(AttributeError):
+        parsed.value = "bar"
+    with pytest.raises(TypeError):
+        parsed["value"] = "bar"
+    replaced = parsed._replace(value="bar", suffix="")
+    assert parsed.value == "foo"
+    assert replaced.value == "bar"
+    assert replaced.pid == parsed.pid
+
+
+def test_parsed_identifier_encoded():
+    parsed = rslv.lib_rslv.split_identifier_string("ark:/12345/foo?a=b")
+    assert parsed.value_enc == "foo%3Fa%3Db"
+    assert parsed["value_enc"] == "foo%3Fa%3Db"
+    assert "value_enc" not in parsed.as_dict()
+    assert dict(parsed) == {
+        "pid": "ark:/12345/foo?a=b",
+        "scheme": "ark",
+        "content": "12345/foo?a=b",
+        "prefix": "12345",
+        "value": "foo?a=b",
+        "suffix": None,
+    }
@@ -0,0 +1,157 @@
+"""
+Tests for scheme specific splitters applied when parsing identifiers.
+"""
+import click.testing
+import pytest
+import sqlalchemy
+import rslv.__main__
+import rslv.lib_rslv
+import rslv.lib_rslv.migrations
+import rslv.lib_rslv.piddefine
+import rslv.lib_rslv.splitters
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+engine = sqlalchemy.create_engine("sqlite://", echo=False)
+rslv.lib_rslv.piddefine.clear_database(engine)
+rslv.lib_rslv.piddefine.create_database(engine, "test")
+
+with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+    cfg.add(PidDefinition(scheme="ark"))
+    cfg.add(PidDefinition(scheme="ark", prefix="99999"))
+    cfg.add(PidDefinition(scheme="ark", prefix="12345", properties={"strip_hyphens": False}))
+    cfg.add(PidDefinition(scheme="doi"))
+    cfg.add(PidDefinition(scheme="doi", prefix="10.5061", value="dryad"))
+    cfg.add(PidDefinition(scheme="urn"))
+    cfg.add(PidDefinition(scheme="urn", prefix="nbn"))
+    cfg.add(PidDefinition(scheme="urn", prefix="nbn", value="nl:ui"))
+    cfg.add(PidDefinition(scheme="foo", splitter="tests.test_splitters.UpperSplitter"))
+    cfg.add(PidDefinition(scheme="bar", splitter="missing"))
+
+
+class UpperSplitter(rslv.lib_rslv.splitters.Splitter):
+    def finish(self, parts, definition):
+        return parts._replace(value=parts.value.upper() if parts.value else parts.value)
+
+
+@pytest.mark.parametrize(
+    "pid,uniq,prefix,value,suffix",
+    [
+        ("ark:/99999/fk-4-abc", "ark:99999", "99999", "fk4abc", "fk4abc"),
+        ("ark:/12345/fk-4-abc", "ark:12345", "12345", "fk-4-abc", "fk-4-abc"),
+        ("doi:10.5061/DRYAD.ABC", "doi:10.5061/dryad", "10.5061", "DRYAD.ABC", ".ABC"),
+        ("doi:10.9999/Foo", "doi:", "", "Foo", None),
+        # URNs are split like other identifiers unless the urn splitter is enabled
+        ("urn:nbn:nl:ui:12-85062", "urn:", "", None, None),
+        ("foo:abc/def", "foo:", "", "DEF", None),
+    ],
+)
+def test_parse_splitters(pid, uniq, prefix, value, suffix):
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        parts, definition = catalog.parse(pid)
+    assert definition.uniq == uniq
+    assert parts.prefix == prefix
+    assert parts.value == value
+    if suffix is not None:
+        assert parts.suffix == suffix
+
+
+@pytest.fixture()
+def urn_splitter():
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": "urn"})
+    yield
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": rslv.lib_rslv.splitters.DEFAULT_SPLITTER})
+
+
+@pytest.mark.parametrize(
+    "pid,uniq,prefix,value,suffix",
+    [
+        ("urn:NBN:nl:ui:12-85062", "urn:nbn/nl:ui", "nbn", "nl:ui:12-85062", ":12-85062"),
+        ("urn:nbn:de:123", "urn:nbn", "nbn", "de:123", "de:123"),
+        ("urn:isbn:123", "urn:", "", "123", None),
+    ],
+)
+def test_parse_urn(urn_splitter, pid, uniq, prefix, value, suffix):
+    test_parse_splitters(pid, uniq, prefix, value, suffix)
+
+
+def test_urn_legacy_definition(urn_splitter):
+    test_engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(test_engine, "test")
+    # A definition stored by the default split
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": rslv.lib_rslv.splitters.DEFAULT_SPLITTER})
+    with rslv.lib_rslv.piddefine.get_catalog(test_engine) as catalog:
+        assert catalog.add(PidDefinition(scheme="urn", prefix="nbn:nl:ui")) == "urn:nbn:nl:ui"
+        _, definition = catalog.parse("urn:nbn:nl:ui/12-85062")
+        assert definition.uniq == "urn:nbn:nl:ui"
+    # Is keyed by NID and NSS with the urn splitter
+    rslv.lib_rslv.splitters.set_scheme_splitters({"urn": "urn"})
+    assert rslv.lib_rslv.splitters.definition_key("urn", "NBN:nl:ui", "") == ("nbn", "nl:ui")
+    assert rslv.lib_rslv.splitters.definition_key("urn", "nbn:nl:ui", "x") == ("nbn", "nl:ui/x")
+    with test_engine.begin() as connection:
+        rslv.lib_rslv.migrations.definition_keys(connection)
+    with rslv.lib_rslv.piddefine.get_catalog(test_engine) as catalog:
+        parts, definition = catalog.parse("urn:nbn:nl:ui/12-85062")
+        assert definition.uniq == "urn:nbn/nl:ui"
+        assert parts.value == "nl:ui/12-85062"
+        assert catalog.add(PidDefinition(scheme="urn", prefix="ISBN")) == "urn:isbn"
+    test_engine.dispose()
+
+
+def test_unknown_splitter(caplog):
+    # Logged and parsed with the splitter for the scheme
+    rslv.lib_rslv.splitters._named_splitter.cache_clear()
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        for _ in range(2):
+            parts, definition = catalog.parse("bar:abc")
+            assert definition.uniq == "bar:"
+    assert [r.levelname for r in caplog.records if r.name == "rslv.splitters"] == ["ERROR"]
+    with pytest.raises(ValueError):
+        rslv.lib_rslv.splitters.get_splitter("missing")
+
+
+def test_add_splitter(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'pids.sqlite'}"
+    rslv.lib_rslv.piddefine.create_database(sqlalchemy.create_engine(db_url), "test")
+    runner = click.testing.CliRunner()
+    env = {"RSLV_DB_CONNECTION_STRING": db_url}
+    result = runner.invoke(rslv.__main__.main, ["add", "-s", "foo", "-S", "missing"], env=env)
+    assert result.exit_code == 2
+    assert "Unknown splitter" in result.output
+    result = runner.invoke(rslv.__main__.main, ["add", "-s", "foo", "-S", "ark"], env=env)
+    assert result.exit_code == 0, result.output
+
+
+def test_definition_key():
+    # DOI definitions are stored in lower case, as DOIs are matched
+    test_engine = sqlalchemy.create_engine("sqlite://")
+    rslv.lib_rslv.piddefine.create_database(test_engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(test_engine) as catalog:
+        assert catalog.add(PidDefinition(scheme="doi", prefix="10.5061", value="DRYAD")) == "doi:10.5061/dryad"
+        assert catalog.add(PidDefinition(scheme="ark", prefix="99999", value="FK4")) == "ark:99999/FK4"
+        _, definition = catalog.parse("doi:10.5061/Dryad.abc")
+        assert definition.uniq == "doi:10.5061/dryad"
+        assert catalog.get_by_uniq("doi:10.5061/DRYAD") is definition
+        assert catalog.get_prefix_stats("doi", "10.5061").definitions == 1
+
+
+def test_splitter_cached():
+    a = rslv.lib_rslv.splitters.get_splitter("tests.test_splitters.UpperSplitter")
+    b = rslv.lib_rslv.splitters.get_splitter("tests.test_splitters.UpperSplitter")
+    assert isinstance(a, UpperSplitter)
+    assert a is b
+    assert rslv.lib_rslv.splitters.get_splitter(None) is rslv.lib_rslv.splitters.get_splitter(
+        "default"
+    )
+
+
+def test_register_splitter():
+    try:
+        rslv.lib_rslv.splitters.register_splitter("upper", UpperSplitter(), schemes=["baz"])
+        assert isinstance(rslv.lib_rslv.splitters.scheme_splitter("baz"), UpperSplitter)
+    finally:
+        rslv.lib_rslv.splitters.SPLITTERS.pop("upper")
+        rslv.lib_rslv.splitters.SCHEME_SPLITTERS.pop("baz")
+        rslv.lib_rslv.splitters.get_splitter.cache_clear()
+        rslv.lib_rslv.splitters.scheme_splitter.cache_clear()
+    assert type(rslv.lib_rslv.splitters.scheme_splitter("baz")) is rslv.lib_rslv.splitters.Splitter
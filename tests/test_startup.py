@@ -0,0 +1,52 @@
+"""
+Checks that importing rslv entry points stays light.
+"""
+import subprocess
+import sys
+
+import pytest
+
+import scripts.importtime
+
+
+def imported_modules(statement, modules):
+    code = (
+        f"import sys; {statement}; "
+        f"print(','.join(m for m in {modules!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return [m for m in proc.stdout.strip().split(",") if m != ""]
+
+
+@pytest.mark.parametrize(
+    "statement,not_expected",
+    (
+        ("import rslv", ["importlib.metadata", "pydantic_settings", "sqlalchemy"]),
+        ("import rslv.__main__", ["fastapi", "sqlalchemy", "sqlalchemy.orm", "jinja2", "pydantic_settings"]),
+        ("import rslv.app", ["jinja2", "fastapi.templating", "fastapi.staticfiles"]),
+    ),
+)
+def test_deferred_imports(statement, not_expected):
+    assert imported_modules(statement, not_expected) == []
+
+
+def test_app_created_on_access():
+    code = "import rslv.app; print('app' in vars(rslv.app))"
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert proc.stdout.strip() == "False"
+
+
+def test_parse_importtime():
+    text = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       200 |        500 | rslv
+"""
+    entries = scripts.importtime.parse_importtime(text)
+    assert entries[0] == {"self_us": 100, "cumulative_us": 100, "module": "_io", "depth": 1}
+    summary = scripts.importtime.summarize("rslv", entries)
+    assert summary["total_ms"] == 0.5
+    assert summary["slowest"][0]["module"] == "rslv"
@@ -0,0 +1,111 @@
+"""
+Tests for warming worker caches from traffic history.
+"""
+import json
+
+import click.testing
+import pytest
+import sqlalchemy
+
+import rslv.__main__
+import rslv.lib_rslv.lookupfilter
+import rslv.lib_rslv.negotiate
+import rslv.lib_rslv.piddefine
+import rslv.warmup
+
+PidDefinition = rslv.lib_rslv.piddefine.PidDefinition
+
+
+def log_line(path, status=302):
+    return json.dumps({
+        "t": "2024-01-01T00:00:00.000Z",
+        "level": "INFO",
+        "name": "rslv",
+        "msg": f"GET {path}",
+        "req": [{"url": path, "query": "", "method": "GET", "headers": {}}],
+        "res": {"status_code": status},
+    }) + "\n"
+
+
+def test_read_identifiers():
+    text = ["# most requested\n", "ark:99999/a\n", "\n", "doi:10.1234/x\n", "ark:99999/a\n"]
+    assert rslv.warmup.read_identifiers(text) == ["ark:99999/a", "doi:10.1234/x"]
+    assert rslv.warmup.read_identifiers(text, limit=1) == ["ark:99999/a"]
+    log = [log_line("/ark:99999/a"), log_line("/doi:10.1234/x"), log_line("/.info/ark:99999")]
+    log += [log_line("/doi:10.1234/x")]
+    assert rslv.warmup.read_identifiers(log) == ["doi:10.1234/x", "ark:99999/a"]
+    # The log may start with lines that are not requests
+    log.insert(0, json.dumps({"level": "INFO", "name": "rslv", "msg": "started"}) + "\n")
+    assert rslv.warmup.read_identifiers(log) == ["doi:10.1234/x", "ark:99999/a"]
+    # Lines past the limit are not read
+    lines = iter(text)
+    assert rslv.warmup.read_identifiers(lines, limit=1) == ["ark:99999/a"]
+    assert next(lines) == "\n"
+    top = {
+        "requests": 10,
+        "definitions": [{"uniq": "ark:99999/x", "scheme": "ark", "prefix": "99999", "value": "x"}],
+        "prefixes": [{"scheme": "doi", "prefix": "10.1234"}],
+    }
+    lines = json.dumps(top, indent=2).splitlines(keepends=True)
+    assert rslv.warmup.read_identifiers(lines) == ["ark:99999/x", "doi:10.1234"]
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'pids.sqlite'}")
+    rslv.lib_rslv.piddefine.create_database(engine, "test")
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as cfg:
+        cfg.add(PidDefinition(scheme="ark", target="https://n2t.example.org/${pid}"))
+        cfg.add(PidDefinition(scheme="doi", prefix="10.1234", target="https://example.org/${value}"))
+    yield engine
+    engine.dispose()
+
+
+def test_warm(engine):
+    lookup_filter = rslv.lib_rslv.lookupfilter.LookupFilter()
+    lookup_filter.refresh(engine)
+    warmup = rslv.warmup.Warmup(["ark:99999/a", "doi:10.1234/x", "doi:10.9999/y"])
+    assert not warmup.ready
+    warmup.start(engine, lookup_filter=lookup_filter)
+    assert warmup.join(10)
+    assert warmup.stats()["state"] == rslv.warmup.DONE
+    assert warmup.matched == 2
+    with rslv.lib_rslv.piddefine.get_catalog(engine) as catalog:
+        definition = catalog.get("doi", "10.1234")
+        assert rslv.lib_rslv.negotiate.DISPATCH_CACHE.get(
+            definition.uniq, (definition.target, definition.http_code, definition.targets)
+        ) is not None
+    assert lookup_filter.rejects(rslv.lib_rslv.split_identifier_string("doi:10.9999/z"))
+
+
+def test_warm_failure():
+    engine = sqlalchemy.create_engine("sqlite:///file:missing?mode=ro&uri=true")
+    warmup = rslv.warmup.Warmup(["ark:99999/a"])
+    warmup.warm(engine)
+    # Readiness is not held back by a failed warm-up
+    assert warmup.ready
+    assert warmup.state == rslv.warmup.FAILED
+
+
+def test_app_warmup(engine, tmp_path, app_client):
+    warmup_file = tmp_path / "hot.txt"
+    warmup_file.write_text("ark:99999/a\ndoi:10.1234/x\n")
+    client = app_client(db_url=str(engine.url), warmup_file=str(warmup_file))
+    warmup = client.app.state.warmup
+    assert warmup.join(10)
+    response = client.get("/.ready")
+    assert response.status_code == 200
+    assert client.get("/.metrics").json()["warmup"]["matched"] == 2
+    warmup.done.clear()
+    response = client.get("/.ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+
+def test_hot_command(tmp_path):
+    log_file = tmp_path / "access.log"
+    log_file.write_text(log_line("/ark:99999/a") + log_line("/doi:10.1234/x") * 2)
+    runner = click.testing.CliRunner()
+    result = runner.invoke(rslv.__main__.main, ["hot", str(log_file), "-n", "1"])
+    assert result.exit_code == 0
+    assert result.output == "doi:10.1234/x\n"